@@ -0,0 +1,126 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from absl import app, flags, logging
+
+REPO_DIR = os.path.dirname ( os.path.dirname ( os.path.abspath ( __file__ ) ) )
+sys.path.insert ( 0, REPO_DIR )
+
+from synthetic_trace import generate_trace
+from helper.extraction import create_statistics_from_file
+from helper.general import import_from_NAV
+from helper.instrumentation import phase, take_report_phases, log_report_summary
+
+flags.DEFINE_string ( 'scales', '10000,100000', "Comma separated kernel row counts to benchmark", short_name='s' )
+flags.DEFINE_integer ( 'kernels', 50, "Number of distinct kernels in each synthetic trace", short_name='k' )
+flags.DEFINE_float ( 'skew', 1.1, "Zipf exponent of the kernel and NVTX range popularity" )
+flags.DEFINE_integer ( 'domains', 2, "Number of named NVTX domains", short_name='d' )
+flags.DEFINE_enum ( 'output_sink', 'null', ['filesystem', 'zip', 'tar', 'null'],
+                    "Output sink used for tables and figures (null times compute without output I/O)", short_name='os' )
+flags.DEFINE_boolean ( 'no_individual_metrics_output', False,
+                       "skip individual kernel/transfer/communication tables and figures", short_name='nimo' )
+flags.DEFINE_boolean ( 'no_metrics_output', False, "only benchmark extraction", short_name='nmo' )
+flags.DEFINE_string ( 'results_file', 'benchmark_results.json', "JSON file the results are written to", short_name='rf' )
+flags.DEFINE_string ( 'work_dir', None, "Directory for synthetic traces and outputs (default: temporary directory)",
+                      short_name='wd' )
+
+FLAGS = flags.FLAGS
+
+
+def git_revision():
+    try:
+        commit = subprocess.run ( ['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                                  check=True ).stdout.strip ()
+        dirty = bool ( subprocess.run ( ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                        capture_output=True, text=True, check=True ).stdout.strip () )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+    return commit, dirty
+
+
+def benchmark_scale(num_rows):
+    # Extraction writes the NAV file relative to the working directory, like main.py
+    database_file = f'synthetic_{num_rows}.sqlite'
+    output_dir = f'./output_{num_rows}/'
+    os.makedirs ( output_dir, exist_ok=True )
+
+    generation_start = time.perf_counter ()
+    generate_trace ( database_file, num_rows, FLAGS.kernels, FLAGS.skew, FLAGS.domains )
+    generation_time = time.perf_counter () - generation_start
+
+    extraction_flags = types.SimpleNamespace ( no_kernel_metrics=False, no_transfer_metrics=False,
+                                               no_communication_metrics=False, no_save_data=False )
+    start_time = time.perf_counter ()
+    create_statistics_from_file ( database_file, output_dir, extraction_flags )
+
+    with phase ( 'NAV Load' ):
+        data = import_from_NAV ( output_dir + database_file.split ( '.' )[0] + '_parsed_stats.nav' )
+
+    if not FLAGS.no_metrics_output:
+        from helper.export_statistics import generation_tables_and_figures
+
+        with phase ( 'Tables and Figures' ):
+            generation_tables_and_figures ( data, True, False, False, FLAGS.no_individual_metrics_output, 1, output_dir,
+                                            force_regenerate=True, output_sink=FLAGS.output_sink )
+    total_time = time.perf_counter () - start_time
+
+    phases = take_report_phases ()
+    log_report_summary ( phases )
+    logging.info ( f"{num_rows} rows: {total_time:.2f}s (trace generation {generation_time:.2f}s, "
+                   f"{os.path.getsize ( database_file ) / 2 ** 20:.1f} MB)" )
+
+    return {
+        'Rows': num_rows,
+        'Database Size (MB)': round ( os.path.getsize ( database_file ) / 2 ** 20, 2 ),
+        'Trace Generation Time (s)': round ( generation_time, 3 ),
+        'Total Wall Time (s)': round ( total_time, 3 ),
+        'Phases': phases
+    }
+
+
+def main(argv):
+    logging.set_verbosity ( logging.INFO )
+    results_file = os.path.abspath ( FLAGS.results_file )
+    work_dir = FLAGS.work_dir or tempfile.mkdtemp ( prefix='nav_benchmark_' )
+    os.makedirs ( work_dir, exist_ok=True )
+    current_dir = os.getcwd ()
+    os.chdir ( work_dir )
+
+    commit, dirty = git_revision ()
+    results = {
+        'Commit': commit,
+        'Dirty': dirty,
+        'Timestamp': time.strftime ( '%Y-%m-%dT%H:%M:%S' ),
+        'Python': platform.python_version (),
+        'Platform': platform.platform (),
+        'CPU Count': os.cpu_count (),
+        'Settings': {'Kernels': FLAGS.kernels, 'Skew': FLAGS.skew, 'Domains': FLAGS.domains,
+                     'Output Sink': FLAGS.output_sink, 'Individual Output': not FLAGS.no_individual_metrics_output,
+                     'Tables and Figures': not FLAGS.no_metrics_output},
+        'Scales': []
+    }
+
+    try:
+        for num_rows in [int ( scale ) for scale in FLAGS.scales.split ( ',' )]:
+            logging.info ( f"Benchmarking {num_rows} kernel rows" )
+            results['Scales'].append ( benchmark_scale ( num_rows ) )
+    finally:
+        os.chdir ( current_dir )
+        if FLAGS.work_dir is None:
+            shutil.rmtree ( work_dir, ignore_errors=True )
+
+    with open ( results_file, 'w' ) as file:
+        json.dump ( results, file, indent=4 )
+    logging.info ( f"Saved benchmark results to {results_file}" )
+
+
+if __name__ == "__main__":
+    app.run ( main )
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from absl import app, flags, logging
+
+REPO_DIR = os.path.dirname ( os.path.dirname ( os.path.abspath ( __file__ ) ) )
+sys.path.insert ( 0, REPO_DIR )
+
+from synthetic_trace import generate_trace
+from helper.extraction import extract_statistics, save_statistics
+from helper.service import answer_request
+
+flags.DEFINE_integer ( 'rows', 10000, "Kernel rows of the synthetic trace", short_name='n' )
+flags.DEFINE_string ( 'group_by', 'device', "Breakdown dimension of the grouped NAV file", short_name='gb' )
+
+FLAGS = flags.FLAGS
+
+# Item endpoints answered with and without a breakdown group
+ITEM_QUERIES = ['/items?category=Kernel&limit=5', '/item?category=Kernel&item={item}',
+                '/distribution?category=Kernel&item={item}&metric=Execution Duration']
+
+
+def query(root, target):
+    try:
+        answer_request ( root, target.replace ( ' ', '%20' ) )
+    except (ValueError, LookupError) as e:
+        return f"{target}: {type ( e ).__name__} {e}"
+    return None
+
+
+def check_nav_file(root, name):
+    """Answers the item endpoints of one NAV file ungrouped and, if it has a breakdown, for each of its groups."""
+    summary = json.loads ( answer_request ( root, f'/summary?file={name}' )[1] )
+    items = json.loads ( answer_request ( root, f'/items?file={name}&category=Kernel&limit=1' )[1] )['Items']
+    item = items[0]['Key']
+
+    failures = [query ( root, f'{target.format ( item=item )}&file={name}' ) for target in ITEM_QUERIES]
+    failures.append ( query ( root, f'/distribution?file={name}&category=Kernel&item={item}'
+                                    f'&metric=Execution Duration&bins=8' ) )
+
+    for group in summary['Kernel'].get ( 'Breakdown', {} ).get ( 'Groups', [] ):
+        grouped_item = json.loads ( answer_request ( root, f'/items?file={name}&category=Kernel&limit=1'
+                                                           f'&group={group}' )[1] )['Items'][0]['Key']
+        failures.extend ( query ( root, f'{target.format ( item=grouped_item )}&file={name}&group={group}' )
+                          for target in ITEM_QUERIES )
+        # Groups have no raw data to bin, this combination must be rejected as a bad request
+        if query ( root, f'/distribution?file={name}&category=Kernel&item={grouped_item}'
+                         f'&metric=Execution Duration&bins=8&group={group}' ) is None:
+            failures.append ( f"bins with group {group} was not rejected" )
+
+    return [failure for failure in failures if failure]
+
+
+def main(argv):
+    logging.set_verbosity ( logging.INFO )
+    work_dir = tempfile.mkdtemp ( prefix='nav_service_' )
+
+    try:
+        database_file = os.path.join ( work_dir, 'synthetic.sqlite' )
+        generate_trace ( database_file, FLAGS.rows )
+        for name, group_by in [('ungrouped', None), ('grouped', FLAGS.group_by)]:
+            os.makedirs ( os.path.join ( work_dir, name ) )
+            save_statistics ( extract_statistics ( database_file, ['Kernel'], group_by=group_by ), database_file,
+                              os.path.join ( work_dir, name, '' ) )
+
+        failures = []
+        for name in ['ungrouped', 'grouped']:
+            failures.extend ( check_nav_file ( work_dir, f'{name}/synthetic_parsed_stats.nav' ) )
+    finally:
+        shutil.rmtree ( work_dir, ignore_errors=True )
+
+    for failure in failures:
+        logging.error ( failure )
+    if failures:
+        sys.exit ( 1 )
+    logging.info ( "Ungrouped and grouped service queries answered" )
+
+
+if __name__ == "__main__":
+    app.run ( main )
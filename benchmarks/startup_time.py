@@ -0,0 +1,104 @@
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from absl import app, flags, logging
+
+from synthetic_trace import generate_trace
+
+REPO_DIR = os.path.dirname ( os.path.dirname ( os.path.abspath ( __file__ ) ) )
+HEAVY_MODULES = ['matplotlib', 'sklearn']
+
+# Mirrors what an extraction-only (-nmo) run imports before it starts querying the database
+STARTUP_SCRIPT = f"""
+import sys
+import main
+print(','.join(module for module in {HEAVY_MODULES!r} if module in sys.modules))
+"""
+
+# A complete extraction-only run, the heavy modules are listed once it has finished
+EXTRACTION_SCRIPT = f"""
+import atexit
+import sys
+atexit.register ( lambda: print(','.join(module for module in {HEAVY_MODULES!r} if module in sys.modules)) )
+sys.path.insert ( 0, {REPO_DIR!r} )
+import main
+from absl import app
+app.run ( main.main, argv=['main.py'] + sys.argv[1:] )
+"""
+
+flags.DEFINE_integer ( 'repeats', 10, "Number of interpreter startups to time", short_name='r' )
+flags.DEFINE_float ( 'target', 0.75, "Maximum median startup time in seconds", short_name='t' )
+flags.DEFINE_integer ( 'rows', 10000, "Kernel rows of the synthetic trace extracted with -nmo", short_name='n' )
+
+FLAGS = flags.FLAGS
+
+
+def time_startup():
+    start_time = time.perf_counter ()
+    result = subprocess.run ( [sys.executable, '-c', STARTUP_SCRIPT], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True )
+    elapsed = time.perf_counter () - start_time
+
+    loaded = [module for module in result.stdout.strip ().split ( ',' ) if module]
+    return elapsed, loaded
+
+
+def run_extraction(work_dir):
+    database_file = os.path.join ( work_dir, 'synthetic.sqlite' )
+    generate_trace ( database_file, FLAGS.rows )
+    # Outputs are written relative to the working directory, like main.py
+    result = subprocess.run ( [sys.executable, '-c', EXTRACTION_SCRIPT, '-df', 'synthetic.sqlite', '-nmo'], cwd=work_dir,
+                              capture_output=True, text=True )
+    if result.returncode != 0:
+        raise RuntimeError ( f"Extraction-only run failed:\n{result.stderr[-2000:]}" )
+
+    # The last line is printed at exit, it is empty when no heavy module was imported
+    lines = result.stdout.splitlines ()
+    return [module for module in (lines[-1] if lines else '').split ( ',' ) if module]
+
+
+def main(argv):
+    logging.set_verbosity ( logging.INFO )
+
+    # Warm up the filesystem cache and bytecode so every timed startup sees the same state
+    time_startup ()
+
+    timings = []
+    loaded_modules = set ()
+    for _ in range ( FLAGS.repeats ):
+        elapsed, loaded = time_startup ()
+        timings.append ( elapsed )
+        loaded_modules.update ( loaded )
+
+    work_dir = tempfile.mkdtemp ( prefix='nav_startup_' )
+    try:
+        extraction_modules = run_extraction ( work_dir )
+    finally:
+        shutil.rmtree ( work_dir, ignore_errors=True )
+
+    median = statistics.median ( timings )
+    logging.info ( f"Extraction-only startup: median {median:.3f}s, min {min ( timings ):.3f}s, "
+                   f"max {max ( timings ):.3f}s over {FLAGS.repeats} runs (target {FLAGS.target:.3f}s)" )
+
+    failed = False
+    if loaded_modules:
+        logging.error ( f"Heavy modules imported at startup: {', '.join ( sorted ( loaded_modules ) )}" )
+        failed = True
+    if extraction_modules:
+        logging.error ( f"Heavy modules imported by a -nmo extraction: {', '.join ( sorted ( extraction_modules ) )}" )
+        failed = True
+    if median > FLAGS.target:
+        logging.error ( f"Startup time {median:.3f}s exceeds target {FLAGS.target:.3f}s" )
+        failed = True
+
+    if failed:
+        sys.exit ( 1 )
+
+
+if __name__ == "__main__":
+    app.run ( main )
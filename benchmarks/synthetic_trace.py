@@ -0,0 +1,150 @@
+import os
+import sqlite3
+
+import numpy as np
+from absl import app, flags, logging
+
+SCHEMA = """
+CREATE TABLE StringIds (id INTEGER PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE CUPTI_ACTIVITY_KIND_KERNEL (start INTEGER NOT NULL, end INTEGER NOT NULL, deviceId INTEGER NOT NULL,
+    contextId INTEGER NOT NULL, streamId INTEGER NOT NULL, correlationId INTEGER, globalPid INTEGER,
+    demangledName INTEGER NOT NULL, shortName INTEGER NOT NULL);
+CREATE TABLE CUPTI_ACTIVITY_KIND_RUNTIME (start INTEGER NOT NULL, end INTEGER NOT NULL, eventClass INTEGER NOT NULL,
+    globalTid INTEGER, correlationId INTEGER, nameId INTEGER NOT NULL);
+CREATE TABLE CUPTI_ACTIVITY_KIND_MEMCPY (start INTEGER NOT NULL, end INTEGER NOT NULL, deviceId INTEGER NOT NULL,
+    contextId INTEGER NOT NULL, streamId INTEGER NOT NULL, correlationId INTEGER, globalPid INTEGER,
+    bytes INTEGER NOT NULL, copyKind INTEGER NOT NULL);
+CREATE TABLE CUPTI_ACTIVITY_KIND_MEMSET (start INTEGER NOT NULL, end INTEGER NOT NULL, deviceId INTEGER NOT NULL,
+    contextId INTEGER NOT NULL, streamId INTEGER NOT NULL, correlationId INTEGER, globalPid INTEGER,
+    bytes INTEGER NOT NULL);
+CREATE TABLE NVTX_EVENTS (start INTEGER NOT NULL, end INTEGER, eventType INTEGER NOT NULL, rangeId INTEGER,
+    category INTEGER, color INTEGER, text TEXT, globalTid INTEGER, endGlobalTid INTEGER, textId INTEGER,
+    domainId INTEGER);
+CREATE TABLE ANALYSIS_DETAILS (globalVid INTEGER, duration INTEGER NOT NULL, startTime INTEGER NOT NULL,
+    stopTime INTEGER NOT NULL);
+"""
+
+# NVTX event types used by nsys: push/pop range and domain creation
+NVTX_PUSH_POP_RANGE = 59
+NVTX_DOMAIN_CREATE = 75
+COPY_KINDS = [1, 2, 8, 10]
+RUNTIME_LAUNCH_NAME = 'cudaLaunchKernel_v7000'
+RUNTIME_MEMCPY_NAME = 'cudaMemcpyAsync_v3020'
+GLOBAL_TID = 0x0000000100000001
+INSERT_BATCH_SIZE = 100000
+
+
+def zipf_choice(rng, num_items, size, skew):
+    # skew 0 is uniform, larger values concentrate rows on the first few items as in real traces
+    weights = 1.0 / np.arange ( 1, num_items + 1 ) ** skew
+    return rng.choice ( num_items, size=size, p=weights / weights.sum () )
+
+
+def insert_rows(conn, table, columns):
+    placeholders = ','.join ( '?' * len ( columns ) )
+    rows = list ( zip ( *[column.tolist () if isinstance ( column, np.ndarray ) else column for column in columns] ) )
+    for start in range ( 0, len ( rows ), INSERT_BATCH_SIZE ):
+        conn.executemany ( f"INSERT INTO {table} VALUES ({placeholders})", rows[start:start + INSERT_BATCH_SIZE] )
+
+
+def generate_trace(database_file, num_rows=100000, num_kernels=50, skew=1.1, num_domains=2, num_ranges=20,
+                   seed=0):
+    """Writes a synthetic nsys export with num_rows kernel launches and proportional transfer and NVTX rows."""
+    rng = np.random.default_rng ( seed )
+    num_transfers = max ( 1, num_rows // 4 )
+    num_memsets = max ( 1, num_rows // 16 )
+    num_nvtx = max ( 1, num_rows // 5 )
+
+    if os.path.exists ( database_file ):
+        os.remove ( database_file )
+    conn = sqlite3.connect ( database_file )
+    conn.executescript ( SCHEMA )
+
+    # String table: short and demangled kernel names, runtime API names and NVTX range names
+    strings = [(i + 1, f'kernel_{i}') for i in range ( num_kernels )]
+    strings += [(num_kernels + i + 1, f'void kernel_{i}<float>(float *, int)') for i in range ( num_kernels )]
+    launch_name_id = 2 * num_kernels + 1
+    memcpy_name_id = 2 * num_kernels + 2
+    range_base_id = 2 * num_kernels + 3
+    strings += [(launch_name_id, RUNTIME_LAUNCH_NAME), (memcpy_name_id, RUNTIME_MEMCPY_NAME)]
+    strings += [(range_base_id + i, ('MPI_' if i % 2 == 0 else 'range_') + str ( i )) for i in range ( num_ranges )]
+    conn.executemany ( "INSERT INTO StringIds VALUES (?, ?)", strings )
+
+    # Kernels: skewed kernel popularity, per-kernel log-normal durations and a runtime launch per kernel
+    kernel_index = zipf_choice ( rng, num_kernels, num_rows, skew )
+    kernel_scale = rng.uniform ( 1.0, 8.0, size=num_kernels )
+    durations = rng.lognormal ( kernel_scale[kernel_index], 0.5 ).astype ( np.int64 ) + 1
+    launch_overheads = rng.integers ( 2, 20, size=num_rows )
+    slacks = rng.integers ( 1, 30, size=num_rows )
+    launch_periods = launch_overheads + slacks + durations
+    launch_starts = np.cumsum ( launch_periods ) - launch_periods
+    launch_ends = launch_starts + launch_overheads
+    kernel_starts = launch_ends + slacks
+    correlation_ids = np.arange ( 1, num_rows + 1 )
+    streams = rng.integers ( 7, 11, size=num_rows )
+
+    insert_rows ( conn, 'CUPTI_ACTIVITY_KIND_RUNTIME',
+                  [launch_starts, launch_ends, np.zeros ( num_rows, dtype=np.int64 ), [GLOBAL_TID] * num_rows,
+                   correlation_ids, [launch_name_id] * num_rows] )
+    insert_rows ( conn, 'CUPTI_ACTIVITY_KIND_KERNEL',
+                  [kernel_starts, kernel_starts + durations, streams % 2, [1] * num_rows, streams, correlation_ids,
+                   [1] * num_rows, kernel_index + num_kernels + 1, kernel_index + 1] )
+    end_time = int ( kernel_starts[-1] + durations[-1] )
+
+    # Transfers: power of two sizes with a bandwidth that grows with size
+    sizes = 2 ** rng.integers ( 4, 28, size=num_transfers )
+    transfer_starts = np.sort ( rng.integers ( 0, end_time, size=num_transfers ) )
+    transfer_durations = sizes // rng.integers ( 1000, 20000, size=num_transfers ) + rng.integers ( 1, 10, size=num_transfers )
+    transfer_correlations = np.arange ( num_rows + 1, num_rows + num_transfers + 1 )
+    insert_rows ( conn, 'CUPTI_ACTIVITY_KIND_MEMCPY',
+                  [transfer_starts, transfer_starts + transfer_durations, [0] * num_transfers, [1] * num_transfers,
+                   [7] * num_transfers, transfer_correlations, [1] * num_transfers, sizes,
+                   rng.choice ( COPY_KINDS, size=num_transfers )] )
+    insert_rows ( conn, 'CUPTI_ACTIVITY_KIND_RUNTIME',
+                  [transfer_starts - 5, transfer_starts - 1, np.zeros ( num_transfers, dtype=np.int64 ),
+                   [GLOBAL_TID] * num_transfers, transfer_correlations, [memcpy_name_id] * num_transfers] )
+
+    memset_starts = np.sort ( rng.integers ( 0, end_time, size=num_memsets ) )
+    insert_rows ( conn, 'CUPTI_ACTIVITY_KIND_MEMSET',
+                  [memset_starts, memset_starts + rng.integers ( 2, 50, size=num_memsets ), [0] * num_memsets,
+                   [1] * num_memsets, [7] * num_memsets, [None] * num_memsets, [1] * num_memsets,
+                   2 ** rng.integers ( 8, 20, size=num_memsets )] )
+
+    # NVTX: one creation event per named domain, ranges spread over the default and named domains
+    domain_rows = [(0, None, NVTX_DOMAIN_CREATE, None, None, None, f'domain_{i}', GLOBAL_TID, None, None, i)
+                   for i in range ( 1, num_domains + 1 )]
+    conn.executemany ( "INSERT INTO NVTX_EVENTS VALUES (?,?,?,?,?,?,?,?,?,?,?)", domain_rows )
+    nvtx_starts = np.sort ( rng.integers ( 0, end_time, size=num_nvtx ) )
+    range_index = zipf_choice ( rng, num_ranges, num_nvtx, skew )
+    insert_rows ( conn, 'NVTX_EVENTS',
+                  [nvtx_starts, nvtx_starts + rng.integers ( 10, 2000, size=num_nvtx ), [NVTX_PUSH_POP_RANGE] * num_nvtx,
+                   [None] * num_nvtx, [None] * num_nvtx, [None] * num_nvtx, [None] * num_nvtx, [GLOBAL_TID] * num_nvtx,
+                   [None] * num_nvtx, range_index + range_base_id, rng.integers ( 0, num_domains + 1, size=num_nvtx )] )
+
+    conn.execute ( "INSERT INTO ANALYSIS_DETAILS VALUES (?, ?, ?, ?)", (1, end_time, 0, end_time) )
+    conn.commit ()
+    conn.close ()
+
+    return database_file
+
+
+def main(argv):
+    FLAGS = flags.FLAGS
+    logging.set_verbosity ( logging.INFO )
+
+    generate_trace ( FLAGS.output_file, FLAGS.rows, FLAGS.kernels, FLAGS.skew, FLAGS.domains, FLAGS.ranges, FLAGS.seed )
+    logging.info ( f"Wrote synthetic trace with {FLAGS.rows} kernels to {FLAGS.output_file} "
+                   f"({os.path.getsize ( FLAGS.output_file ) / 2 ** 20:.1f} MB)" )
+
+
+if __name__ == "__main__":
+    flags.DEFINE_string ( 'output_file', 'synthetic.sqlite', "Path of the generated sqlite file", short_name='o' )
+    flags.DEFINE_integer ( 'rows', 100000, "Number of kernel launches (transfers and NVTX ranges scale with it)",
+                           short_name='r' )
+    flags.DEFINE_integer ( 'kernels', 50, "Number of distinct kernels", short_name='k' )
+    flags.DEFINE_float ( 'skew', 1.1, "Zipf exponent of the kernel and NVTX range popularity (0 is uniform)",
+                         short_name='s' )
+    flags.DEFINE_integer ( 'domains', 2, "Number of named NVTX domains", short_name='d' )
+    flags.DEFINE_integer ( 'ranges', 20, "Number of distinct NVTX range names", short_name='nr' )
+    flags.DEFINE_integer ( 'seed', 0, "Random seed" )
+    app.run ( main )
@@ -0,0 +1,138 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+from absl import app, flags, logging
+
+REPO_DIR = os.path.dirname ( os.path.dirname ( os.path.abspath ( __file__ ) ) )
+sys.path.insert ( 0, REPO_DIR )
+
+from synthetic_trace import SCHEMA, insert_rows
+from helper.timeline import TIMELINE_KINDS, TIMELINE_SOURCES, create_timeline_statistics
+
+flags.DEFINE_integer ( 'cases', 300, "Number of random device timelines checked", short_name='c' )
+flags.DEFINE_integer ( 'intervals', 30, "Maximum number of intervals of each timeline", short_name='n' )
+flags.DEFINE_integer ( 'seed', 0, "Random seed" )
+
+FLAGS = flags.FLAGS
+
+CHECKED_FIELDS = ['Start', 'End', 'Active Span', 'Busy Time', 'Idle Time', 'Compute Time', 'Copy Time', 'Overlap Time',
+                  'Kernels', 'Copies', 'Idle Gaps', 'Longest Idle Gap', 'Compute Concurrency', 'Copy Concurrency']
+
+
+def random_intervals(rng):
+    """(table, start, end) rows on a short time axis, so that intervals touch, nest and have zero length."""
+    tables = list ( TIMELINE_SOURCES )
+    num_intervals = rng.integers ( 1, FLAGS.intervals + 1 )
+    starts = rng.integers ( 0, 100, size=num_intervals )
+    lengths = np.where ( rng.random ( num_intervals ) < 0.2, 0, rng.integers ( 1, 30, size=num_intervals ) )
+
+    return [(tables[rng.integers ( len ( tables ) )], int ( start ), int ( start + length ))
+            for start, length in zip ( starts, lengths )]
+
+
+def write_trace(database_file, intervals):
+    conn = sqlite3.connect ( database_file )
+    conn.executescript ( SCHEMA )
+    for table in TIMELINE_SOURCES:
+        rows = [(start, end) for source, start, end in intervals if source == table]
+        num_rows = len ( rows )
+        if not num_rows:
+            continue
+        columns = [[start for start, _ in rows], [end for _, end in rows], [0] * num_rows, [1] * num_rows,
+                   [7] * num_rows, [None] * num_rows, [1] * num_rows]
+        if table == 'CUPTI_ACTIVITY_KIND_KERNEL':
+            columns += [[1] * num_rows, [1] * num_rows]
+        elif table == 'CUPTI_ACTIVITY_KIND_MEMCPY':
+            columns += [[1024] * num_rows, [1] * num_rows]
+        else:
+            columns += [[1024] * num_rows]
+        insert_rows ( conn, table, columns )
+    conn.commit ()
+    conn.close ()
+
+
+def brute_force(intervals):
+    """Device statistics from every elementary segment between interval ends, zero length intervals take no time."""
+    kinds = [(TIMELINE_KINDS.index ( TIMELINE_SOURCES[table] ), start, end) for table, start, end in intervals
+             if end > start]
+    if not kinds:
+        return None
+
+    times = sorted ( {time for _, start, end in kinds for time in (start, end)} )
+    totals = {'Idle': 0, 'Compute': 0, 'Copy': 0, 'Overlap': 0}
+    concurrency = {0: {}, 1: {}}
+    gaps = []
+    for segment_start, segment_end in zip ( times, times[1:] ):
+        duration = segment_end - segment_start
+        levels = [sum ( 1 for kind, start, end in kinds if kind == wanted and start <= segment_start and end >= segment_end )
+                  for wanted in (0, 1)]
+        for wanted in (0, 1):
+            concurrency[wanted][levels[wanted]] = concurrency[wanted].get ( levels[wanted], 0 ) + duration
+        if levels[0] and levels[1]:
+            totals['Overlap'] += duration
+        elif levels[0]:
+            totals['Compute'] += duration
+        elif levels[1]:
+            totals['Copy'] += duration
+        else:
+            totals['Idle'] += duration
+            gaps.append ( duration )
+
+    def histogram(levels):
+        time = [levels.get ( level, 0 ) for level in range ( max ( levels ) + 1 )]
+        return {'Levels': list ( range ( len ( time ) ) ), 'Time': time}
+
+    return {
+        'Start': times[0], 'End': times[-1], 'Active Span': times[-1] - times[0],
+        'Busy Time': totals['Compute'] + totals['Copy'] + totals['Overlap'], 'Idle Time': totals['Idle'],
+        'Compute Time': totals['Compute'] + totals['Overlap'], 'Copy Time': totals['Copy'] + totals['Overlap'],
+        'Overlap Time': totals['Overlap'], 'Kernels': sum ( 1 for kind, _, _ in kinds if kind == 0 ),
+        'Copies': sum ( 1 for kind, _, _ in kinds if kind == 1 ), 'Idle Gaps': len ( gaps ),
+        'Longest Idle Gap': max ( gaps, default=0 ), 'Compute Concurrency': histogram ( concurrency[0] ),
+        'Copy Concurrency': histogram ( concurrency[1] )
+    }
+
+
+def main(argv):
+    # Extraction progress of every case is not of interest
+    logging.set_verbosity ( logging.WARNING )
+    rng = np.random.default_rng ( FLAGS.seed )
+    work_dir = tempfile.mkdtemp ( prefix='nav_timeline_' )
+
+    failures = []
+    try:
+        for case in range ( FLAGS.cases ):
+            intervals = random_intervals ( rng )
+            database_file = os.path.join ( work_dir, f'case_{case}.sqlite' )
+            write_trace ( database_file, intervals )
+
+            expected = brute_force ( intervals )
+            statistics = create_timeline_statistics ( database_file )
+            device = (statistics or {}).get ( 'Devices', {} ).get ( '0' )
+            if expected is None:
+                if device is not None:
+                    failures.append ( f"case {case}: timeline of zero length intervals only {device}" )
+                continue
+            if device is None:
+                failures.append ( f"case {case}: no timeline statistics for {intervals}" )
+                continue
+            for field in CHECKED_FIELDS:
+                if device[field] != expected[field]:
+                    failures.append ( f"case {case}: {field} {device[field]} != {expected[field]} for {intervals}" )
+    finally:
+        shutil.rmtree ( work_dir, ignore_errors=True )
+
+    logging.set_verbosity ( logging.INFO )
+    for failure in failures[:20]:
+        logging.error ( failure )
+    if failures:
+        sys.exit ( 1 )
+    logging.info ( f"Timeline statistics of {FLAGS.cases} random timelines match the brute force sweep" )
+
+
+if __name__ == "__main__":
+    app.run ( main )
@@ -0,0 +1,279 @@
+import csv
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+from absl import logging
+
+from helper.clustering import configure_clustering
+from helper.communication import create_specific_communication_stats, generate_communicaiton_stats
+from helper.execution import available_cpus, create_execution_context, shutdown_execution_context
+from helper.extraction import STATISTICS_SECTIONS, extract_database
+from helper.general import configure_query_limits, create_histogram, generate_statistics
+from helper.instrumentation import log_table, phase
+from helper.kernel import parallel_create_general_kernel_stats
+from helper.staging import configure_staging
+from helper.transfer import create_specific_transfer_stats, generate_transfer_stats
+from helper.watch import init_watch_worker
+
+DEFAULT_SAMPLE_SIZE = 4096
+KERNEL_METRICS = ['Execution Duration', 'Launch Overhead', 'Slack']
+# Transfer sizes and durations are sampled together so bandwidths can be derived from the merged sample
+TRANSFER_METRICS = ['Transfer Durations', 'Transfer Size']
+COMMUNICATION_METRICS = ['Execution Duration']
+CATEGORY_METRICS = {'Kernel': KERNEL_METRICS, 'Transfer': TRANSFER_METRICS, 'Communication': COMMUNICATION_METRICS}
+IMBALANCE_COLUMNS = ['Category', 'Name', 'Ranks', 'Minimum', 'Maximum', 'Mean', 'Spread', 'Imbalance (%)',
+                     'Minimum Rank', 'Maximum Rank']
+
+
+def rank_sort_key(file_name):
+    # rank10 sorts after rank9
+    return [int ( part ) if part.isdigit () else part for part in re.split ( r'(\d+)', file_name )]
+
+
+def create_sample(values, keys, sample_size):
+    """Keeps the sample_size values with the largest random keys, a uniform sample that merges exactly."""
+    if keys.size > sample_size:
+        selected = np.argpartition ( keys, -sample_size )[-sample_size:]
+        values, keys = values[..., selected], keys[selected]
+
+    return values, keys
+
+
+def create_moments(values):
+    mean = float ( values.mean () )
+    return {'Count': values.size, 'Mean': mean, 'M2': float ( np.square ( values - mean ).sum () ),
+            'Minimum': float ( values.min () ), 'Maximum': float ( values.max () )}
+
+
+def merge_moments(moments, other):
+    # Chan et al. pairwise update, numerically stable for nanosecond sums over many ranks
+    if moments is None:
+        return dict ( other )
+
+    count = moments['Count'] + other['Count']
+    delta = other['Mean'] - moments['Mean']
+    return {'Count': count, 'Mean': moments['Mean'] + delta * other['Count'] / count,
+            'M2': moments['M2'] + other['M2'] + delta ** 2 * moments['Count'] * other['Count'] / count,
+            'Minimum': min ( moments['Minimum'], other['Minimum'] ),
+            'Maximum': max ( moments['Maximum'], other['Maximum'] )}
+
+
+def summarize_item(category, item, sample_size, rng):
+    """Mergeable summary of one extracted item: totals, exact moments of each metric and a bounded sample."""
+    summary = {field: item.get ( field ) for field in ('Time Total', 'Instance', 'Memory Total') if field in item}
+    summary['Metrics'] = {}
+    summary['Samples'] = {}
+
+    if category == 'Transfer':
+        columns = [np.asarray ( item[metric]['Raw Data'], dtype=float ) for metric in TRANSFER_METRICS
+                   if item.get ( metric )]
+        if len ( columns ) == len ( TRANSFER_METRICS ) and columns[0].size:
+            values = np.vstack ( columns )
+            summary['Metrics'] = {metric: create_moments ( column ) for metric, column in zip ( TRANSFER_METRICS, columns )}
+            summary['Samples']['Transfer'] = create_sample ( values, rng.random ( values.shape[1] ), sample_size )
+        return summary
+
+    for metric in CATEGORY_METRICS[category]:
+        if item.get ( metric ) and item[metric].get ( 'Raw Data' ):
+            values = np.asarray ( item[metric]['Raw Data'], dtype=float )
+            summary['Metrics'][metric] = create_moments ( values )
+            summary['Samples'][metric] = create_sample ( values, rng.random ( values.size ), sample_size )
+
+    return summary
+
+
+def summarize_rank(rank, database_file, output_dir, options):
+    """Extracts one rank file in a worker process and returns its mergeable summary instead of its raw data."""
+    # Rank clusters are not part of the summary, the job clusters are fitted from the merged items
+    configure_clustering ( True )
+    configure_staging ( options['Stage Dir'], options['Stage Cache Size'] )
+    configure_query_limits ( options['Query Timeout'] )
+    execution = create_execution_context ( options['CPU Workers'], options['IO Workers'] )
+    try:
+        statistics = extract_database ( database_file, output_dir, options, execution )
+    finally:
+        shutdown_execution_context ( execution )
+
+    # Seeded by rank, so aggregating the same files again gives the same job statistics
+    rng = np.random.default_rng ( rank )
+    summary = {'Total Duration': statistics.get ( 'Total Duration' )}
+    for category, (section, individual) in STATISTICS_SECTIONS.items ():
+        items = (statistics.get ( section ) or {}).get ( individual ) or {}
+        summary[category] = {str ( item.get ( 'Name', key ) ): summarize_item ( category, item, options['Sample Size'], rng )
+                             for key, item in items.items ()}
+
+    return rank, summary
+
+
+def merge_rank(job, rank, summary, sample_size):
+    """Folds one rank summary into the job accumulators, whose size does not grow with the number of ranks."""
+    if summary['Total Duration'] is not None:
+        job['Total Duration'] = max ( job['Total Duration'] or 0, summary['Total Duration'] )
+
+    for category in STATISTICS_SECTIONS:
+        for name, item in summary[category].items ():
+            merged = job['Items'][category].setdefault ( name, {'Metrics': {}, 'Samples': {}, 'Ranks': {
+                'Count': 0, 'Sum': 0, 'Minimum': None, 'Maximum': None}} )
+            for field in ('Time Total', 'Instance', 'Memory Total'):
+                if item.get ( field ) is not None:
+                    merged[field] = merged.get ( field, 0 ) + item[field]
+            for metric, moments in item['Metrics'].items ():
+                merged['Metrics'][metric] = merge_moments ( merged['Metrics'].get ( metric ), moments )
+            for metric, (values, keys) in item['Samples'].items ():
+                if metric in merged['Samples']:
+                    values = np.concatenate ( [merged['Samples'][metric][0], values], axis=-1 )
+                    keys = np.concatenate ( [merged['Samples'][metric][1], keys] )
+                merged['Samples'][metric] = create_sample ( values, keys, sample_size )
+
+            ranks = merged['Ranks']
+            time_total = item.get ( 'Time Total' ) or 0
+            ranks.update ( {'Count': ranks['Count'] + 1, 'Sum': ranks['Sum'] + time_total} )
+            if ranks['Minimum'] is None or time_total < ranks['Minimum'][0]:
+                ranks['Minimum'] = (time_total, rank)
+            if ranks['Maximum'] is None or time_total > ranks['Maximum'][0]:
+                ranks['Maximum'] = (time_total, rank)
+
+
+def apply_moments(statistics, moments):
+    # Mean, extremes and standard deviation are exact over all ranks, the median comes from the merged sample
+    variance = moments['M2'] / moments['Count']
+    statistics.update ( {'Mean': round ( moments['Mean'], 6 ), 'Minimum': round ( moments['Minimum'], 6 ),
+                         'Maximum': round ( moments['Maximum'], 6 ), 'Standard Deviation': round ( variance ** 0.5, 6 )} )
+
+
+def create_job_item(category, name, merged, total):
+    # Same fields and order as a single file extraction, with the time share of the whole job
+    item = {'Type' if category == 'Transfer' else 'Name': name,
+            'Time Percent': round ( merged.get ( 'Time Total', 0 ) * 100.0 / total, 1 ) if total else 0.0}
+    item.update ( {field: merged[field] for field in ('Time Total', 'Memory Total', 'Instance') if field in merged} )
+
+    if category == 'Transfer':
+        if 'Transfer' in merged['Samples']:
+            durations, sizes = merged['Samples']['Transfer'][0]
+            _, statistics = generate_transfer_stats ( (name, list ( zip ( [name] * durations.size, durations, sizes ) )) )
+            item.update ( statistics )
+        else:
+            item.update ( {metric: None for metric in TRANSFER_METRICS + ['Bandwidth Distribution']} )
+    elif category == 'Communication':
+        if 'Execution Duration' in merged['Samples']:
+            values = merged['Samples']['Execution Duration'][0]
+            item.update ( generate_communicaiton_stats ( (name, list ( zip ( [name] * values.size, values ) )) )[1] )
+        else:
+            item['Execution Duration'] = None
+    else:
+        for metric in KERNEL_METRICS:
+            if metric not in merged['Samples']:
+                item[metric] = None
+                continue
+            values = merged['Samples'][metric][0].tolist ()
+            item.update ( generate_statistics ( values, metric ) )
+            item[metric]['Distribution'] = create_histogram ( values, bins=10, powers_2=False, base=False,
+                                                              convert_bytes=False, return_bins=False )
+
+    for metric, moments in merged['Metrics'].items ():
+        if item.get ( metric ):
+            apply_moments ( item[metric], moments )
+
+    return item
+
+
+def create_job_statistics(job, execution=None):
+    statistics = {}
+
+    for category, (section, individual) in STATISTICS_SECTIONS.items ():
+        if not job['Items'][category]:
+            continue
+        total = sum ( merged.get ( 'Time Total', 0 ) for merged in job['Items'][category].values () )
+        items = OrderedDict ( sorted ( ((name, create_job_item ( category, name, merged, total ))
+                                        for name, merged in job['Items'][category].items ()),
+                                       key=lambda entry: entry[1].get ( 'Time Total', 0 ), reverse=True ) )
+
+        statistics[section] = {individual: items}
+        with phase ( 'General Statistics', category ):
+            if category == 'Kernel':
+                statistics[section].update ( parallel_create_general_kernel_stats ( items, execution ) )
+            elif category == 'Transfer':
+                statistics[section].update ( create_specific_transfer_stats ( items, execution=execution ) )
+            else:
+                statistics[section].update ( create_specific_communication_stats ( items, execution=execution ) )
+
+    if job['Total Duration'] is not None:
+        statistics['Total Duration'] = job['Total Duration']
+
+    return statistics
+
+
+def rank_imbalance(job):
+    """Spread of every item's total time across the ranks (ranks without the item count as zero)."""
+    num_ranks = len ( job['Ranks'] )
+    rows = []
+
+    for category in STATISTICS_SECTIONS:
+        for name, merged in job['Items'][category].items ():
+            ranks = merged['Ranks']
+            mean = ranks['Sum'] / num_ranks
+            minimum, minimum_rank = ranks['Minimum'] if ranks['Count'] == num_ranks else (0, None)
+            maximum, maximum_rank = ranks['Maximum']
+            rows.append ( {'Category': category, 'Name': name, 'Ranks': ranks['Count'], 'Minimum': minimum,
+                           'Maximum': maximum, 'Mean': round ( mean, 3 ), 'Spread': maximum - minimum,
+                           'Imbalance (%)': round ( (maximum / mean - 1) * 100, 2 ) if mean else 0.0,
+                           'Minimum Rank': minimum_rank, 'Maximum Rank': maximum_rank} )
+
+    # Items that cost the most time on their slowest rank first
+    return sorted ( rows, key=lambda row: -row['Maximum'] )
+
+
+def save_rank_imbalance(job, rows, output_dir, label):
+    report_file = os.path.join ( output_dir, f'{label}_rank_imbalance' )
+    with open ( report_file + '.json', 'w' ) as file:
+        json.dump ( {'Ranks': job['Ranks'], 'Items': rows}, file, indent=4 )
+    with open ( report_file + '.csv', 'w', newline='' ) as file:
+        writer = csv.DictWriter ( file, fieldnames=IMBALANCE_COLUMNS )
+        writer.writeheader ()
+        writer.writerows ( rows )
+    logging.info ( f"Saved rank imbalance to {report_file}.json and {report_file}.csv" )
+
+
+def aggregate_ranks(database_files, output_dir, label, options, jobs=1, execution=None):
+    """Extracts the per-rank sqlite files of one MPI job in jobs processes and merges them into job statistics.
+
+    Ranks are numbered in natural file name order. Each worker returns totals, exact moments and a uniform sample of at
+    most options['Sample Size'] values per metric, so memory is bounded by the number of kernels, transfers and NVTX
+    ranges rather than by the number of ranks. Returns the job statistics in the NAV layout and writes the per-rank
+    imbalance of every item next to them."""
+    database_files = sorted ( database_files, key=rank_sort_key )
+    job = {'Ranks': database_files, 'Total Duration': None, 'Items': {category: {} for category in STATISTICS_SECTIONS}}
+    sample_size = options['Sample Size']
+    start_time = time.perf_counter ()
+    if options['CPU Workers'] is None:
+        options = dict ( options, **{'CPU Workers': max ( 1, available_cpus () // jobs )} )
+
+    context = multiprocessing.get_context ( 'spawn' )
+    logging.info ( f"Aggregating {len ( database_files )} rank(s) with {jobs} extraction process(es)" )
+    with context.Pool ( processes=jobs, initializer=init_watch_worker, maxtasksperchild=1 ) as pool:
+        tasks = [(rank, database_file, output_dir, options) for rank, database_file in enumerate ( database_files )]
+        # Summaries are merged as they arrive, at most one per worker is held at a time
+        for completed, (rank, summary) in enumerate ( pool.imap_unordered ( summarize_rank_task, tasks ), 1 ):
+            merge_rank ( job, rank, summary, sample_size )
+            logging.info ( f"Merged rank {rank} ({database_files[rank]}), {completed}/{len ( database_files )} done" )
+
+    logging.info ( f"Extracted {len ( database_files )} rank(s) in {time.perf_counter () - start_time:.1f}s" )
+    statistics = create_job_statistics ( job, execution )
+    rows = rank_imbalance ( job )
+    save_rank_imbalance ( job, rows, output_dir, label )
+
+    if rows:
+        shown = [[str ( row[column] ) if row[column] is not None else '-' for column in IMBALANCE_COLUMNS]
+                 for row in rows[:10]]
+        log_table ( "Rank Imbalance (slowest ranks first)", IMBALANCE_COLUMNS, shown )
+
+    return statistics
+
+
+def summarize_rank_task(task):
+    return summarize_rank ( *task )
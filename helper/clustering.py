@@ -0,0 +1,66 @@
+import numpy as np
+
+from helper.execution import run_tasks
+
+MAX_CLUSTERS = 8
+MINI_BATCH_THRESHOLD = 10000
+
+_deferred = False
+
+
+def configure_clustering(defer_fits=False):
+    # Runs without tables and figures only keep the points, the first export fits them and stores the fits in the NAV file
+    global _deferred
+    _deferred = defer_fits
+
+
+def fit_single_k_mean(X, n_clusters):
+    # scikit-learn is only imported once a fit is needed, it dominates the import time of extraction-only runs
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if len ( X ) > MINI_BATCH_THRESHOLD:
+        kmeans = MiniBatchKMeans ( n_clusters=n_clusters, init='k-means++', max_iter=300, n_init=10, random_state=0,
+                                   batch_size=4096 )
+    else:
+        kmeans = KMeans ( n_clusters=n_clusters, init='k-means++', max_iter=300, n_init=10, random_state=0 )
+    labels = kmeans.fit_predict ( X )
+
+    return float ( kmeans.inertia_ ), labels.tolist ()
+
+
+def fit_k_means(cluster_data, max_clusters=MAX_CLUSTERS, execution=None):
+    X = np.array ( cluster_data, dtype=float )
+    cluster_range = range ( 1, min ( max_clusters, len ( X ) ) + 1 )
+
+    # Each k is fitted once; the inertias drive the elbow plot and the labels the cluster option plots
+    fits = run_tasks ( execution, 'CPU', lambda n_clusters: fit_single_k_mean ( X, n_clusters ), cluster_range )
+
+    return {
+        'Raw Data': cluster_data,
+        'WCSS': [wcss for wcss, _ in fits],
+        'Labels': [labels for _, labels in fits]
+    }
+
+
+def k_means_statistics(cluster_data, execution=None):
+    """k-means fits of the cluster points of a category, or only the points while fits are deferred."""
+    if _deferred:
+        return {'Raw Data': cluster_data}
+
+    return fit_k_means ( cluster_data, execution=execution )
+
+
+def fit_deferred_k_means(statistics, execution=None):
+    """Fits, in place, every k-means entry of statistics that only has its points and returns how many were fitted."""
+    fitted = 0
+    for key, value in statistics.items ():
+        if not isinstance ( value, dict ):
+            continue
+        if key == 'k-mean':
+            if value.get ( 'Raw Data' ) and ('WCSS' not in value or 'Labels' not in value):
+                value.update ( fit_k_means ( value['Raw Data'], execution=execution ) )
+                fitted += 1
+        else:
+            fitted += fit_deferred_k_means ( value, execution )
+
+    return fitted
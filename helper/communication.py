@@ -1,8 +1,8 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 
-from absl import logging
-
-from helper.general import generate_statistics, MAX_WORKERS, create_histogram, remove_outliers
+from helper.clustering import k_means_statistics
+from helper.execution import run_tasks
+from helper.general import generate_statistics, create_histogram, remove_outliers, group_query
 
 QUERY_COMMUNICATION = """
 WITH
@@ -87,7 +87,7 @@ WITH
     ORDER BY 2 DESC
 """
 
-QUERY_COMMUNICATION_STATS = """ 
+QUERY_COMMUNICATION_STATS_TEMPLATE = """ 
 WITH
     max_times AS (
         SELECT MAX(start) AS max_start, MAX(end) AS max_end
@@ -101,7 +101,7 @@ WITH
                 WHEN d.name IS NOT NULL AND sid.value IS NULL THEN d.name || ':' || ne.text
                 WHEN d.name IS NULL AND sid.value IS NOT NULL THEN sid.value
                 ELSE ne.text
-            END AS tag
+            END AS tag{dimension}
         FROM
             NVTX_EVENTS AS ne
         LEFT OUTER JOIN
@@ -130,13 +130,18 @@ WITH
     )
 SELECT
     tag AS "Name",
-    duration AS "Duration:dur_ns"
+    duration AS "Duration:dur_ns"{dimension_column}
 FROM
     nvtx
 WHERE
     name = ?
 """
 
+QUERY_COMMUNICATION_STATS = group_query(QUERY_COMMUNICATION_STATS_TEMPLATE)
+
+# NVTX ranges have no device, stream or context, they are broken down by the PID bits of their thread's global id
+COMMUNICATION_DIMENSION = ('Process', '(ne.globalTid >> 24) & 0xFFFFFF')
+
 COMM_REQUIRED_TABLES = ['NVTX_EVENTS', 'StringIds']
 
 
@@ -156,29 +161,11 @@ def generate_communicaiton_stats(comm):
     return label, dict[label]
 
 
-def parallel_parse_communication_data(queries_res):
-    total_tasks = len(queries_res)
-    completed_tasks = 0
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = []
-        for data in queries_res:
-            future = executor.submit(generate_communicaiton_stats, data)
-            futures.append(future)
-
-        results = []
-        for future in as_completed(futures):
-            results.append(future.result())
-            completed_tasks += 1
-
-            # Log progress every 10%
-            if int((completed_tasks / total_tasks) * 100 % 10) == 0:
-                logging.info(f"Progress: {(completed_tasks / total_tasks) * 100:.1f}%")
-
-    return results
+def parallel_parse_communication_data(queries_res, execution=None):
+    return run_tasks(execution, 'CPU', generate_communicaiton_stats, queries_res, log_progress=True)
 
 
-def create_specific_communication_stats(comm_stats, handle_outliers=False):
+def create_specific_communication_stats(comm_stats, handle_outliers=False, execution=None):
     dict = {}
     cluster_data = []
     combined_raw_data = []
@@ -186,7 +173,7 @@ def create_specific_communication_stats(comm_stats, handle_outliers=False):
     for kernel_id, kernel_info in comm_stats.items():
         if kernel_info["Execution Duration"]:
             if kernel_info["Execution Duration"]["Raw Data"]:
-                combined_raw_data.extend(kernel_info["Execution Duration"]["Raw Data"])
+                combined_raw_data.append(np.asarray(kernel_info["Execution Duration"]["Raw Data"], dtype=float))
             if kernel_info["Execution Duration"]['Mean'] and kernel_info["Execution Duration"]['Median'] and \
                     kernel_info[
                         "Instance"]:
@@ -196,9 +183,11 @@ def create_specific_communication_stats(comm_stats, handle_outliers=False):
 
     if handle_outliers and cluster_data: cluster_data = remove_outliers(cluster_data)
     if combined_raw_data:
+        combined_raw_data = np.concatenate(combined_raw_data)
         dict.update(generate_statistics(combined_raw_data, "Execution Duration", disable_raw=True))
+        dict["Execution Duration"]['Raw Data'] = combined_raw_data
         dict["Execution Duration"]['Distribution'] = create_histogram(combined_raw_data)
     if cluster_data:
-        dict["Execution Duration"]['k-mean'] = {'Raw Data': cluster_data}
+        dict["Execution Duration"]['k-mean'] = k_means_statistics(cluster_data, execution)
 
     return dict
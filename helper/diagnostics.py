@@ -0,0 +1,234 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+
+from absl import logging
+
+from helper.communication import QUERY_COMMUNICATION, QUERY_COMMUNICATION_STATS
+from helper.kernel import QUERY_KERNEL, QUERY_KERNEL_STATS
+from helper.transfer import QUERY_TRANSFERS, QUERY_TRANSFERS_STATS
+
+# (category, query name, query, runs once per kernel/transfer/communication name)
+DIAGNOSED_QUERIES = [
+    ('Kernel', 'QUERY_KERNEL', QUERY_KERNEL, False),
+    ('Kernel', 'QUERY_KERNEL_STATS', QUERY_KERNEL_STATS, True),
+    ('Transfer', 'QUERY_TRANSFERS', QUERY_TRANSFERS, False),
+    ('Transfer', 'QUERY_TRANSFERS_STATS', QUERY_TRANSFERS_STATS, True),
+    ('Communication', 'QUERY_COMMUNICATION', QUERY_COMMUNICATION, False),
+    ('Communication', 'QUERY_COMMUNICATION_STATS', QUERY_COMMUNICATION_STATS, True),
+]
+
+# Covering indexes for the lookups the queries above perform, kept only if the planner uses them
+CANDIDATE_INDEXES = {
+    'nav_kernel_short_name': ('CUPTI_ACTIVITY_KIND_KERNEL', ['shortName', 'start', 'end', 'correlationId']),
+    'nav_runtime_correlation': ('CUPTI_ACTIVITY_KIND_RUNTIME', ['correlationId', 'eventClass', 'start', 'end']),
+    'nav_memcpy_copy_kind': ('CUPTI_ACTIVITY_KIND_MEMCPY', ['copyKind', 'start', 'end', 'bytes']),
+    'nav_nvtx_event_type': ('NVTX_EVENTS', ['eventType', 'domainId', 'globalTid', 'textId', 'text', 'start', 'end']),
+    'nav_nvtx_text_id': ('NVTX_EVENTS', ['textId', 'eventType', 'start', 'end', 'domainId', 'globalTid', 'text']),
+}
+
+# Size and modification time of the trace a sidecar was built from, it is only reused for exactly that trace
+SIDECAR_SOURCE_TABLE = 'nav_sidecar_source'
+
+TABLE_REFERENCE = re.compile ( r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE )
+PLAN_TABLE = re.compile ( r'^(?:SCAN|SEARCH) (\w+)' )
+PLAN_INDEX = re.compile ( r'USING (?:COVERING )?INDEX (\w+)' )
+SQL_KEYWORDS = {'ON', 'WHERE', 'LEFT', 'JOIN', 'GROUP', 'ORDER', 'UNION', 'INNER', 'OUTER', 'CROSS', 'USING'}
+
+
+def table_aliases(query, tables):
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall ( query ):
+        if table in tables:
+            aliases[table] = table
+            if alias and alias.upper () not in SQL_KEYWORDS:
+                aliases[alias] = table
+
+    return aliases
+
+
+def table_row_counts(conn):
+    tables = [row[0] for row in conn.execute ( "SELECT name FROM sqlite_master WHERE type='table'" )]
+    return {table: conn.execute ( f'SELECT COUNT(*) FROM "{table}"' ).fetchone ()[0] for table in tables}
+
+
+def explain_query(conn, query, parameterised):
+    params = (0,) if parameterised else ()
+    return [detail for _, _, _, detail in conn.execute ( 'EXPLAIN QUERY PLAN ' + query, params )]
+
+
+def analyse_plan(query, plan, row_counts):
+    aliases = table_aliases ( query, row_counts )
+    full_scans = []
+    automatic_indexes = []
+    indexes_used = []
+    estimated_rows = 0
+
+    for detail in plan:
+        match = PLAN_TABLE.match ( detail )
+        table = aliases.get ( match.group ( 1 ) ) if match else None
+        index = PLAN_INDEX.search ( detail )
+        if index:
+            indexes_used.append ( index.group ( 1 ) )
+        if table is None:
+            continue
+
+        rows = row_counts[table]
+        if 'AUTOMATIC' in detail:
+            # SQLite builds a temporary index from a full scan on every execution
+            automatic_indexes.append ( table )
+            estimated_rows += rows * max ( 1.0, math.log2 ( rows + 1 ) )
+        elif detail.startswith ( 'SCAN' ) and 'COVERING INDEX' not in detail:
+            full_scans.append ( table )
+            estimated_rows += rows
+        elif detail.startswith ( 'SCAN' ):
+            estimated_rows += rows
+        else:
+            estimated_rows += math.log2 ( rows + 1 )
+
+    return {
+        'Full Scans': full_scans,
+        'Automatic Indexes': automatic_indexes,
+        'Temp B-Trees': sum ( 'TEMP B-TREE' in detail for detail in plan ),
+        'Indexes Used': indexes_used,
+        'Estimated Rows Visited': int ( estimated_rows ),
+    }
+
+
+def diagnose_database(database_file):
+    conn = sqlite3.connect ( database_file )
+    try:
+        row_counts = table_row_counts ( conn )
+        indexes = [row[0] for row in conn.execute ( "SELECT name FROM sqlite_master WHERE type='index'" )]
+        queries = {}
+        for category, name, query, parameterised in DIAGNOSED_QUERIES:
+            try:
+                plan = explain_query ( conn, query, parameterised )
+            except sqlite3.Error as e:
+                # Missing tables are reported here the same way extraction skips the category
+                queries[name] = {'Category': category, 'Error': str ( e )}
+                continue
+            queries[name] = {'Category': category, 'Per Name': parameterised, 'Plan': plan,
+                             **analyse_plan ( query, plan, row_counts )}
+    finally:
+        conn.close ()
+
+    return {'Database': database_file, 'Table Rows': row_counts, 'Indexes': indexes, 'Queries': queries}
+
+
+def log_diagnosis(report):
+    logging.info ( f"Query plan diagnosis for {report['Database']}" )
+    for name, result in report['Queries'].items ():
+        if 'Error' in result:
+            logging.info ( f"  {name}: not run ({result['Error']})" )
+            continue
+
+        problems = [f"full scan of {table}" for table in result['Full Scans']]
+        problems += [f"automatic index on {table}" for table in result['Automatic Indexes']]
+        if result['Temp B-Trees']:
+            problems.append ( f"{result['Temp B-Trees']} temp B-tree(s)" )
+        per_name = ' per name' if result['Per Name'] else ''
+        logging.info ( f"  {name}: ~{result['Estimated Rows Visited']:,} rows visited{per_name}"
+                       + (f" ({', '.join ( problems )})" if problems else '') )
+        for detail in result['Plan']:
+            logging.debug ( f"    {detail}" )
+
+    logging.info ( f"  Indexes: {', '.join ( report['Indexes'] ) or 'none'}" )
+
+
+def sidecar_source(sidecar_file):
+    conn = sqlite3.connect ( sidecar_file )
+    try:
+        return tuple ( conn.execute ( f'SELECT size, mtime_ns FROM {SIDECAR_SOURCE_TABLE}' ).fetchone () or () )
+    except sqlite3.Error:
+        # Sidecars created before the source was recorded are rebuilt
+        return None
+    finally:
+        conn.close ()
+
+
+def create_index_sidecar(database_file, sidecar_file):
+    # Indexes must live in the same database as their table, so they are built on a copy of the trace
+    stat = os.stat ( database_file )
+    source = (stat.st_size, stat.st_mtime_ns)
+    # Modification times alone are not enough, copies that preserve them (cp -p, rsync -a) can be older than the sidecar
+    if os.path.exists ( sidecar_file ) and sidecar_source ( sidecar_file ) == source:
+        logging.info ( f"Reusing indexed sidecar {sidecar_file}" )
+        return sidecar_file
+
+    logging.info ( f"Creating indexed sidecar {sidecar_file}" )
+    # Concurrent extraction processes (watch mode) may build the same sidecar
+    temp_file = f'{sidecar_file}.{os.getpid ()}.tmp'
+    shutil.copyfile ( database_file, temp_file )
+
+    conn = sqlite3.connect ( temp_file )
+    try:
+        tables = [row[0] for row in conn.execute ( "SELECT name FROM sqlite_master WHERE type='table'" )]
+        columns = {table: {row[1] for row in conn.execute ( f'PRAGMA table_info("{table}")' )} for table in tables}
+        created = []
+        for index_name, (table, index_columns) in CANDIDATE_INDEXES.items ():
+            if table in columns and set ( index_columns ) <= columns[table]:
+                quoted_columns = ', '.join ( f'"{column}"' for column in index_columns )
+                conn.execute ( f'CREATE INDEX IF NOT EXISTS {index_name} ON "{table}" ({quoted_columns})' )
+                created.append ( index_name )
+        # Sampled statistics keep ANALYZE cheap on large traces while still guiding the planner
+        conn.execute ( 'PRAGMA analysis_limit=1000' )
+        conn.execute ( 'ANALYZE' )
+
+        used = set ()
+        for _, _, query, parameterised in DIAGNOSED_QUERIES:
+            try:
+                plan = explain_query ( conn, query, parameterised )
+            except sqlite3.Error:
+                continue
+            used.update ( index for detail in plan for index in PLAN_INDEX.findall ( detail ) )
+
+        for index_name in created:
+            if index_name not in used:
+                conn.execute ( f'DROP INDEX {index_name}' )
+        conn.execute ( f'CREATE TABLE {SIDECAR_SOURCE_TABLE} (size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)' )
+        conn.execute ( f'INSERT INTO {SIDECAR_SOURCE_TABLE} VALUES (?, ?)', source )
+        conn.commit ()
+        logging.info ( f"Kept indexes: {', '.join ( sorted ( used & set ( created ) ) ) or 'none'}" )
+    finally:
+        conn.close ()
+
+    os.replace ( temp_file, sidecar_file )
+    return sidecar_file
+
+
+def prepare_query_database(database_file, output_dir, diagnose=False, index_sidecar=False, source_file=None,
+                           sidecar_dir=None):
+    """Runs the requested diagnosis and returns the sqlite file the extraction queries should read."""
+    name = os.path.basename ( database_file ).split ( '.' )[0]
+    # source_file is a staged copy of database_file when staging is enabled
+    query_file = source_file or database_file
+    report = {}
+
+    if diagnose:
+        report['Original'] = diagnose_database ( query_file )
+        log_diagnosis ( report['Original'] )
+
+    if index_sidecar:
+        sidecar_name = name
+        if sidecar_dir:
+            # The stage directory is shared by every input, staged copies carry the checksum of their contents
+            sidecar_name = os.path.basename ( query_file ).rsplit ( '.', 1 )[0] if source_file else \
+                name + '-' + hashlib.blake2b ( os.path.abspath ( database_file ).encode (), digest_size=8 ).hexdigest ()
+        sidecar_file = os.path.join ( sidecar_dir or output_dir, sidecar_name + '.indexed.sqlite' )
+        query_file = create_index_sidecar ( query_file, sidecar_file )
+        if diagnose:
+            report['Indexed'] = diagnose_database ( query_file )
+            log_diagnosis ( report['Indexed'] )
+
+    if report:
+        report_file = output_dir + name + '_query_plan.json'
+        with open ( report_file, 'w' ) as file:
+            json.dump ( report, file, indent=4 )
+        logging.info ( f"Saved query plan diagnosis to {report_file}" )
+
+    return query_file
@@ -0,0 +1,167 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from absl import logging
+
+from helper.profiling import profile_task
+
+IO_WORKERS_PER_CPU = 2
+MAX_IO_WORKERS = 32
+TUNING_WINDOW_TASKS = 8  # Minimum completed tasks before throughput is compared
+TUNING_TOLERANCE = 0.05  # Relative throughput change treated as noise
+
+_default_lock = threading.Lock()
+_default_context = {'Context': None}
+_worker = threading.local()
+
+
+def cgroup_cpu_limit():
+    # cgroup v2 exposes "<quota> <period>" in cpu.max, v1 splits them over two files; "max"/-1 means unlimited
+    try:
+        with open ( '/sys/fs/cgroup/cpu.max', 'r' ) as file:
+            quota, period = file.read ().split ()[:2]
+        if quota != 'max':
+            return int ( quota ) / int ( period )
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open ( '/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r' ) as file:
+            quota = int ( file.read () )
+        with open ( '/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r' ) as file:
+            period = int ( file.read () )
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def available_cpus():
+    """CPUs this process may actually use: its affinity mask capped by the cgroup CPU quota."""
+    if hasattr ( os, 'sched_getaffinity' ):
+        cpus = len ( os.sched_getaffinity ( 0 ) )
+    else:
+        cpus = os.cpu_count () or 1
+
+    quota = cgroup_cpu_limit ()
+    if quota is not None:
+        # Threads beyond the quota are throttled rather than run, so partial CPUs are rounded down
+        cpus = min ( cpus, max ( 1, math.floor ( quota ) ) )
+
+    return max ( 1, cpus )
+
+
+def create_execution_context(cpu_workers=None, io_workers=None):
+    """Sizes the CPU pool (parsing, statistics, clustering, rendering) and the I/O pool (queries, table writing).
+
+    cpu_workers defaults to the available CPUs; io_workers to IO_WORKERS_PER_CPU per CPU worker, up to
+    MAX_IO_WORKERS."""
+    cpus = available_cpus ()
+    cpu_workers = cpu_workers or cpus
+    io_workers = io_workers or min ( MAX_IO_WORKERS, IO_WORKERS_PER_CPU * cpu_workers )
+    logging.info ( f"Using {cpu_workers} CPU and {io_workers} I/O workers ({cpus} CPUs available)" )
+
+    return {'CPUs': cpus, 'CPU Workers': cpu_workers, 'IO Workers': io_workers, 'Pools': {}, 'Concurrency': {},
+            'Lock': threading.Lock ()}
+
+
+def get_execution_context(execution=None):
+    # Callers that were not handed a context (e.g. benchmarks) share one sized from the available CPUs
+    if execution is not None:
+        return execution
+
+    with _default_lock:
+        if _default_context['Context'] is None:
+            _default_context['Context'] = create_execution_context ()
+        return _default_context['Context']
+
+
+def init_pool_worker(kind):
+    _worker.kind = kind
+
+
+def get_pool(execution, kind):
+    with execution['Lock']:
+        if kind not in execution['Pools']:
+            execution['Pools'][kind] = ThreadPoolExecutor ( max_workers=execution[f'{kind} Workers'],
+                                                            thread_name_prefix=f'nav-{kind.lower ()}',
+                                                            initializer=init_pool_worker, initargs=(kind,) )
+        return execution['Pools'][kind]
+
+
+def shutdown_execution_context(execution):
+    with execution['Lock']:
+        pools, execution['Pools'] = execution['Pools'], {}
+
+    for pool in pools.values ():
+        pool.shutdown ( wait=True, cancel_futures=True )
+
+
+def run_tasks(execution, kind, function, items, log_progress=False):
+    """Runs function on every item in the 'CPU' or 'IO' pool and returns the results in item order.
+
+    A call made from a worker of the same pool also runs the items that have not started yet itself, so nested
+    parallel sections (e.g. clustering inside general statistics) cannot exhaust the pool and deadlock."""
+    execution = get_execution_context ( execution )
+    pool = get_pool ( execution, kind )
+    items = list ( items )
+    function = profile_task ( function )
+    futures = {pool.submit ( function, item ): i for i, item in enumerate ( items )}
+    results = [None] * len ( items )
+
+    if getattr ( _worker, 'kind', None ) == kind:
+        for future, i in futures.items ():
+            results[i] = function ( items[i] ) if future.cancel () else future.result ()
+        return results
+
+    for completed, future in enumerate ( as_completed ( futures ), 1 ):
+        results[futures[future]] = future.result ()
+        if log_progress and int ( (completed / len ( items )) * 100 ) % 10 == 0:
+            logging.info ( f"Progress: {(completed / len ( items )) * 100:.1f}%" )
+
+    return results
+
+
+def start_tuning(execution, name, kind='IO'):
+    """Starts adapting the number of in-flight tasks of a batch, from the limit learned by earlier batches of name."""
+    maximum = execution[f'{kind} Workers']
+    with execution['Lock']:
+        limit = execution['Concurrency'].get ( name, min ( execution['CPU Workers'], maximum ) )
+
+    return {'Name': name, 'Limit': limit, 'Maximum': maximum, 'Direction': 1, 'Throughput': None,
+            'Window Start': time.perf_counter (), 'Window Units': 0, 'Window Tasks': 0}
+
+
+def update_tuning(execution, tuner, units):
+    """Records a completed task doing units of work and hill-climbs the in-flight limit on measured throughput."""
+    tuner['Window Units'] += units
+    tuner['Window Tasks'] += 1
+    if tuner['Window Tasks'] < max ( TUNING_WINDOW_TASKS, 2 * tuner['Limit'] ):
+        return tuner['Limit']
+
+    now = time.perf_counter ()
+    throughput = tuner['Window Units'] / max ( now - tuner['Window Start'], 1e-9 )
+    last = tuner['Throughput']
+    if last is not None:
+        if throughput < last * (1 - TUNING_TOLERANCE):
+            tuner['Direction'] = -tuner['Direction']
+        elif throughput <= last * (1 + TUNING_TOLERANCE):
+            # Extra workers that do not pay off are released to whatever else shares the node
+            tuner['Direction'] = -1
+
+    previous = tuner['Limit']
+    tuner['Limit'] = min ( tuner['Maximum'], max ( 1, previous + tuner['Direction'] ) )
+    tuner.update ( {'Throughput': throughput, 'Window Start': now, 'Window Units': 0, 'Window Tasks': 0} )
+    if tuner['Limit'] != previous:
+        logging.debug ( f"{tuner['Name']}: {throughput:.0f} units/s at {previous} in flight, now {tuner['Limit']}" )
+
+    with execution['Lock']:
+        execution['Concurrency'][tuner['Name']] = tuner['Limit']
+
+    return tuner['Limit']
@@ -1,32 +1,40 @@
-import os
 import warnings
-from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+import numpy as np
 from absl import logging
 
 from helper.figures import create_and_plot_k_mean_statistics, plot_bandwidth_distribution, plot_frequency_distribution, \
     plot_combined_data, plot_combined_overall_bandwidth_distribution, plot_binned_bandwidth_distribution, \
     plot_combined_frequency_distribution
-from helper.general import MAX_WORKERS
+from helper.execution import get_execution_context, run_tasks
+from helper.general import concatenate_bandwidth_raw_data, VIOLIN_SAMPLE_CAP
+from helper.manifest import load_manifest, save_manifest
+from helper.output import make_dirs, open_sink, close_sink
+from helper.rendering import dispatch_figure, render_figures, shutdown_render_pool
 from helper.tables import export_single_general_stat_to_latex, export_single_general_stat_to_CSV, \
     export_summary_stat_to_latex, export_summary_stat_to_CSV, export_overall_summary_stat_to_latex, \
     export_summary_summary_stat_to_CSV, export_combined_summary_stat_to_CSV, export_combined_summary_stat_to_latex, \
     export_combined_overall_summary_stat_to_CSV, export_combined_overall_summary_stat_to_latex, \
     export_combined_overall_component_summary_stat_to_CSV, export_combined_overall_component_summary_stat_to_latex, \
-    export_combined_overall_duration_summary_stat_to_latex, export_combined_overall_duration_summary_stat_to_CSV
+    export_combined_overall_duration_summary_stat_to_latex, export_combined_overall_duration_summary_stat_to_CSV, \
+    export_breakdown_stat_to_CSV, export_timeline_stat_to_CSV, \
+    export_consolidated_general_stats, export_consolidated_combined_summary_stats
 
 # Ignore Future warnings
 warnings.filterwarnings ( 'ignore', category=FutureWarning )
 
 
-def base_generate_tables_and_figures(data_dict, parent_dir, summary_combined_tables=False):
+def base_generate_tables_and_figures(data_dict, parent_dir, summary_combined_tables=False, figure_jobs=None,
+                                     item_tables=True, violin_sample_cap=VIOLIN_SAMPLE_CAP):
     if 'Individual Kernels' in parent_dir:
         title = data_dict['Name']
     else:
         title = parent_dir.split ( '/' )[-1]
 
-    export_single_general_stat_to_CSV ( data_dict, parent_dir, title )
-    export_single_general_stat_to_latex ( data_dict, parent_dir, title )
+    if item_tables:
+        export_single_general_stat_to_CSV ( data_dict, parent_dir, title )
+        export_single_general_stat_to_latex ( data_dict, parent_dir, title )
 
     if summary_combined_tables:
         stat_names = []
@@ -47,7 +55,8 @@ def base_generate_tables_and_figures(data_dict, parent_dir, summary_combined_tab
     for metric, stats in data_dict.items ():
         if metric == 'Bandwidth Distribution' and isinstance ( stats, dict ):
             temp_title = title + " " + metric
-            plot_bandwidth_distribution ( stats, temp_title, parent_dir )
+            dispatch_figure ( figure_jobs, plot_bandwidth_distribution, stats, temp_title, parent_dir,
+                              violin_sample_cap=violin_sample_cap )
         elif isinstance ( stats, dict ) and 'Individual' not in metric:
             for sub_metric, sub_stats in stats.items ():
                 temp_title = title + " " + metric + " " + sub_metric
@@ -57,43 +66,65 @@ def base_generate_tables_and_figures(data_dict, parent_dir, summary_combined_tab
                     else:
                         units = ''
                     xlabel = metric + units
-                    plot_frequency_distribution ( sub_stats, temp_title, xlabel, parent_dir )
+                    dispatch_figure ( figure_jobs, plot_frequency_distribution, sub_stats, temp_title, xlabel, parent_dir )
                 elif 'k-mean' == sub_metric and isinstance ( sub_stats, dict ):
                     if sub_stats['Raw Data']:
-                        create_and_plot_k_mean_statistics ( sub_stats, temp_title, parent_dir )
+                        dispatch_figure ( figure_jobs, create_and_plot_k_mean_statistics, sub_stats, temp_title, metric,
+                                          parent_dir )
 
     return None
 
 
-def base_generate_combined_tables_and_figures(data_dict, parent_dir, combined_info=None, kernels=False):
+def combined_metric_raw_data(category_dict, individual, metric):
+    stats = category_dict.get ( metric )
+    if isinstance ( stats, dict ) and stats.get ( 'Raw Data' ) is not None:
+        return np.asarray ( stats['Raw Data'], dtype=float )
+
+    # NAV files written before the concatenated array was stored only keep the per item raw data
+    raw_data = [np.asarray ( item[metric]['Raw Data'], dtype=float )
+                for item in category_dict.get ( individual, {} ).values ()
+                if isinstance ( item, dict ) and isinstance ( item.get ( metric ), dict )
+                and item[metric].get ( 'Raw Data' ) is not None]
+
+    return np.concatenate ( raw_data ) if raw_data else None
+
+
+def comparison_item_dicts(data_dict, keys):
+    item_dicts = {label: data_dict[label][key] for label, key in keys.items ()}
+    stat_names = [sub_metric for sub_metric, sub_dict in next ( iter ( item_dicts.values () ) ).items ()
+                  if isinstance ( sub_dict, dict ) and 'Individual' not in sub_metric and 'Bandwidth Distribution' != sub_metric]
+
+    return item_dicts, stat_names
 
-    if combined_info is not None:
-        item_name = combined_info[0]
-        labels = combined_info[1:]
 
-        if kernels:
-            keys = {label: next ( key for key, value in data_dict[label].items () if value.get ( 'Name' ) == item_name )
-                    for label in labels}
+def base_generate_combined_tables_and_figures(data_dict, parent_dir, combined_info=None, figure_jobs=None,
+                                              item_tables=True, violin_sample_cap=VIOLIN_SAMPLE_CAP):
 
-        item_dicts = {label: data_dict[label][keys[label]] if kernels else data_dict[label][item_name] for label in
-                      labels}
+    if combined_info is not None:
+        item_name, keys = combined_info
+        labels = list ( keys.keys () )
+        name = item_name
+
+        item_dicts, stat_names = comparison_item_dicts ( data_dict, keys )
 
         for sub_metric, sub_dict in item_dicts[labels[0]].items ():
-            if isinstance ( sub_dict, dict ) and 'Individual' not in sub_metric and 'Bandwidth Distribution' != sub_metric:
-                name = item_name
-                plot_combined_data ( item_dicts, name, sub_metric, parent_dir )
-                export_combined_summary_stat_to_CSV ( item_dicts, parent_dir, name, sub_metric )
-                export_combined_summary_stat_to_latex ( item_dicts, parent_dir, name, sub_metric )
+            if sub_metric in stat_names:
+                dispatch_figure ( figure_jobs, plot_combined_data, item_dicts, name, sub_metric, parent_dir,
+                                  violin_sample_cap=violin_sample_cap )
+                if item_tables:
+                    export_combined_summary_stat_to_CSV ( item_dicts, parent_dir, name, sub_metric )
+                    export_combined_summary_stat_to_latex ( item_dicts, parent_dir, name, sub_metric )
             elif 'Bandwidth Distribution' == sub_metric:
                 raw_bandwidth_data = {}
                 for label in labels:
-                    data = []
-                    if item_dicts[label]['Bandwidth Distribution'] is not None and item_dicts[label]['Bandwidth Distribution']['Raw Data'] is not None:
-                            data.extend ( item_dicts[label]['Bandwidth Distribution']['Raw Data'])
-                    if len(data) > 0:
+                    data = None
+                    if item_dicts[label]['Bandwidth Distribution'] is not None:
+                        data = concatenate_bandwidth_raw_data ( [item_dicts[label]['Bandwidth Distribution']['Raw Data']] )
+                    if data is not None and len ( data['Size'] ) > 0:
                         raw_bandwidth_data[label] = data
                 if len(raw_bandwidth_data) > 1:
-                    plot_binned_bandwidth_distribution ( raw_bandwidth_data, name, parent_dir )
+                    dispatch_figure ( figure_jobs, plot_binned_bandwidth_distribution, raw_bandwidth_data, name, parent_dir,
+                                      violin_sample_cap=violin_sample_cap )
 
     else:
         labels = list(data_dict.keys())
@@ -101,101 +132,102 @@ def base_generate_combined_tables_and_figures(data_dict, parent_dir, combined_in
         individual = next((item for item in item_name if 'Individual' in item), None)
         item_name = [item for item in item_name if isinstance(data_dict[next(iter(data_dict))][item], dict) and 'Individual' not in item]
         name = parent_dir.split ( '/' )[-1]
-        raw_individual_data = {}
-        item_dicts = {}
 
+        # Fresh dicts per metric, queued figure jobs keep references to them until they are rendered
         for metric in item_name:
+            raw_individual_data = {}
+            item_dicts = {}
             for label in labels:
-                data = []
-                if label in data_dict and individual in data_dict[label]:
-                    keys = data_dict[label][individual].keys()
-                    for key in keys:
-                        if key in data_dict[label][individual] and isinstance(data_dict[label][individual][key], dict):
-                            if metric in data_dict[label][individual][key] and isinstance(
-                                    data_dict[label][individual][key][metric], dict):
-                                metric_data = data_dict[label][individual][key][metric]
-                                if 'Raw Data' in metric_data:
-                                    raw_data = metric_data['Raw Data']
-                                    if raw_data is not None:
-                                        data.extend(raw_data)
-
-                if data:
+                data = combined_metric_raw_data ( data_dict[label], individual, metric )
+                if data is not None and len ( data ) > 0:
                     raw_individual_data[label] = data
 
                 if metric in data_dict[label] and isinstance(data_dict[label][metric], dict):
                     item_dicts[label] = data_dict[label][metric]
 
-            plot_combined_data ( raw_individual_data, name, metric, parent_dir, raw_provided=True)
-            plot_combined_frequency_distribution( raw_individual_data, name, metric, parent_dir)
+            dispatch_figure ( figure_jobs, plot_combined_data, raw_individual_data, name, metric, parent_dir, raw_provided=True,
+                              violin_sample_cap=violin_sample_cap )
+            dispatch_figure ( figure_jobs, plot_combined_frequency_distribution, raw_individual_data, name, metric, parent_dir )
             export_combined_overall_summary_stat_to_CSV ( item_dicts, parent_dir, name, metric )
             export_combined_overall_summary_stat_to_latex ( item_dicts, parent_dir, name, metric )
 
         if name == 'Transfer Statistics':
             raw_bandwidth_data = {}
             for label in labels:
-                data = []
-                keys = data_dict[label][individual].keys()
-                for key in keys:
-                    if data_dict[label][individual][key]['Bandwidth Distribution'] is not None and data_dict[label][individual][key]['Bandwidth Distribution']['Raw Data'] is not None:
-                        data.extend ( data_dict[label][individual][key]['Bandwidth Distribution']['Raw Data'] )
-                raw_bandwidth_data[label] = data
-            plot_combined_overall_bandwidth_distribution ( raw_bandwidth_data, name, parent_dir )
-            plot_binned_bandwidth_distribution ( raw_bandwidth_data, name, parent_dir )
-
-
-def find_common_keys_or_names(data_dict, kernels=False):
-    kernel_sets = []
-    for config, subdict in data_dict.items():
-        if kernels:
-            items = {value.get("Name") for value in subdict.values()}
-        else:
-            items = set(subdict.keys())
-        kernel_sets.append((config, items))
+                data = concatenate_bandwidth_raw_data ( [transfer['Bandwidth Distribution']['Raw Data']
+                                                         for transfer in data_dict[label][individual].values ()
+                                                         if transfer['Bandwidth Distribution'] is not None] )
+                raw_bandwidth_data[label] = data if data is not None else {'Size': [], 'Bandwidth': []}
+            dispatch_figure ( figure_jobs, plot_combined_overall_bandwidth_distribution, raw_bandwidth_data, name, parent_dir,
+                              violin_sample_cap=violin_sample_cap )
+            dispatch_figure ( figure_jobs, plot_binned_bandwidth_distribution, raw_bandwidth_data, name, parent_dir,
+                              violin_sample_cap=violin_sample_cap )
 
-    common_kernels = set.intersection(*[ks for _, ks in kernel_sets])
-    common_items = []
-    for i in range ( len ( kernel_sets ) ):
-        for j in range ( i + 1, len ( kernel_sets ) ):
-            common_kernels_in_both = common_kernels.intersection ( kernel_sets[i][1], kernel_sets[j][1] )
-            for kernel_name in common_kernels_in_both:
-                common_configs = [config for config, kernels in kernel_sets if kernel_name in kernels]
-                if len ( common_configs ) >= 2:
-                    common_items.append ( (kernel_name, *common_configs) )
 
-    return common_items
+def build_comparison_index(data_dict, kernels=False):
+    # Maps each item name to the key it has in every configuration containing it, built in a single pass
+    index = {}
+    for config, subdict in data_dict.items ():
+        for key, value in subdict.items ():
+            name = value.get ( 'Name' ) if kernels else key
+            index.setdefault ( name, {} ).setdefault ( config, key )
 
+    return {name: keys for name, keys in index.items () if len ( keys ) >= 2}
 
-def generate_specific_tables_and_figures(data_dict, parent_dir, combined=False):
+
+def generate_specific_tables_and_figures(data_dict, parent_dir, combined=False, consolidated_tables=False, execution=None,
+                                         violin_sample_cap=VIOLIN_SAMPLE_CAP):
     logging.info ( f"Starting Individual kernel/type Summary Figure and Table Generation" )
-    with ThreadPoolExecutor ( max_workers=MAX_WORKERS ) as executor:
-        futures = []
+    figure_groups = []
+    tasks = []
+    if not combined:
+        for sub_dir, sub_dict in data_dict.items ():
+            temp_parent_dir = parent_dir + '/' + str ( sub_dir )
+            make_dirs ( temp_parent_dir )
+            figure_jobs = []
+            figure_groups.append ( figure_jobs )
+            tasks.append ( partial ( base_generate_tables_and_figures, sub_dict, temp_parent_dir, figure_jobs=figure_jobs,
+                                     item_tables=not consolidated_tables, violin_sample_cap=violin_sample_cap ) )
+    else:
+        kernels = True if 'Kernels' in parent_dir else False
+        comparison_index = build_comparison_index ( data_dict, kernels=kernels )
+        for common_item in comparison_index.items ():
+            temp_parent_dir = parent_dir + '/' + str ( common_item[0] )
+            make_dirs ( temp_parent_dir )
+            figure_jobs = []
+            figure_groups.append ( figure_jobs )
+            tasks.append ( partial ( base_generate_combined_tables_and_figures, data_dict, temp_parent_dir, common_item,
+                                     figure_jobs=figure_jobs, item_tables=not consolidated_tables,
+                                     violin_sample_cap=violin_sample_cap ) )
+
+    # Table writing is I/O bound, figures are only collected here and rendered on the CPU workers below
+    run_tasks ( execution, 'IO', lambda task: task (), tasks )
+
+    if consolidated_tables:
+        title = parent_dir.split ( '/' )[-1]
         if not combined:
-            for sub_dir, sub_dict in data_dict.items ():
-                temp_parent_dir = parent_dir + '/' + str ( sub_dir )
-                os.makedirs ( temp_parent_dir, exist_ok=True )
-                futures.append ( executor.submit ( base_generate_tables_and_figures, sub_dict, temp_parent_dir ) )
+            items = [(sub_dict['Name'] if 'Individual Kernels' in parent_dir else str ( sub_dir ), sub_dict)
+                     for sub_dir, sub_dict in data_dict.items ()]
+            export_consolidated_general_stats ( items, parent_dir, title )
         else:
-            kernels = True if 'Kernels' in parent_dir else False
-            common_items = find_common_keys_or_names ( data_dict, kernels=kernels )
-            for common_item in common_items:
-                temp_parent_dir = parent_dir + '/' + str ( common_item[0] )
-                os.makedirs ( temp_parent_dir, exist_ok=True )
-                futures.append ( executor.submit ( base_generate_combined_tables_and_figures, data_dict, temp_parent_dir, common_item, kernels=kernels) )
+            items = [(item_name, *comparison_item_dicts ( data_dict, keys )) for item_name, keys in comparison_index.items ()]
+            export_consolidated_combined_summary_stats ( items, parent_dir, title )
 
-        # Wait for all tasks to complete
-        for future in futures:
-            future.result ()
+    render_figures ( figure_groups, execution )
 
     return None
 
 
-def generate_general_tables_and_figures(data_dict, parent_dir, no_specific=False, no_individual=False, combined=False):
+def generate_general_tables_and_figures(data_dict, parent_dir, no_specific=False, no_individual=False, combined=False,
+                                        consolidated_tables=False, execution=None, violin_sample_cap=VIOLIN_SAMPLE_CAP):
     if not combined:
         for sub_dir, sub_dict in data_dict.items ():
             if ('Individual' in sub_dir and not no_individual):
                 temp_parent_dir = parent_dir + '/' + sub_dir
-                os.makedirs ( temp_parent_dir, exist_ok=True )
-                generate_specific_tables_and_figures ( sub_dict, temp_parent_dir )
+                make_dirs ( temp_parent_dir )
+                generate_specific_tables_and_figures ( sub_dict, temp_parent_dir,
+                                                       consolidated_tables=consolidated_tables, execution=execution,
+                                                       violin_sample_cap=violin_sample_cap )
     else:
         configs = list(data_dict.keys ())
         stats = list(data_dict[configs[0]].keys())
@@ -203,16 +235,23 @@ def generate_general_tables_and_figures(data_dict, parent_dir, no_specific=False
             if ('Individual' in stat):
                 temp_dict = {config: data_dict[config][stat] for config in configs}
                 temp_parent_dir = parent_dir + '/' + stat
-                os.makedirs ( temp_parent_dir, exist_ok=True )
-                generate_specific_tables_and_figures ( temp_dict, temp_parent_dir, combined=True )
+                make_dirs ( temp_parent_dir )
+                generate_specific_tables_and_figures ( temp_dict, temp_parent_dir, combined=True,
+                                                       consolidated_tables=consolidated_tables, execution=execution,
+                                                       violin_sample_cap=violin_sample_cap )
 
     if not no_specific and combined:
         logging.info ( f"Starting Specific Metric Summary Figure and Table Generation" )
-        kernels = True if 'Kernels' in parent_dir else False
-        base_generate_combined_tables_and_figures ( data_dict, parent_dir, kernels=kernels)
+        figure_jobs = []
+        base_generate_combined_tables_and_figures ( data_dict, parent_dir, figure_jobs=figure_jobs,
+                                                    violin_sample_cap=violin_sample_cap )
+        render_figures ( [figure_jobs], execution )
     elif not no_specific:
         logging.info ( f"Starting Specific Metric Summary Figure and Table Generation" )
-        base_generate_tables_and_figures ( data_dict, parent_dir, summary_combined_tables=True )
+        figure_jobs = []
+        base_generate_tables_and_figures ( data_dict, parent_dir, summary_combined_tables=True, figure_jobs=figure_jobs,
+                                           violin_sample_cap=violin_sample_cap )
+        render_figures ( [figure_jobs], execution )
 
     return None
 
@@ -266,25 +305,45 @@ def export_combined_overall_summary_tables(data_dict, parent_dir):
     export_combined_overall_duration_summary_stat_to_latex(data_dict, parent_dir)
 
 
-def extract_general_dict(data_dict, parent_dir, no_general=False, no_specific=False, no_individual=False, combined=False):
+def split_timeline(statistics, parent_dir, general=True):
+    # The timeline is not a kernel/transfer/communication category, it gets its own tables next to the overall summary
+    timeline = statistics.get ( 'Timeline Statistics' )
+    if isinstance ( timeline, dict ) and general:
+        export_timeline_stat_to_CSV ( timeline, parent_dir )
+    return {key: value for key, value in statistics.items () if key != 'Timeline Statistics'}
+
+
+def without_breakdown(section):
+    # Per-dimension breakdowns get their own table, the metric tables and figures only cover the whole trace
+    return {key: value for key, value in section.items () if key != 'Breakdown'}
+
+
+def extract_general_dict(data_dict, parent_dir, no_general=False, no_specific=False, no_individual=False, combined=False,
+                         consolidated_tables=False, execution=None, violin_sample_cap=VIOLIN_SAMPLE_CAP):
 
     if not combined:
         for sub_dir, sub_dict in data_dict.items ():
             if isinstance(sub_dict,dict):
                 temp_parent_dir = parent_dir + '/' + sub_dir
-                os.makedirs ( temp_parent_dir, exist_ok=True )
-                generate_general_tables_and_figures ( sub_dict, temp_parent_dir, no_specific, no_individual )
+                make_dirs ( temp_parent_dir )
+                if isinstance ( sub_dict.get ( 'Breakdown' ), dict ) and not no_specific:
+                    export_breakdown_stat_to_CSV ( sub_dict['Breakdown'], temp_parent_dir, sub_dir )
+                generate_general_tables_and_figures ( without_breakdown ( sub_dict ), temp_parent_dir, no_specific,
+                                                      no_individual, consolidated_tables=consolidated_tables,
+                                                      execution=execution, violin_sample_cap=violin_sample_cap )
     else:
         configs = list(data_dict.keys ())
         stats = list(data_dict[configs[0]].keys())
         for stat in stats:
             if 'Total Duration' != stat:
                 temp_dict = {config: data_dict[config].get(stat) for config in configs}
-                temp_dict = {k: v for k, v in temp_dict.items() if v is not None and isinstance(v, dict)}
+                temp_dict = {k: without_breakdown(v) for k, v in temp_dict.items() if v is not None and isinstance(v, dict)}
                 temp_parent_dir = parent_dir + '/' + stat
                 if len(temp_dict) >= 2:
-                    os.makedirs ( temp_parent_dir, exist_ok=True )
-                    generate_general_tables_and_figures ( temp_dict, temp_parent_dir, combined=True)
+                    make_dirs ( temp_parent_dir )
+                    generate_general_tables_and_figures ( temp_dict, temp_parent_dir, combined=True,
+                                                          consolidated_tables=consolidated_tables, execution=execution,
+                                                          violin_sample_cap=violin_sample_cap )
 
     if not no_general and not combined:
         logging.info ( f"Starting Overall Summary Figure and Table Generation" )
@@ -294,26 +353,47 @@ def extract_general_dict(data_dict, parent_dir, no_general=False, no_specific=Fa
         export_combined_overall_summary_tables ( data_dict, parent_dir )
 
 
-def generation_tables_and_figures(data_dict, no_comparison, no_general, no_specific, no_individual, num_files, output_dir):
+def generation_tables_and_figures(data_dict, no_comparison, no_general, no_specific, no_individual, num_files, output_dir,
+                                  force_regenerate=False, consolidated_tables=False, output_sink='filesystem',
+                                  execution=None, violin_sample_cap=VIOLIN_SAMPLE_CAP):
     logging.info("Starting Figure and Table Generation")
-
-    if num_files < 2:
-        extract_general_dict ( data_dict, output_dir, no_general, no_specific, no_individual)
-    else:
-        for i, (sub_dir, sub_dict) in enumerate(data_dict.items ()):
-            logging.info ( f"Starting Individual Figure and Table Generation for {sub_dir}" )
-            if sub_dir not in output_dir[i]:
-                temp_parent_dir = output_dir[i] + '/' + sub_dir
-            else:
-                temp_parent_dir = output_dir[i]
-            os.makedirs ( temp_parent_dir, exist_ok=True )
-            extract_general_dict ( sub_dict, temp_parent_dir, no_general, no_specific, no_individual )
-
-    if not no_comparison and num_files > 1:
-        logging.info ( f"Starting Comparison Figure and Table Generation" )
-        temp_parent_dir = './' + output_dir[-1] + '/Combined Statistics'
-        os.makedirs ( temp_parent_dir, exist_ok=True )
-        extract_general_dict(data_dict, temp_parent_dir, combined=True)
-
+    execution = get_execution_context ( execution )
+    output_root = output_dir if num_files < 2 else output_dir[-1]
+    open_sink ( output_root, output_sink )
+    # Archives are rewritten as a whole, so only filesystem outputs can be reused across runs
+    if output_sink == 'filesystem':
+        load_manifest ( output_root, force_regenerate )
+
+    try:
+        if num_files < 2:
+            data_dict = split_timeline ( data_dict, output_dir, not no_general )
+            extract_general_dict ( data_dict, output_dir, no_general, no_specific, no_individual,
+                                   consolidated_tables=consolidated_tables, execution=execution,
+                                   violin_sample_cap=violin_sample_cap )
+        else:
+            categories = {}
+            for i, (sub_dir, sub_dict) in enumerate(data_dict.items ()):
+                logging.info ( f"Starting Individual Figure and Table Generation for {sub_dir}" )
+                if sub_dir not in output_dir[i]:
+                    temp_parent_dir = output_dir[i] + '/' + sub_dir
+                else:
+                    temp_parent_dir = output_dir[i]
+                make_dirs ( temp_parent_dir )
+                categories[sub_dir] = split_timeline ( sub_dict, temp_parent_dir, not no_general )
+                extract_general_dict ( categories[sub_dir], temp_parent_dir, no_general, no_specific, no_individual,
+                                       consolidated_tables=consolidated_tables, execution=execution,
+                                       violin_sample_cap=violin_sample_cap )
+            data_dict = categories
+
+        if not no_comparison and num_files > 1:
+            logging.info ( f"Starting Comparison Figure and Table Generation" )
+            temp_parent_dir = './' + output_dir[-1] + '/Combined Statistics'
+            make_dirs ( temp_parent_dir )
+            extract_general_dict(data_dict, temp_parent_dir, combined=True, consolidated_tables=consolidated_tables,
+                                 execution=execution, violin_sample_cap=violin_sample_cap)
+    finally:
+        shutdown_render_pool ()
+        save_manifest ()
+        close_sink ()
 
     return None
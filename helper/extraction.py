@@ -1,20 +1,42 @@
 import json
+import os
+import re
 from collections import OrderedDict
+from functools import partial
 from absl import logging
 
+from helper.diagnostics import prepare_query_database
 from helper.communication import parallel_parse_communication_data, COMM_REQUIRED_TABLES, QUERY_COMMUNICATION, \
-    QUERY_COMMUNICATION_STATS, create_specific_communication_stats
+    QUERY_COMMUNICATION_STATS_TEMPLATE, COMMUNICATION_DIMENSION, create_specific_communication_stats, \
+    generate_communicaiton_stats
 from helper.general import execute_query_in_thread, execute_queries_parallel, mutiple_table_exists, \
-    DURATION_REQUIRED_TABLE, QUERY_TOTAL_DURATION
-from helper.kernel import parallel_parse_kernel_data, KERNEL_REQUIRED_TABLES, QUERY_KERNEL, QUERY_KERNEL_STATS, \
-    parallel_create_general_kernel_stats
+    DURATION_REQUIRED_TABLE, QUERY_TOTAL_DURATION, QUERY_WINDOW_DURATION, GROUP_DIMENSIONS, group_query, \
+    nav_json_default, start_total_deadline, window_bounds
+from helper.execution import get_execution_context, run_tasks
+from helper.instrumentation import phase
+from helper.timeline import TIMELINE_SECTION, create_timeline_statistics
+from helper.staging import get_stage_dir, stage_database, track_staged_file, release_staged_files
+from helper.kernel import parallel_parse_kernel_data, KERNEL_REQUIRED_TABLES, QUERY_KERNEL, \
+    QUERY_KERNEL_STATS_TEMPLATE, parallel_create_general_kernel_stats, parse_kernel_data
 from helper.transfer import parallel_parse_transfer_data, TRANSFER_REQUIRED_TABLES, QUERY_TRANSFERS, \
-    QUERY_TRANSFERS_STATS, create_specific_transfer_stats
+    QUERY_TRANSFERS_STATS_TEMPLATE, create_specific_transfer_stats, generate_transfer_stats
 
 KERNEL_STATS = 0
 TRANSFER_STATS = 1
 COMMUNICATION_STATS = 2
 
+STATISTICS_CATEGORIES = ['Kernel', 'Transfer', 'Communication']
+
+# NAV sections and the key of their per-item dictionary for each category
+STATISTICS_SECTIONS = {
+    'Kernel': ('Kernel Statistics', 'Individual Kernels'),
+    'Transfer': ('Transfer Statistics', 'Individual Transfers'),
+    'Communication': ('Communication Statistics', 'Individual Communications'),
+}
+
+# Per-dimension statistics are nested under this key of a category section
+BREAKDOWN_KEY = 'Breakdown'
+
 
 def generate_queries(qurey, id_list):
     queries = []
@@ -25,7 +47,57 @@ def generate_queries(qurey, id_list):
     return queries
 
 
-def create_statistics(database_file, first_query, raw_data_query, metric_type, sort_metric='Time Total'):
+def parse_grouped_data(parse, data):
+    """Parses the raw rows of one item as a whole and once for each value of their trailing Dimension column."""
+    id, rows = data
+    ungrouped = []
+    grouped = {}
+
+    for row in rows:
+        values = row[:-1]
+        ungrouped.append(values)
+        grouped.setdefault(row[-1], []).append(values)
+
+    groups = {}
+    for dimension, group_rows in grouped.items():
+        # Durations are the second column of every raw data query, transfer sizes the third
+        fields = {'Time Total': sum(row[1] for row in group_rows)}
+        if parse is generate_transfer_stats:
+            fields['Memory Total'] = sum(row[2] for row in group_rows)
+        fields['Instance'] = len(group_rows)
+        _, group_statistics = parse((id, group_rows))
+        # Raw values are only kept once, in the ungrouped item
+        for value in (group_statistics or {}).values():
+            if isinstance(value, dict):
+                value.pop('Raw Data', None)
+        groups[dimension] = (fields, group_statistics or {})
+
+    return parse((id, ungrouped)), groups
+
+
+def create_breakdown(statistics, groups, label, sort_metric='Time Total'):
+    """Nested section of the per-item statistics of every dimension value, in natural order of the values."""
+    breakdown = {}
+
+    for dimension in sorted(groups, key=lambda value: [int(part) if part.isdigit() else part
+                                                       for part in re.split(r'(\d+)', value)]):
+        total = sum(fields['Time Total'] for fields, _ in groups[dimension].values())
+        items = {}
+        for id, (fields, group_statistics) in groups[dimension].items():
+            item = {field: statistics[id][field] for field in ('Name', 'Type') if field in statistics[id]}
+            item['Time Percent'] = round(fields['Time Total'] * 100.0 / total, 1) if total else 0.0
+            item.update(fields)
+            item.update(group_statistics)
+            items[id] = item
+        breakdown[dimension] = OrderedDict(sorted(items.items(), key=lambda item: item[1][sort_metric], reverse=True))
+
+    return {'Dimension': label, 'Groups': breakdown}
+
+
+def create_statistics(database_file, first_query, raw_data_query, metric_type, sort_metric='Time Total', execution=None,
+                      window=None, grouped=False):
+    """Statistics of every item of metric_type, sorted by sort_metric. With grouped, raw_data_query selects a trailing
+    Dimension column and the per-item statistics of each of its values are also returned, otherwise None is."""
     ids = []
     statistics = {}
     name_stats = ''
@@ -38,7 +110,9 @@ def create_statistics(database_file, first_query, raw_data_query, metric_type, s
         name_stats = 'Communication'
 
     logging.info(f"Getting General {name_stats} Information")
-    res = execute_query_in_thread((first_query, None), database_file)
+    with phase('Summary Query', name_stats) as record:
+        res = execute_query_in_thread((first_query, None), database_file, window)
+        record['Rows'] = len(res[1])
 
     if metric_type is KERNEL_STATS:
         for id, time_percent, time_total, instance, name in res[1]:
@@ -66,61 +140,160 @@ def create_statistics(database_file, first_query, raw_data_query, metric_type, s
         logging.info(f"Getting RAW Data for each specific {name_stats}")
 
     queries = generate_queries(raw_data_query, ids)
-    queries_res = execute_queries_parallel(queries, database_file)
+    with phase('Raw Queries', name_stats) as record:
+        queries_res = execute_queries_parallel(queries, database_file, execution, window)
+        raw_rows = sum(len(rows) for _, rows in queries_res)
+        record['Rows'] = raw_rows
 
     logging.info(f"Parsing RAW Data and generating Statistics for {name_stats}")
-    if metric_type is KERNEL_STATS:
-        results = parallel_parse_kernel_data(queries_res)
-    elif metric_type is TRANSFER_STATS:
-        results = parallel_parse_transfer_data(queries_res)
-    elif metric_type is COMMUNICATION_STATS:
-        results = parallel_parse_communication_data(queries_res)
+    groups = None
+    with phase('Parsing', name_stats) as record:
+        if grouped:
+            parse = {KERNEL_STATS: parse_kernel_data, TRANSFER_STATS: generate_transfer_stats,
+                     COMMUNICATION_STATS: generate_communicaiton_stats}[metric_type]
+            results = run_tasks(execution, 'CPU', partial(parse_grouped_data, parse), queries_res, log_progress=True)
+            groups = {}
+            for (id, _), item_groups in results:
+                for dimension, group in item_groups.items():
+                    groups.setdefault(str(dimension), {})[id] = group
+            results = [result for result, _ in results]
+        elif metric_type is KERNEL_STATS:
+            results = parallel_parse_kernel_data(queries_res, execution)
+        elif metric_type is TRANSFER_STATS:
+            results = parallel_parse_transfer_data(queries_res, execution)
+        elif metric_type is COMMUNICATION_STATS:
+            results = parallel_parse_communication_data(queries_res, execution)
+        record['Rows'] = raw_rows
 
     for id, dict in results:
         statistics[id].update(dict)
 
+    # Items whose raw query exceeded the per-query deadline have no statistics to report
+    parsed_ids = set(id for id, _ in results)
+    for id in ids:
+        if id not in parsed_ids:
+            logging.warning(f"Dropping {name_stats} {statistics[id].get('Name', id)} from the statistics, its raw data query did not complete")
+            del statistics[id]
+
     statistics = OrderedDict(
         sorted(statistics.items(), key=lambda item: item[1][sort_metric], reverse=True))
 
-    return statistics
+    return statistics, groups
 
 
-def create_statistics_from_file(database_file, output_dir, FLAGS):
-    full_statistics = {}
+def extract_statistics(query_file, categories=STATISTICS_CATEGORIES, execution=None, window=None, group_by=None,
+                       timeline=False):
+    """Extracts the statistics of the requested categories from query_file into a NAV dictionary.
 
-    logging.info(f"Starting extraction and creation of statistics from {database_file}")
+    window limits kernels, transfers and NVTX ranges to those inside (start, end) in trace nanoseconds. group_by (one
+    of GROUP_DIMENSIONS) also breaks every category down by device, stream, context or process from the same raw data
+    queries, nested under the BREAKDOWN_KEY of its section (NVTX ranges always by process). timeline adds the busy,
+    idle, overlap and concurrency analysis of every device timeline as TIMELINE_SECTION."""
+    full_statistics = {}
+    execution = get_execution_context(execution)
+    label, expression = GROUP_DIMENSIONS[group_by] if group_by else (None, None)
+    communication_label, communication_expression = COMMUNICATION_DIMENSION if group_by else (None, None)
 
-    if not FLAGS.no_kernel_metrics:
+    if 'Kernel' in categories:
         logging.info("Starting Kernel Statistics")
-        if mutiple_table_exists(database_file, KERNEL_REQUIRED_TABLES):
-            kernel_statistics = create_statistics(database_file, QUERY_KERNEL, QUERY_KERNEL_STATS,
-                                                  metric_type=KERNEL_STATS)
+        with phase('Schema Checks', 'Kernel'):
+            tables_exist = mutiple_table_exists(query_file, KERNEL_REQUIRED_TABLES)
+        if tables_exist:
+            kernel_statistics, groups = create_statistics(query_file, QUERY_KERNEL, group_query(QUERY_KERNEL_STATS_TEMPLATE, expression),
+                                                          metric_type=KERNEL_STATS, execution=execution, window=window, grouped=bool(group_by))
             full_statistics['Kernel Statistics'] = {'Individual Kernels': kernel_statistics}
-            full_statistics['Kernel Statistics'].update(parallel_create_general_kernel_stats(kernel_statistics))
+            with phase('General Statistics', 'Kernel'):
+                full_statistics['Kernel Statistics'].update(parallel_create_general_kernel_stats(kernel_statistics, execution))
+            if groups is not None:
+                full_statistics['Kernel Statistics'][BREAKDOWN_KEY] = create_breakdown(kernel_statistics, groups, label)
 
-    if not FLAGS.no_transfer_metrics:
+    if 'Transfer' in categories:
         logging.info("Starting Transfer Statistics")
-        if mutiple_table_exists(database_file, TRANSFER_REQUIRED_TABLES):
-            transfer_statistics = create_statistics(database_file, QUERY_TRANSFERS, QUERY_TRANSFERS_STATS,
-                                                    metric_type=TRANSFER_STATS)
+        with phase('Schema Checks', 'Transfer'):
+            tables_exist = mutiple_table_exists(query_file, TRANSFER_REQUIRED_TABLES)
+        if tables_exist:
+            transfer_statistics, groups = create_statistics(query_file, QUERY_TRANSFERS, group_query(QUERY_TRANSFERS_STATS_TEMPLATE, expression),
+                                                            metric_type=TRANSFER_STATS, execution=execution, window=window, grouped=bool(group_by))
             full_statistics['Transfer Statistics'] = {'Individual Transfers': transfer_statistics}
-            full_statistics['Transfer Statistics'].update(create_specific_transfer_stats(transfer_statistics))
+            with phase('General Statistics', 'Transfer'):
+                full_statistics['Transfer Statistics'].update(create_specific_transfer_stats(transfer_statistics, execution=execution))
+            if groups is not None:
+                full_statistics['Transfer Statistics'][BREAKDOWN_KEY] = create_breakdown(transfer_statistics, groups, label)
 
-    if not FLAGS.no_communication_metrics:
+    if 'Communication' in categories:
         logging.info("Starting Communication Statistics")
-        if mutiple_table_exists(database_file, COMM_REQUIRED_TABLES):
-            comm_statistics = create_statistics(database_file, QUERY_COMMUNICATION, QUERY_COMMUNICATION_STATS,
-                                                metric_type=COMMUNICATION_STATS)
+        with phase('Schema Checks', 'Communication'):
+            tables_exist = mutiple_table_exists(query_file, COMM_REQUIRED_TABLES)
+        if tables_exist:
+            comm_statistics, groups = create_statistics(query_file, QUERY_COMMUNICATION, group_query(QUERY_COMMUNICATION_STATS_TEMPLATE, communication_expression),
+                                                        metric_type=COMMUNICATION_STATS, execution=execution, window=window, grouped=bool(group_by))
             full_statistics['Communication Statistics'] = {'Individual Communications': comm_statistics}
-            full_statistics['Communication Statistics'].update(create_specific_communication_stats(comm_statistics))
+            with phase('General Statistics', 'Communication'):
+                full_statistics['Communication Statistics'].update(create_specific_communication_stats(comm_statistics, execution=execution))
+            if groups is not None:
+                full_statistics['Communication Statistics'][BREAKDOWN_KEY] = create_breakdown(comm_statistics, groups, communication_label)
 
-    if mutiple_table_exists(database_file, DURATION_REQUIRED_TABLE):
-        full_statistics['Total Duration'] = execute_query_in_thread((QUERY_TOTAL_DURATION, None), database_file)[1][0][0]
+    with phase('Summary Query', 'Total Duration') as record:
+        if mutiple_table_exists(query_file, DURATION_REQUIRED_TABLE):
+            if window is None:
+                full_statistics['Total Duration'] = execute_query_in_thread((QUERY_TOTAL_DURATION, None), query_file)[1][0][0]
+            else:
+                start, end = window_bounds(window)
+                full_statistics['Total Duration'] = execute_query_in_thread((QUERY_WINDOW_DURATION, (end, start)), query_file)[1][0][0]
+            record['Rows'] = 1
 
-    if not FLAGS.no_save_data and full_statistics:
-        database_file_NAV = output_dir + database_file.split('.')[0] + '_parsed_stats.nav'
-        logging.info(f"Saving Extracted Statistics of {database_file} to {database_file_NAV}")
+    if timeline:
+        logging.info("Starting Timeline Statistics")
+        with phase('Timeline', 'Timeline') as record:
+            timeline_statistics = create_timeline_statistics(query_file, execution, window)
+            if timeline_statistics:
+                full_statistics[TIMELINE_SECTION] = timeline_statistics
+                record['Rows'] = sum(device['Kernels'] + device['Copies'] for device in timeline_statistics['Devices'].values())
+
+    return full_statistics
+
+
+def extract_database(database_file, output_dir, options, execution=None):
+    """Stages, indexes and extracts database_file as described by an options dictionary (Categories, Window, Group By,
+    Timeline, Index Sidecar, Total Timeout), for worker processes that extract whole files on their own. The total
+    timeout starts once the file is staged and indexed."""
+    try:
+        staged_file, _ = stage_database(database_file)
+        query_file = prepare_query_database(database_file, output_dir, False, options['Index Sidecar'], staged_file,
+                                            get_stage_dir())
+        if get_stage_dir() and query_file != staged_file:
+            track_staged_file(query_file)
+        start_total_deadline(options.get('Total Timeout'))
+
+        logging.info(f"Starting extraction and creation of statistics from {database_file}")
+        return extract_statistics(query_file, options['Categories'], execution, options['Window'], options.get('Group By'),
+                                  options.get('Timeline', False))
+    finally:
+        release_staged_files()
+
+
+def save_statistics(full_statistics, database_file, output_dir):
+    database_file_NAV = output_dir + os.path.basename(database_file).split('.')[0] + '_parsed_stats.nav'
+    logging.info(f"Saving Extracted Statistics of {database_file} to {database_file_NAV}")
+    with phase('NAV Save') as record:
         with open(database_file_NAV, 'w') as NAV_file:
-            json.dump(full_statistics, NAV_file, indent=4)
+            json.dump(full_statistics, NAV_file, indent=4, default=nav_json_default)
+        record['Bytes Written'] = os.path.getsize(database_file_NAV)
+
+    return database_file_NAV
+
+
+def create_statistics_from_file(database_file, output_dir, FLAGS, query_file=None, execution=None, window=None):
+    # Queries may run against an indexed or staged copy, outputs are still named after the original file
+    query_file = query_file or database_file
+    categories = [category for category, disabled in [('Kernel', FLAGS.no_kernel_metrics),
+                                                      ('Transfer', FLAGS.no_transfer_metrics),
+                                                      ('Communication', FLAGS.no_communication_metrics)] if not disabled]
+
+    logging.info(f"Starting extraction and creation of statistics from {database_file}")
+    full_statistics = extract_statistics(query_file, categories, execution, window)
+
+    if not FLAGS.no_save_data and full_statistics:
+        save_statistics(full_statistics, database_file, output_dir)
 
     return full_statistics
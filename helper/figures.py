@@ -3,14 +3,22 @@ import numpy as np
 from absl import logging
 from matplotlib import pyplot as plt, ticker
 from matplotlib.ticker import ScalarFormatter
-from sklearn.cluster import KMeans
 
-from helper.general import convert_size, convert_duration
+from helper.clustering import fit_k_means
+from helper.general import convert_size, convert_duration, bin_values, bandwidth_raw_arrays, VIOLIN_SAMPLE_CAP
+from helper.output import make_dirs, save_figure
 
-plt.rcParams.update({
+RENDERER_VERSION = 2
+
+VIOLIN_POINTS = 100
+KDE_CHUNK_SIZE = 2048
+
+FIGURE_RC_PARAMS = {
     'font.size': 14,
     'axes.titlesize': 16,
-})
+}
+
+plt.rcParams.update(FIGURE_RC_PARAMS)
 
 
 def format_power_2_ticks(value, _):
@@ -43,15 +51,61 @@ def format_power_10_ticks(value, _):
         return str ( value )
 
 
-def create_and_plot_k_mean_statistics(cluster_data, title, parent_dir):
-    X = np.array ( cluster_data['Raw Data'] )
+def gaussian_kde_values(samples, coords):
+    # Same Gaussian KDE with Scott's bandwidth that matplotlib's violinplot uses, evaluated in chunks
+    num_samples = len ( samples )
+    variance = np.var ( samples, ddof=1 ) if num_samples > 1 else 0.0
+    covariance = variance * num_samples ** (-2 / 5)
+
+    if not np.isfinite ( covariance ) or covariance <= 0:
+        return np.zeros_like ( coords )
+
+    values = np.zeros_like ( coords )
+    for start in range ( 0, num_samples, KDE_CHUNK_SIZE ):
+        diff = coords[:, np.newaxis] - samples[np.newaxis, start:start + KDE_CHUNK_SIZE]
+        values += np.exp ( -0.5 * diff ** 2 / covariance ).sum ( axis=1 )
+
+    return values / (np.sqrt ( 2 * np.pi * covariance ) * num_samples)
+
+
+def violin_stats(data, max_samples=VIOLIN_SAMPLE_CAP, points=VIOLIN_POINTS):
+    data = np.asarray ( data, dtype=float )
+    min_value = np.min ( data )
+    max_value = np.max ( data )
+
+    # Only the density is estimated from a sample, markers come from the exact data
+    samples = data
+    if len ( data ) > max_samples:
+        samples = np.random.default_rng ( 0 ).choice ( data, size=max_samples, replace=False )
 
-    wcss_values = []
-    max_clusters = min ( 8, len ( X ) )
-    for i in range ( 1, max_clusters + 1 ):
-        kmeans = KMeans ( n_clusters=i, init='k-means++', max_iter=300, n_init=10, random_state=0 )
-        kmeans.fit ( X )
-        wcss_values.append ( kmeans.inertia_ )
+    coords = np.linspace ( min_value, max_value, points )
+
+    return {
+        'coords': coords,
+        'vals': gaussian_kde_values ( samples, coords ),
+        'mean': np.mean ( data ),
+        'median': np.median ( data ),
+        'min': min_value,
+        'max': max_value
+    }
+
+
+def draw_violins(ax, datasets, positions=None, widths=0.5, violin_sample_cap=VIOLIN_SAMPLE_CAP):
+    vpstats = [violin_stats ( data, violin_sample_cap ) for data in datasets]
+
+    return ax.violin ( vpstats, positions=positions, widths=widths, showmeans=True, showmedians=True )
+
+
+def create_and_plot_k_mean_statistics(cluster_data, title, metric, parent_dir):
+    # NAV files written before clustering was stored only carry the raw points
+    if 'WCSS' not in cluster_data or 'Labels' not in cluster_data:
+        cluster_data = fit_k_means ( cluster_data['Raw Data'] )
+
+    X = np.array ( cluster_data['Raw Data'] )
+    # Categories cluster more than one metric (e.g. transfer durations and sizes), so the metric is part of the name
+    name = title.split ( " " )[0] + "_" + metric.lower ().replace ( ' ', '_' )
+    wcss_values = cluster_data['WCSS']
+    max_clusters = len ( wcss_values )
 
     # Plot the WCSS values
     fig, ax = plt.subplots ( figsize=(10, 10) )
@@ -61,16 +115,15 @@ def create_and_plot_k_mean_statistics(cluster_data, title, parent_dir):
     ax.set_ylabel ( 'Within-Cluster Sum of Squares (WCSS)' )
     fig.tight_layout ()
     fig.subplots_adjust ( top=0.95 )
-    file = parent_dir + "/" + title.split ( " " )[0].replace ( '-', '_' ) + '_elbow_method.png'
-    fig.savefig ( file, bbox_inches='tight' )
+    file = parent_dir + "/" + name + '_elbow_method.png'
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close ( fig )
 
     cluster_dir = parent_dir + '/Cluster Options'
-    os.makedirs ( cluster_dir, exist_ok=True )
+    make_dirs ( cluster_dir )
 
     for n_clusters in range ( 1, max_clusters + 1 ):
-        kmeans = KMeans ( n_clusters=n_clusters, random_state=42 )
-        cluster_labels = kmeans.fit_predict ( X )
+        cluster_labels = cluster_data['Labels'][n_clusters - 1]
         min_x = np.min(X[:, 0])
         min_y = np.min(X[:, 1])
         min_x_log10 = np.floor(np.log10(min_x))
@@ -88,12 +141,12 @@ def create_and_plot_k_mean_statistics(cluster_data, title, parent_dir):
         ax.yaxis.set_major_formatter(ticker.FuncFormatter(format_power_10_ticks))
         fig.tight_layout ()
         fig.subplots_adjust ( top=0.95 )
-        file = cluster_dir + "/" + title.split ( " " )[0].replace ( ' ', '_' ) + f'_k_{n_clusters}_mean_cluster.png'
-        fig.savefig ( file, bbox_inches='tight' )
+        file = cluster_dir + "/" + name + f'_k_{n_clusters}_mean_cluster.png'
+        save_figure ( fig, file, bbox_inches='tight' )
         plt.close ( fig )
 
 
-def plot_combined_data(combined_data, title, metric, parent_dir, raw_provided=False):
+def plot_combined_data(combined_data, title, metric, parent_dir, raw_provided=False, violin_sample_cap=VIOLIN_SAMPLE_CAP):
     data = []
     labels = []
 
@@ -102,10 +155,8 @@ def plot_combined_data(combined_data, title, metric, parent_dir, raw_provided=Fa
             if sub_dict[metric]:
                 if sub_dict[metric]["Raw Data"] and metric == 'Bandwidth Distribution':
                     labels.append ( name )
-                    temp = []
-                    for transfer_size, bandwidth in sub_dict[metric]["Raw Data"]:
-                        temp.append ( bandwidth )
-                    data.append ( temp )
+                    _, bandwidths = bandwidth_raw_arrays ( sub_dict[metric]["Raw Data"] )
+                    data.append ( bandwidths )
                 elif sub_dict[metric]["Raw Data"]:
                     labels.append ( name )
                     data.append ( sub_dict[metric]["Raw Data"] )
@@ -119,7 +170,7 @@ def plot_combined_data(combined_data, title, metric, parent_dir, raw_provided=Fa
         return None
 
     fig, ax = plt.subplots ( 1, figsize=(10, 10) )
-    parts = ax.violinplot ( data, showmeans=True, showmedians=True )
+    parts = draw_violins ( ax, data, violin_sample_cap=violin_sample_cap )
 
     for pc in parts['bodies']:
         pc.set_facecolor ( 'skyblue' )
@@ -139,9 +190,8 @@ def plot_combined_data(combined_data, title, metric, parent_dir, raw_provided=Fa
     ax.tick_params ( axis='x', rotation=45 )
     ax.set_xlabel ( "Trace Name" )
 
-    flat_data = [item for sublist in data for item in sublist]
-    min_value = np.min ( flat_data )
-    max_value = np.max ( flat_data )
+    min_value = min ( np.min ( sub_data ) for sub_data in data )
+    max_value = max ( np.max ( sub_data ) for sub_data in data )
     magnitude_diff = np.log10 ( max_value ) - np.log10 ( min_value )
     if magnitude_diff >= 1:
         ax.set_yscale ( 'log', base=10 )
@@ -160,23 +210,21 @@ def plot_combined_data(combined_data, title, metric, parent_dir, raw_provided=Fa
     fig.tight_layout ()
     fig.subplots_adjust ( top=0.95 )
     file = parent_dir + "/" + title.replace ( ' ', '_' ) + '_' + metric.replace ( ' ', '_' ) + '_combined_distribution.png'
-    fig.savefig ( file, bbox_inches='tight' )
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close ( fig )
 
 
-def plot_combined_overall_bandwidth_distribution(combined_data, title, parent_dir):
+def plot_combined_overall_bandwidth_distribution(combined_data, title, parent_dir, violin_sample_cap=VIOLIN_SAMPLE_CAP):
     data = []
     labels = []
 
-    for name, sub_list in combined_data.items ():
+    for name, raw_data in combined_data.items ():
         labels.append(name)
-        temp = []
-        for _, bandwidth in sub_list:
-            temp.append (bandwidth)
-        data.append ( temp )
+        _, bandwidths = bandwidth_raw_arrays ( raw_data )
+        data.append ( bandwidths )
 
     fig, ax = plt.subplots ( 1, figsize=(10, 10) )
-    parts = ax.violinplot ( data, showmeans=True, showmedians=True )
+    parts = draw_violins ( ax, data, violin_sample_cap=violin_sample_cap )
 
     for pc in parts['bodies']:
         pc.set_facecolor ( 'skyblue' )
@@ -191,7 +239,7 @@ def plot_combined_overall_bandwidth_distribution(combined_data, title, parent_di
     parts['cmaxes'].set_linestyle ( '--' )
     parts['cbars'].set_color ( 'black' )
 
-    min_value = min ( min ( sublist ) for sublist in data )
+    min_value = min ( np.min ( sublist ) for sublist in data )
     ax.grid ( axis='y', linestyle='--', linewidth=0.5, color='gray', alpha=0.5 )
     ax.grid(which='minor', axis='y', linestyle=':', linewidth=0.5, color='lightgray')
     ax.set_title ( f'{title}: Overall Combined Bandwidth Distribution' )
@@ -210,15 +258,13 @@ def plot_combined_overall_bandwidth_distribution(combined_data, title, parent_di
     fig.tight_layout ()
     fig.subplots_adjust ( top=0.95 )
     file = parent_dir + '/Transfer_Statistics_Overall_Combined_Bandwidth_distribution.png'
-    fig.savefig ( file, bbox_inches='tight' )
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close ( fig )
 
 
-def plot_binned_bandwidth_distribution(combined_data, title, parent_dir):
-    all_sizes = []
-    for name, sub_list in combined_data.items():
-        sizes, bandwidths = zip(*sub_list)
-        all_sizes.extend(sizes)
+def plot_binned_bandwidth_distribution(combined_data, title, parent_dir, violin_sample_cap=VIOLIN_SAMPLE_CAP):
+    raw_arrays = {name: bandwidth_raw_arrays(raw_data) for name, raw_data in combined_data.items()}
+    all_sizes = np.concatenate([sizes for sizes, _ in raw_arrays.values()])
 
     quantiles = np.linspace(0, 1, 8)
     bin_edges = np.quantile(all_sizes, quantiles)
@@ -228,21 +274,14 @@ def plot_binned_bandwidth_distribution(combined_data, title, parent_dir):
 
     x = np.arange(len(bin_edges) - 1)  # the label locations
 
-    for i, (name, bandwidths) in enumerate(combined_data.items()):
-        binned_bandwidths = [[] for _ in range(len(bin_edges) - 1)]
-        for j in range(len(bin_edges) - 1):
-            bin_bandwidths = [bw for size, bw in bandwidths if bin_edges[j] <= size < bin_edges[j + 1]]
-            if bin_bandwidths:
-                binned_bandwidths[j] = bin_bandwidths
+    for i, (name, (sizes, bandwidths)) in enumerate(raw_arrays.items()):
+        binned_bandwidths = [bin_bandwidths if len(bin_bandwidths) else np.zeros(1)
+                             for bin_bandwidths in bin_values(bandwidths, sizes, bin_edges)]
         if binned_bandwidths:
-            for item in binned_bandwidths:
-                if len(item) == 0:
-                    item.append(0)
-
             offset = (num_configs - 1) / 2
             positions = x + offset + i * width_per_bin
-            parts = ax.violinplot(binned_bandwidths, showmeans=True, showmedians=True,
-                                  positions=positions, widths=width_per_bin)
+            parts = draw_violins(ax, binned_bandwidths, positions=positions, widths=width_per_bin,
+                                 violin_sample_cap=violin_sample_cap)
 
             for pc in parts['bodies']:
                 pc.set_facecolor('C' + str(i))
@@ -274,17 +313,17 @@ def plot_binned_bandwidth_distribution(combined_data, title, parent_dir):
     fig.tight_layout()
     fig.subplots_adjust(top=0.9, bottom=0.15)  # Adjust top and bottom margins
     file = parent_dir + '/' + title.replace(' ', '_') + '_Combined_Bandwidth_distribution_By_Size.png'
-    fig.savefig(file, bbox_inches='tight')
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close(fig)
 
 
-def plot_bandwidth_distribution(histogram_data, title, parent_dir):
+def plot_bandwidth_distribution(histogram_data, title, parent_dir, violin_sample_cap=VIOLIN_SAMPLE_CAP):
     array_lists = histogram_data['Histogram']
     labels = histogram_data['Bin Labels']
 
     x_values = np.arange ( 1, len ( array_lists ) + 1 )
     fig, ax = plt.subplots ( 1, figsize=(10, 10) )
-    parts = ax.violinplot ( array_lists, showmeans=True, showmedians=True )
+    parts = draw_violins ( ax, array_lists, violin_sample_cap=violin_sample_cap )
 
     for pc in parts['bodies']:
         pc.set_facecolor ( 'skyblue' )
@@ -302,7 +341,7 @@ def plot_bandwidth_distribution(histogram_data, title, parent_dir):
     ax.xaxis.set_ticks ( x_values )
     ax.xaxis.set_ticklabels ( labels )
     ax.tick_params ( axis='x', rotation=45 )
-    min_value = min ( min ( sublist ) for sublist in array_lists )
+    min_value = min ( np.min ( sublist ) for sublist in array_lists )
     ax.grid ( axis='y', linestyle='--', linewidth=0.5, color='gray', alpha=0.5 )
     ax.grid(which='minor', axis='y', linestyle=':', linewidth=0.5, color='lightgray')
     ax.set_title ( title )
@@ -318,7 +357,7 @@ def plot_bandwidth_distribution(histogram_data, title, parent_dir):
     fig.tight_layout ()
     fig.subplots_adjust ( top=0.95 )
     file = parent_dir + "/" + title.split ( " " )[0].replace ( '-', '_' ) + '_bandwidth_distribution.png'
-    fig.savefig ( file, bbox_inches='tight' )
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close ( fig )
 
 
@@ -349,14 +388,12 @@ def plot_frequency_distribution(histogram_data, title, xlabel, parent_dir):
         file = parent_dir + "/" + title.split ( " " )[0] + "_" + "_".join (
             xlabel.lower ().split ( " " )[0:2] ) + '_frequency_distribution.png'
 
-    fig.savefig ( file, bbox_inches='tight' )
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close ( fig )
 
 
 def plot_combined_frequency_distribution(combined_data, title, metric, parent_dir):
-    all_values = []
-    for name, sub_list in combined_data.items():
-        all_values.extend(sub_list)
+    all_values = np.concatenate([np.asarray(sub_list, dtype=float) for sub_list in combined_data.values()])
 
     quantiles = np.linspace(0, 1, num=9)
     bin_edges = np.quantile(all_values, quantiles)
@@ -367,16 +404,9 @@ def plot_combined_frequency_distribution(combined_data, title, metric, parent_di
     x = np.arange(len(bin_edges) - 1)
 
     for i, (name, data) in enumerate(combined_data.items()):
-        binned_data = [[] for _ in range(len(bin_edges) - 1)]
-        for j in range(len(bin_edges) - 1):
-            bin_data = [val for val in data if bin_edges[j] <= val < bin_edges[j + 1]]
-            if bin_data:
-                binned_data[j] = bin_data
+        data = np.asarray(data, dtype=float)
+        binned_data = [bin_data if len(bin_data) else np.zeros(1) for bin_data in bin_values(data, data, bin_edges)]
         if binned_data:
-            for item in binned_data:
-                if len(item) == 0:
-                    item.append(0)
-
             offset = (num_configs - 1) / 2
             positions = x + offset + i * width_per_bin
             ax.bar(positions, [np.mean(b) for b in binned_data], width_per_bin, alpha=0.7, label=name)
@@ -405,5 +435,5 @@ def plot_combined_frequency_distribution(combined_data, title, metric, parent_di
     fig.tight_layout()
     fig.subplots_adjust(top=0.9, bottom=0.15)
     file = os.path.join(parent_dir, title.replace(' ', '_') + '_Combined_' + metric.replace(' ', '_') + '_distribution_By_Size.png')
-    fig.savefig(file, bbox_inches='tight')
+    save_figure ( fig, file, bbox_inches='tight' )
     plt.close(fig)
\ No newline at end of file
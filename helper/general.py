@@ -1,20 +1,65 @@
 import json
 import sqlite3
+import threading
+import time
 from bisect import bisect_left, bisect_right
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import CancelledError, FIRST_COMPLETED, wait
 
 import numpy as np
 from absl import logging, app
 
-MAX_WORKERS = 12
+from helper.execution import get_execution_context, get_pool, start_tuning, update_tuning
+from helper.profiling import profile_task
+
+QUERY_PROGRESS_STEPS = 100000  # SQLite VM instructions between progress handler calls
+QUERY_FETCH_SIZE = 10000
+QUERY_REPORT_INTERVAL = 60  # Seconds between live reports of long running queries
+VIOLIN_SAMPLE_CAP = 10000  # Values a violin's density is estimated from, its markers always use all values
+
+_query_lock = threading.Lock()
+_query_state = {'Query Timeout': None, 'Deadline': None, 'Cancelled': threading.Event(), 'Active': {}}
 
 QUERY_TOTAL_DURATION = """
 SELECT duration AS total_duration
 FROM ANALYSIS_DETAILS;
 """
 
+QUERY_WINDOW_DURATION = """
+SELECT min(stopTime, ?) - max(startTime, ?) AS total_duration
+FROM ANALYSIS_DETAILS;
+"""
+
 DURATION_REQUIRED_TABLE = ['ANALYSIS_DETAILS']
 
+# Extraction windows shadow these tables with same-named temporary views. Runtime API calls are only joined to kernels
+# by correlation id, so they stay whole and kernels at the window start keep their launch overhead
+WINDOW_FILTERS = {
+    'CUPTI_ACTIVITY_KIND_KERNEL': 'start >= {start} AND "end" <= {end}',
+    'CUPTI_ACTIVITY_KIND_MEMCPY': 'start >= {start} AND "end" <= {end}',
+    'CUPTI_ACTIVITY_KIND_MEMSET': 'start >= {start} AND "end" <= {end}',
+    # Domain creation events (type 75) name the ranges and have no extent of their own
+    'NVTX_EVENTS': 'eventType = 75 OR (start >= {start} AND coalesce("end", start) <= {end})',
+}
+
+# Grouping dimensions of the breakdown and their expressions over the kernel, memcpy and memset activity tables.
+# Stream ids are only unique within a device, process ids are the PID bits of the global id
+GROUP_DIMENSIONS = {
+    'device': ('Device', 'deviceId'),
+    'stream': ('Stream', "deviceId || ':' || streamId"),
+    'context': ('Context', 'contextId'),
+    'process': ('Process', '(globalPid >> 24) & 0xFFFFFF'),
+}
+
+
+def group_query(template, expression=None):
+    """Raw data query from template, with expression selected as a trailing Dimension column when given."""
+    if expression is None:
+        return template.format(dimension='', dimension_column='')
+    return template.format(dimension=f',\n            {expression} AS dimension',
+                           dimension_column=',\n    dimension AS "Dimension"')
+
+
 def file_args_checking(args):
     extract_data = False
     output_data = True
@@ -53,6 +98,12 @@ def file_args_checking(args):
     return files, num_files, file_labels, output_data, extract_data
 
 
+def nav_json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not NAV serializable")
+
+
 def import_from_NAV(file):
     with open(file, 'r') as nav_file:
         dict = json.load(nav_file, parse_float=float)
@@ -60,6 +111,11 @@ def import_from_NAV(file):
     return dict
 
 
+def export_to_NAV(file, dict):
+    with open(file, 'w') as nav_file:
+        json.dump(dict, nav_file, indent=4, default=nav_json_default)
+
+
 def table_exists(database_file, table_name):
     try:
         with sqlite3.connect(database_file) as conn:
@@ -83,7 +139,71 @@ def mutiple_table_exists(database_file, table_name_list):
     return True
 
 
-def execute_query(conn, query, params=None):
+def configure_query_limits(query_timeout=None, total_timeout=None):
+    """Sets the per-query and total extraction deadlines in seconds (None disables them) and clears any cancellation."""
+    with _query_lock:
+        _query_state['Query Timeout'] = query_timeout
+        _query_state['Cancelled'].clear()
+    start_total_deadline(total_timeout)
+
+
+def start_total_deadline(total_timeout=None):
+    # Started once the databases are staged and indexed, so that only the extraction queries count towards it
+    with _query_lock:
+        _query_state['Deadline'] = time.monotonic() + total_timeout if total_timeout else None
+
+
+def cancel_queries():
+    # Running queries abort at their next progress handler call, queued ones before they start
+    _query_state['Cancelled'].set()
+
+
+def reset_query_cancellation():
+    # A failed or interrupted batch cancels every later query until the next extraction starts
+    _query_state['Cancelled'].clear()
+
+
+def query_progress(progress):
+    # SQLite calls this every QUERY_PROGRESS_STEPS virtual machine instructions, returning non-zero interrupts the query
+    progress['Steps'] += QUERY_PROGRESS_STEPS
+    now = time.monotonic()
+    if _query_state['Cancelled'].is_set():
+        progress['Abort'] = 'Cancelled'
+    elif _query_state['Deadline'] is not None and now > _query_state['Deadline']:
+        progress['Abort'] = 'Total Deadline'
+        cancel_queries()
+    elif _query_state['Query Timeout'] and now - progress['Start'] > _query_state['Query Timeout']:
+        progress['Abort'] = 'Query Deadline'
+    return 1 if 'Abort' in progress else 0
+
+
+def log_active_queries(min_elapsed=0):
+    with _query_lock:
+        active = list(_query_state['Active'].values())
+
+    now = time.monotonic()
+    for progress in sorted(active, key=lambda progress: progress['Start']):
+        elapsed = now - progress['Start']
+        if elapsed >= min_elapsed:
+            logging.info(f"Query for {progress['Key']} running for {elapsed:.0f}s: {progress['Steps']:,} VM steps, "
+                         f"{progress['Rows']:,} rows fetched")
+
+
+def window_bounds(window):
+    start, end = window
+    return int(start) if start is not None else -2 ** 63, int(end) if end is not None else 2 ** 63 - 1
+
+
+def apply_window(conn, window):
+    start, end = window_bounds(window)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    for table, condition in WINDOW_FILTERS.items():
+        if table in tables:
+            conn.execute(f'CREATE TEMP VIEW "{table}" AS SELECT * FROM main."{table}" '
+                         f'WHERE {condition.format(start=start, end=end)}')
+
+
+def execute_query(conn, query, params=None, progress=None, as_array=False):
     cursor = conn.cursor()
     if params is not None or params == 0:
         key = params
@@ -93,36 +213,103 @@ def execute_query(conn, query, params=None):
     else:
         key = None
         cursor.execute(query)
-    result = cursor.fetchall()
+    if progress is None and not as_array:
+        return key, cursor.fetchall()
+
+    # Fetching in batches keeps the fetched row count current for live progress reports, integer results can be
+    # packed into an int64 array batch by batch instead of being held as row tuples
+    result = []
+    fetched = 0
+    while True:
+        rows = cursor.fetchmany(QUERY_FETCH_SIZE)
+        if not rows:
+            break
+        if as_array:
+            result.append(np.asarray(rows, dtype=np.int64))
+        else:
+            result.extend(rows)
+        fetched += len(rows)
+        if progress is not None:
+            progress['Rows'] = fetched
+    if as_array:
+        return key, np.concatenate(result) if result else np.empty((0, len(cursor.description)), dtype=np.int64)
     return key, result
 
 
-def execute_query_in_thread(query_params, database_file):
+def execute_query_in_thread(query_params, database_file, window=None, as_array=False):
+    key = query_params[1] if len(query_params) > 1 else None
+    if _query_state['Cancelled'].is_set():
+        raise CancelledError(f"Query for {key} was cancelled before it started")
+
+    progress = {'Key': key, 'Start': time.monotonic(), 'Steps': 0, 'Rows': 0}
+    with _query_lock:
+        _query_state['Active'][id(progress)] = progress
+
     conn = sqlite3.connect(database_file)  # Create a new connection object in each thread
+    conn.set_progress_handler(lambda: query_progress(progress), QUERY_PROGRESS_STEPS)
     try:
-        result = execute_query ( conn, *query_params )
+        if window is not None:
+            apply_window(conn, window)
+        result = execute_query ( conn, *query_params, progress=progress, as_array=as_array )
+    except sqlite3.OperationalError as error:
+        abort = progress.get('Abort')
+        if abort == 'Query Deadline':
+            raise TimeoutError(f"Query for {key} exceeded the {_query_state['Query Timeout']}s per-query deadline "
+                               f"after {progress['Steps']:,} VM steps") from error
+        elif abort == 'Total Deadline':
+            raise CancelledError(f"Query for {key} was cancelled, the total extraction deadline passed") from error
+        elif abort == 'Cancelled':
+            raise CancelledError(f"Query for {key} was cancelled") from error
+        logging.error(f"Error reading data from SQLite table: {error}")
+        raise
     except sqlite3.Error as error:
-        print("Error reading data from SQLite table:", error)
+        logging.error(f"Error reading data from SQLite table: {error}")
+        raise
     finally:
         conn.close()
+        with _query_lock:
+            del _query_state['Active'][id(progress)]
     return result
 
 
-def execute_queries_parallel(queries_with_params, database_file):
+def execute_queries_parallel(queries_with_params, database_file, execution=None, window=None, as_array=False):
+    """Runs the queries on the I/O pool, skipping (with a warning) any that exceed the per-query deadline.
+
+    The number of queries in flight adapts to the measured rows/s. Raises CancelledError once cancel_queries() is
+    called or the total deadline passes. With as_array, each result is an int64 array of rows by columns."""
+    execution = get_execution_context(execution)
+    executor = get_pool(execution, 'IO')
+    tuner = start_tuning(execution, 'Queries')
+    query_task = profile_task(execute_query_in_thread)
+    queued = deque(queries_with_params)
     results = []
     total_queries = len(queries_with_params)
     completed_queries = 0
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = []
-        for query_params in queries_with_params:
-            future = executor.submit(execute_query_in_thread, query_params, database_file)
-            futures.append(future)
-        for future in as_completed(futures):
-            results.append(future.result())
-            completed_queries += 1
-            # Check if 10% of total items are completed
-            if int((completed_queries / total_queries) * 100) % 10 == 0:
-                logging.info(f"Progress: {(completed_queries / total_queries) * 100:.1f}%")
+    pending = set()
+    try:
+        while queued or pending:
+            while queued and len(pending) < tuner['Limit']:
+                pending.add(executor.submit(query_task, queued.popleft(), database_file, window, as_array))
+            done, pending = wait(pending, timeout=QUERY_REPORT_INTERVAL, return_when=FIRST_COMPLETED)
+            if not done:
+                log_active_queries(QUERY_REPORT_INTERVAL)
+            for future in done:
+                try:
+                    result = future.result()
+                    results.append(result)
+                    update_tuning(execution, tuner, len(result[1]) + 1)
+                except TimeoutError as error:
+                    logging.warning(f"{error}, skipping it")
+                completed_queries += 1
+                # Check if 10% of total items are completed
+                if int((completed_queries / total_queries) * 100) % 10 == 0:
+                    logging.info(f"Progress: {(completed_queries / total_queries) * 100:.1f}%")
+    except BaseException:
+        # Interrupt running queries and drop queued ones so the batch stops promptly
+        cancel_queries()
+        for future in pending:
+            future.cancel()
+        raise
     return results
 
 
@@ -146,7 +333,7 @@ def remove_outliers(data):
 
 def generate_statistics(data, label, disable_raw=False):
     kernel_data = {}
-    data = [float(x) for x in data]
+    data = np.asarray(data, dtype=float)
 
     # Compute statistics
     mean_duration = np.mean(data)
@@ -156,7 +343,7 @@ def generate_statistics(data, label, disable_raw=False):
     std_deviation = np.std(data)
 
     # Round statistical results to 6 decimal places
-    rounded_log_data = np.round(data, 6).tolist()
+    rounded_log_data = None if disable_raw else np.round(data, 6).tolist()
     rounded_mean_duration = round(mean_duration, 6)
     rounded_median_duration = round(median_duration, 6)
     rounded_min_duration = round(min_duration, 6)
@@ -203,6 +390,50 @@ def convert_duration(duration):
     s = round(duration / p, 2)
     return f"{s}{size_name[i]}"
 
+def bin_values(values, keys, bin_edges):
+    # Groups values by the [left, right) bin their key falls in, keeping the original order inside each bin
+    values = np.asarray ( values )
+    keys = np.asarray ( keys )
+    bin_edges = np.asarray ( bin_edges )
+    num_bins = len ( bin_edges ) - 1
+
+    if num_bins < 1:
+        return []
+
+    indices = np.searchsorted ( bin_edges, keys, side='right' ) - 1
+    in_range = (indices >= 0) & (indices < num_bins)
+    indices = indices[in_range]
+    order = np.argsort ( indices, kind='stable' )
+    splits = np.searchsorted ( indices[order], np.arange ( 1, num_bins ) )
+
+    return np.split ( values[in_range][order], splits )
+
+
+def bandwidth_raw_arrays(raw_data):
+    # NAV files written before the parallel layout store a list of (size, bandwidth) pairs
+    if isinstance ( raw_data, dict ):
+        return np.asarray ( raw_data['Size'], dtype=float ), np.asarray ( raw_data['Bandwidth'], dtype=float )
+
+    pairs = np.asarray ( raw_data, dtype=float ).reshape ( -1, 2 )
+    return pairs[:, 0], pairs[:, 1]
+
+
+def concatenate_bandwidth_raw_data(raw_data_list):
+    sizes = []
+    bandwidths = []
+
+    for raw_data in raw_data_list:
+        if raw_data is not None:
+            size, bandwidth = bandwidth_raw_arrays ( raw_data )
+            sizes.append ( size )
+            bandwidths.append ( bandwidth )
+
+    if not sizes:
+        return None
+
+    return {'Size': np.concatenate ( sizes ), 'Bandwidth': np.concatenate ( bandwidths )}
+
+
 def expand_bins(data, bin_edges):
     expanded_bin_edges = []
 
@@ -276,10 +507,6 @@ def create_histogram(data, bins=10, powers_2=False, base=False, convert_bytes=Fa
             else:
                 bin_labels = [f'{convert_duration(data[0])}']
 
-        for sublist in hist:
-            if not sublist:
-                sublist.append(0)
-
         histogram_data = {
             "Bin Centers": bin_centers,
             "Histogram": hist,
@@ -0,0 +1,179 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+from absl import logging
+
+from helper.profiling import profile_phase_start, profile_phase_stop
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is then reported as 0
+    resource = None
+
+REPORT_COLUMNS = ['Phase', 'Category', 'Wall Time (s)', 'CPU Time (s)', 'Rows', 'Rows/s', 'Bytes Written',
+                  'Peak RSS (MB)']
+
+_report_lock = threading.Lock()
+_report = {'Source': None, 'Phases': []}
+
+CLEAR_REFS_FILE = '/proc/self/clear_refs'
+STATUS_FILE = '/proc/self/status'
+
+_rss_lock = threading.Lock()
+_rss = {'Open': [], 'Peak': 0, 'Resettable': None}
+
+
+def cpu_time():
+    # Includes reaped child processes so the render pool is accounted to the phase that shuts it down
+    times = os.times ()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def children_peak_rss_kb():
+    return resource.getrusage ( resource.RUSAGE_CHILDREN ).ru_maxrss if resource is not None else 0
+
+
+def read_rss_high_water_mark():
+    # VmHWM is the peak RSS in KiB since the process started or the mark was last reset, None without procfs
+    try:
+        with open ( STATUS_FILE, 'r' ) as file:
+            for line in file:
+                if line.startswith ( 'VmHWM:' ):
+                    return int ( line.split ()[1] )
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def update_rss_peaks():
+    # Called with _rss_lock held, before the mark is reset and when a phase ends
+    high_water_mark = read_rss_high_water_mark ()
+    if high_water_mark is None:
+        return None
+
+    for tracker in _rss['Open']:
+        tracker['Peak'] = max ( tracker['Peak'], high_water_mark )
+    _rss['Peak'] = max ( _rss['Peak'], high_water_mark )
+
+
+def start_rss_tracking():
+    """Starts measuring the peak RSS of a phase.
+
+    Phases may nest and run on several threads while the high-water mark is per process, so the mark is folded into
+    the peaks of every open phase before it is reset (writing 5 to /proc/self/clear_refs) for the new one."""
+    tracker = {'Peak': 0, 'Children': children_peak_rss_kb ()}
+    with _rss_lock:
+        update_rss_peaks ()
+        if _rss['Resettable'] is not False:
+            try:
+                with open ( CLEAR_REFS_FILE, 'w' ) as file:
+                    file.write ( '5' )
+                _rss['Resettable'] = True
+            except OSError:
+                # Without the reset the phase reports the peak of the process so far
+                _rss['Resettable'] = False
+        _rss['Open'].append ( tracker )
+
+    return tracker
+
+
+def stop_rss_tracking(tracker):
+    with _rss_lock:
+        update_rss_peaks ()
+        _rss['Open'].remove ( tracker )
+
+    peak = tracker['Peak']
+    if not peak and resource is not None:
+        peak = resource.getrusage ( resource.RUSAGE_SELF ).ru_maxrss
+    # Child processes (the render pool) count towards the phase they were reaped in
+    children = children_peak_rss_kb ()
+    if children > tracker['Children']:
+        peak = max ( peak, children )
+
+    # ru_maxrss and VmHWM are reported in KiB on Linux
+    return round ( peak / 1024, 1 )
+
+
+def peak_rss_mb():
+    """Peak RSS of the process and its reaped children since it started."""
+    if resource is None:
+        return 0.0
+
+    # Resetting the high-water mark for the phases also lowers ru_maxrss, the peaks seen until then are kept
+    with _rss_lock:
+        update_rss_peaks ()
+        peak = max ( _rss['Peak'], resource.getrusage ( resource.RUSAGE_SELF ).ru_maxrss, children_peak_rss_kb () )
+
+    return round ( peak / 1024, 1 )
+
+
+def set_report_source(source):
+    with _report_lock:
+        _report['Source'] = source
+
+
+@contextlib.contextmanager
+def phase(name, category=None):
+    record = {'Phase': name, 'Category': category, 'Source': _report['Source'], 'Rows': 0, 'Bytes Written': 0}
+    start_wall = time.perf_counter ()
+    start_cpu = cpu_time ()
+    rss_tracker = start_rss_tracking ()
+    profile_session = profile_phase_start ()
+
+    try:
+        yield record
+    finally:
+        profile_phase_stop ( profile_session, name, category, record['Source'] )
+        wall_time = time.perf_counter () - start_wall
+        record['Wall Time (s)'] = round ( wall_time, 3 )
+        record['CPU Time (s)'] = round ( cpu_time () - start_cpu, 3 )
+        record['Rows/s'] = round ( record['Rows'] / wall_time, 1 ) if wall_time > 0 else 0.0
+        record['Peak RSS (MB)'] = stop_rss_tracking ( rss_tracker )
+
+        with _report_lock:
+            _report['Phases'].append ( record )
+
+
+def take_report_phases():
+    with _report_lock:
+        phases, _report['Phases'] = _report['Phases'], []
+
+    return phases
+
+
+def write_report(report_file):
+    with _report_lock:
+        phases = list ( _report['Phases'] )
+
+    with open ( report_file, 'w' ) as file:
+        json.dump ( {'Phases': phases, 'Peak RSS (MB)': peak_rss_mb ()}, file, indent=4 )
+    logging.info ( f"Saved performance report to {report_file}" )
+
+
+def log_report_summary(phases=None):
+    if phases is None:
+        with _report_lock:
+            phases = list ( _report['Phases'] )
+
+    if not phases:
+        return None
+
+    rows = [[str ( record.get ( column ) if record.get ( column ) is not None else '-' ) for column in REPORT_COLUMNS]
+            for record in phases]
+    for row, record in zip ( rows, phases ):
+        if record['Source']:
+            row[1] = f"{record['Source']}/{row[1]}" if record['Category'] else record['Source']
+    log_table ( "Performance Summary", REPORT_COLUMNS, rows )
+
+
+def log_table(title, columns, rows):
+    """Logs rows of strings as a table with aligned columns."""
+    widths = [max ( len ( column ), *(len ( row[i] ) for row in rows) ) for i, column in enumerate ( columns )]
+
+    logging.info ( title )
+    logging.info ( '  '.join ( column.ljust ( width ) for column, width in zip ( columns, widths ) ) )
+    for row in rows:
+        logging.info ( '  '.join ( value.ljust ( width ) for value, width in zip ( row, widths ) ) )
@@ -1,8 +1,8 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 
-from absl import logging
-
-from helper.general import remove_outliers, generate_statistics, MAX_WORKERS, create_histogram
+from helper.clustering import k_means_statistics
+from helper.execution import run_tasks
+from helper.general import remove_outliers, generate_statistics, create_histogram, group_query
 
 QUERY_KERNEL = """ 
 WITH
@@ -33,14 +33,14 @@ LEFT JOIN
     ON ids.id = summary.nameId
 ORDER BY 2 DESC
 """
-QUERY_KERNEL_STATS = """
+QUERY_KERNEL_STATS_TEMPLATE = """
 WITH
     kernel_summary AS (
         SELECT
             KERNEL.shortname AS kernel_id,
             KERNEL.end - KERNEL.start AS execution_time,
             KERNEL.start as kernel_start,
-            KERNEL.correlationId as correlation_id
+            KERNEL.correlationId as correlation_id{dimension}
         FROM
             CUPTI_ACTIVITY_KIND_KERNEL AS KERNEL
         JOIN
@@ -64,7 +64,7 @@ SELECT
     KS.kernel_id AS "ID",
     KS.execution_time AS "Execution time",
     RS.launch_overhead AS "Launch overhead",
-    KS.kernel_start - RS.runtime_end AS "Slack"
+    KS.kernel_start - RS.runtime_end AS "Slack"{dimension_column}
 FROM
     kernel_summary AS KS
 LEFT JOIN
@@ -73,6 +73,8 @@ ON
     RS.correlationId = KS.correlation_id
 """
 
+QUERY_KERNEL_STATS = group_query(QUERY_KERNEL_STATS_TEMPLATE)
+
 KERNEL_REQUIRED_TABLES = ['CUPTI_ACTIVITY_KIND_KERNEL', 'CUPTI_ACTIVITY_KIND_RUNTIME', 'StringIds']
 
 
@@ -135,28 +137,11 @@ def parse_kernel_data(data):
     return id, results_dict
 
 
-def parallel_parse_kernel_data(queries_res):
-    total_tasks = len(queries_res)
-    completed_tasks = 0
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = []
-        for data in queries_res:
-            future = executor.submit(parse_kernel_data, data)
-            futures.append(future)
-
-        results = []
-        for future in as_completed(futures):
-            results.append(future.result())
-            completed_tasks += 1
+def parallel_parse_kernel_data(queries_res, execution=None):
+    return run_tasks(execution, 'CPU', parse_kernel_data, queries_res, log_progress=True)
 
-            if int((completed_tasks / total_tasks) * 100) % 10 == 0:
-                logging.info(f"Progress: {(completed_tasks / total_tasks) * 100:.1f}%")
 
-    return results
-
-
-def create_specific_kernel_stats(kernel_stats, label, handle_outliers=False):
+def create_specific_kernel_stats(kernel_stats, label, handle_outliers=False, execution=None):
     dict = {}
     cluster_data = []
     combined_raw_data = []
@@ -164,7 +149,7 @@ def create_specific_kernel_stats(kernel_stats, label, handle_outliers=False):
     for kernel_id, kernel_info in kernel_stats.items():
         if kernel_info[label]:
             if kernel_info[label]["Raw Data"]:
-                combined_raw_data.extend(kernel_info[label]["Raw Data"])
+                combined_raw_data.append(np.asarray(kernel_info[label]["Raw Data"], dtype=float))
             if kernel_info[label]['Mean'] and kernel_info[label]['Median'] and kernel_info[
                 "Instance"]:
                 cluster_data.append([kernel_info[label]['Mean'], kernel_info[label]['Median'],
@@ -172,23 +157,23 @@ def create_specific_kernel_stats(kernel_stats, label, handle_outliers=False):
 
     if handle_outliers and cluster_data: cluster_data = remove_outliers(cluster_data)
     if combined_raw_data:
+        combined_raw_data = np.concatenate(combined_raw_data)
         dict.update(generate_statistics(combined_raw_data, label, disable_raw=True))
+        dict[label]['Raw Data'] = combined_raw_data
         dict[label]['Distribution'] = create_histogram(combined_raw_data)
     if cluster_data:
-        dict[label]['k-mean'] = {'Raw Data': cluster_data}
+        dict[label]['k-mean'] = k_means_statistics(cluster_data, execution)
 
     return dict
 
 
-def parallel_create_general_kernel_stats(kernel_stats):
+def parallel_create_general_kernel_stats(kernel_stats, execution=None):
     general_stats = {}
     tasks = ['Execution Duration', 'Launch Overhead', 'Slack']
 
-    with ThreadPoolExecutor(max_workers=len(tasks) if MAX_WORKERS > len(tasks) else MAX_WORKERS) as executor:
-        futures = {executor.submit(create_specific_kernel_stats, kernel_stats, task): task for task in tasks}
-
-        for future in as_completed(futures):
-            result = future.result()
-            general_stats.update(result)
+    results = run_tasks(execution, 'CPU', lambda task: create_specific_kernel_stats(kernel_stats, task,
+                                                                                      execution=execution), tasks)
+    for result in results:
+        general_stats.update(result)
 
     return general_stats
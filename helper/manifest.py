@@ -0,0 +1,122 @@
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+from absl import logging
+
+from helper.output import track_outputs
+
+MANIFEST_NAME = '.nav_manifest.json'
+
+_manifest_lock = threading.Lock()
+_manifest = None
+
+
+def json_default(value):
+    # Large arrays are hashed from their buffer instead of being expanded into JSON
+    if isinstance ( value, np.ndarray ):
+        return f'ndarray:{value.dtype}:{value.shape}:' + hashlib.sha256 ( np.ascontiguousarray ( value ).tobytes () ).hexdigest ()
+    if hasattr ( value, 'tolist' ):
+        return value.tolist ()
+    return str ( value )
+
+
+def artifact_state(function, args, kwargs):
+    # Artifacts are identified by their exporter and the string arguments (directory, title, metric)
+    identity = [str ( arg ) for arg in args if isinstance ( arg, str )]
+    identity += [f'{name}={value}' for name, value in sorted ( kwargs.items () ) if isinstance ( value, str )]
+    key = function.__module__ + '.' + function.__name__ + ':' + '|'.join ( identity )
+
+    version = getattr ( sys.modules[function.__module__], 'RENDERER_VERSION', 0 )
+    hasher = hashlib.sha256 ()
+    hasher.update ( f'{key}:{version}'.encode () )
+    hasher.update ( json.dumps ( [args, kwargs], sort_keys=True, default=json_default ).encode () )
+
+    return key, hasher.hexdigest ()
+
+
+def load_manifest(output_dir, force_regenerate=False):
+    global _manifest
+
+    manifest_file = os.path.join ( output_dir, MANIFEST_NAME )
+    artifacts = {}
+
+    if not force_regenerate and os.path.exists ( manifest_file ):
+        try:
+            with open ( manifest_file, 'r' ) as file:
+                artifacts = json.load ( file )
+        except (OSError, ValueError) as e:
+            logging.warning ( f"Ignoring unreadable manifest {manifest_file}: {e}" )
+
+    with _manifest_lock:
+        _manifest = {'File': manifest_file, 'Root': output_dir, 'Previous': artifacts, 'Current': {}, 'Reused': 0,
+                     'Regenerated': 0}
+
+
+def outputs_exist(entry, root):
+    # Entries of older manifests hold only the digest, their outputs are unknown and regenerated once
+    return isinstance ( entry, dict ) and all ( os.path.exists ( os.path.join ( root, path ) ) for path in entry['Outputs'] )
+
+
+def check_artifact(function, args, kwargs):
+    if _manifest is None:
+        return None, True
+
+    key, digest = artifact_state ( function, args, kwargs )
+    with _manifest_lock:
+        entry = _manifest['Previous'].get ( key )
+        if outputs_exist ( entry, _manifest['Root'] ) and entry['Digest'] == digest:
+            _manifest['Current'][key] = entry
+            _manifest['Reused'] += 1
+            return None, False
+
+    return (key, digest), True
+
+
+def record_artifact(artifact, outputs=()):
+    """Records a regenerated artifact with the paths it wrote, so it is regenerated again if one of them is deleted."""
+    if _manifest is None or artifact is None:
+        return None
+
+    key, digest = artifact
+    with _manifest_lock:
+        _manifest['Current'][key] = {'Digest': digest,
+                                     'Outputs': sorted ( set ( os.path.relpath ( path, _manifest['Root'] )
+                                                               for path in outputs ) )}
+        _manifest['Regenerated'] += 1
+
+
+def save_manifest():
+    global _manifest
+
+    if _manifest is None:
+        return None
+
+    with _manifest_lock:
+        manifest, _manifest = _manifest, None
+
+    # Keep entries of artifacts that were not requested this run (e.g. disabled outputs)
+    artifacts = dict ( manifest['Previous'] )
+    artifacts.update ( manifest['Current'] )
+    with open ( manifest['File'], 'w' ) as file:
+        json.dump ( artifacts, file, indent=1, sort_keys=True )
+
+    logging.info ( f"Artifacts reused: {manifest['Reused']}, regenerated: {manifest['Regenerated']}" )
+
+
+def incremental_artifact(function):
+    @functools.wraps ( function )
+    def wrapper(*args, **kwargs):
+        artifact, stale = check_artifact ( function, args, kwargs )
+        if not stale:
+            return None
+        with track_outputs () as outputs:
+            result = function ( *args, **kwargs )
+        record_artifact ( artifact, outputs )
+        return result
+
+    return wrapper
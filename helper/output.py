@@ -0,0 +1,195 @@
+import contextlib
+import io
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+
+from absl import logging
+
+SINK_TYPES = ['filesystem', 'zip', 'tar', 'null']
+ARCHIVE_QUEUE_SIZE = 256
+
+_sink_lock = threading.Lock()
+_sink = None
+_bytes_written = 0
+_tracked = threading.local ()
+
+
+def archive_writer(sink):
+    archive = sink['Archive']
+    while True:
+        entry = sink['Queue'].get ()
+        if entry is None:
+            break
+        if sink['Error'] is not None:
+            continue
+
+        name, data = entry
+        if name in sink['Names']:
+            # A second entry with the same name would shadow the first when the archive is extracted
+            base, extension = os.path.splitext ( name )
+            copies = 2
+            while f'{base}_{copies}{extension}' in sink['Names']:
+                copies += 1
+            logging.warning ( f"{name} was already written to {sink['File']}, writing {base}_{copies}{extension}" )
+            name = f'{base}_{copies}{extension}'
+        sink['Names'].add ( name )
+
+        try:
+            if sink['Type'] == 'zip':
+                # Figures are already compressed, deflating them only costs time
+                compress_type = zipfile.ZIP_STORED if name.endswith ( '.png' ) else zipfile.ZIP_DEFLATED
+                archive.writestr ( name, data, compress_type=compress_type )
+            else:
+                info = tarfile.TarInfo ( name )
+                info.size = len ( data )
+                info.mtime = int ( time.time () )
+                archive.addfile ( info, io.BytesIO ( data ) )
+            sink['Entries'] += 1
+        except Exception as e:
+            sink['Error'] = e
+
+
+def open_sink(output_root, sink_type='filesystem'):
+    global _sink
+
+    if sink_type not in SINK_TYPES and sink_type != 'collect':
+        raise ValueError ( f"Unknown output sink '{sink_type}', expected one of {', '.join ( SINK_TYPES )}" )
+
+    sink = {'Type': sink_type, 'Root': os.path.normpath ( output_root ), 'Archive': None, 'Queue': None,
+            'Thread': None, 'Error': None, 'Collected': [], 'Entries': 0, 'Names': set ()}
+
+    if sink_type in ('zip', 'tar'):
+        archive_file = sink['Root'] + '.' + sink_type
+        if sink_type == 'zip':
+            sink['Archive'] = zipfile.ZipFile ( archive_file, 'w', zipfile.ZIP_DEFLATED )
+        else:
+            sink['Archive'] = tarfile.open ( archive_file, 'w' )
+        sink['File'] = archive_file
+        sink['Queue'] = queue.Queue ( maxsize=ARCHIVE_QUEUE_SIZE )
+        sink['Thread'] = threading.Thread ( target=archive_writer, args=(sink,), daemon=True )
+        sink['Thread'].start ()
+        logging.info ( f"Writing tables and figures to {archive_file}" )
+
+    with _sink_lock:
+        _sink = sink
+
+
+def get_sink_type():
+    return 'filesystem' if _sink is None else _sink['Type']
+
+
+def close_sink():
+    global _sink
+
+    with _sink_lock:
+        sink, _sink = _sink, None
+
+    if sink is None or sink['Archive'] is None:
+        return None
+
+    sink['Queue'].put ( None )
+    sink['Thread'].join ()
+    sink['Archive'].close ()
+
+    if sink['Error'] is not None:
+        raise sink['Error']
+    logging.info ( f"Wrote {sink['Entries']} entries to {sink['File']}" )
+
+
+def count_bytes_written(num_bytes):
+    global _bytes_written
+
+    with _sink_lock:
+        _bytes_written += num_bytes
+
+
+def take_bytes_written():
+    global _bytes_written
+
+    with _sink_lock:
+        num_bytes, _bytes_written = _bytes_written, 0
+
+    return num_bytes
+
+
+def collect_outputs():
+    # Used by render workers to hand their buffered outputs back to the process owning the archive
+    if _sink is None or _sink['Type'] != 'collect':
+        return []
+
+    with _sink_lock:
+        collected, _sink['Collected'] = _sink['Collected'], []
+
+    return collected
+
+
+@contextlib.contextmanager
+def track_outputs():
+    # Paths written by the current thread while the block runs, recorded in the manifest with their artifact
+    _tracked.paths = []
+    try:
+        yield _tracked.paths
+    finally:
+        _tracked.paths = None
+
+
+def note_output(path):
+    paths = getattr ( _tracked, 'paths', None )
+    if paths is not None:
+        paths.append ( path )
+
+
+def write_output(path, data):
+    note_output ( path )
+    sink_type = get_sink_type ()
+    if sink_type == 'filesystem':
+        with open ( path, 'wb' ) as file:
+            file.write ( data )
+    elif sink_type == 'collect':
+        with _sink_lock:
+            _sink['Collected'].append ( (path, data) )
+        return None
+    elif sink_type in ('zip', 'tar'):
+        name = os.path.relpath ( os.path.normpath ( path ), _sink['Root'] )
+        _sink['Queue'].put ( (name, data) )
+    else:
+        return None
+
+    count_bytes_written ( len ( data ) )
+
+
+def make_dirs(path):
+    if get_sink_type () == 'filesystem':
+        os.makedirs ( path, exist_ok=True )
+
+
+@contextlib.contextmanager
+def open_output(path, mode='w', newline=None):
+    if get_sink_type () == 'filesystem':
+        note_output ( path )
+        with open ( path, mode, newline=newline ) as file:
+            yield file
+        count_bytes_written ( os.path.getsize ( path ) )
+        return
+
+    buffer = io.BytesIO () if 'b' in mode else io.StringIO ( newline=newline )
+    yield buffer
+
+    data = buffer.getvalue ()
+    write_output ( path, data if isinstance ( data, bytes ) else data.encode () )
+
+
+def save_figure(fig, path, **kwargs):
+    if get_sink_type () == 'filesystem':
+        note_output ( path )
+        fig.savefig ( path, **kwargs )
+        count_bytes_written ( os.path.getsize ( path ) )
+        return None
+
+    buffer = io.BytesIO ()
+    fig.savefig ( buffer, format=os.path.splitext ( path )[1][1:] or 'png', **kwargs )
+    write_output ( path, buffer.getvalue () )
@@ -0,0 +1,188 @@
+import collections
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+import types
+
+from absl import logging
+
+PROFILE_MODES = ['cprofile', 'tracemalloc', 'sample']
+PROFILE_EXTENSIONS = {'cprofile': '.pstats', 'tracemalloc': '.tracemalloc', 'sample': '.folded'}
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+
+_profile_lock = threading.Lock()
+_profile = {'Mode': None, 'Dir': None, 'Count': 0, 'Active': None}
+
+
+def configure_profiling(mode, profile_dir=None):
+    if mode is not None and mode not in PROFILE_MODES:
+        raise ValueError ( f"Unknown profile mode '{mode}', expected one of {', '.join ( PROFILE_MODES )}" )
+
+    if mode is not None and profile_dir is not None:
+        os.makedirs ( profile_dir, exist_ok=True )
+        logging.info ( f"Saving {mode} profiles for each phase to {profile_dir}" )
+
+    with _profile_lock:
+        _profile.update ( {'Mode': mode, 'Dir': profile_dir, 'Count': 0, 'Active': None} )
+
+
+def get_profile_mode():
+    return _profile['Mode']
+
+
+def stack_sampler(session):
+    sampler_id = threading.get_ident ()
+
+    while not session['Stop'].wait ( SAMPLE_INTERVAL ):
+        for thread_id, frame in sys._current_frames ().items ():
+            if thread_id == sampler_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append ( f"{code.co_name} ({os.path.basename ( code.co_filename )}:{code.co_firstlineno})" )
+                frame = frame.f_back
+            session['Samples'][';'.join ( reversed ( stack ) )] += 1
+
+
+def start_profile(mode):
+    session = {'Mode': mode, 'Lock': threading.Lock (), 'Workers': [], 'Tasks': {}}
+
+    if mode == 'cprofile':
+        session['Profile'] = cProfile.Profile ()
+        session['Profile'].enable ()
+    elif mode == 'tracemalloc':
+        tracemalloc.start ( TRACEMALLOC_FRAMES )
+    elif mode == 'sample':
+        session['Samples'] = collections.Counter ()
+        session['Stop'] = threading.Event ()
+        session['Thread'] = threading.Thread ( target=stack_sampler, args=(session,), daemon=True )
+        session['Thread'].start ()
+
+    return session
+
+
+def stop_profile(session):
+    # Returns picklable profile data so render worker processes can send theirs back to the parent
+    mode = session['Mode']
+
+    if mode == 'cprofile':
+        session['Profile'].disable ()
+        session['Profile'].create_stats ()
+        stats = dict ( session['Profile'].stats )
+        with session['Lock']:
+            merge_pstats ( stats, session['Tasks'] )
+        return stats
+    elif mode == 'tracemalloc':
+        snapshot = tracemalloc.take_snapshot ()
+        tracemalloc.stop ()
+        return snapshot
+    elif mode == 'sample':
+        session['Stop'].set ()
+        session['Thread'].join ()
+        return session['Samples']
+
+    return None
+
+
+def profile_task(function):
+    """Wraps a task submitted to a worker pool so that cProfile also sees it on Python < 3.12.
+
+    Before 3.12 cProfile only sees the thread that enabled it, and the pool threads outlive the phases, so each task
+    is profiled on its own worker and merged into the active phase."""
+    session = _profile['Active']
+    if session is None or session['Mode'] != 'cprofile' or sys.version_info >= (3, 12):
+        return function
+
+    def profiled_task(*args, **kwargs):
+        # Tasks run inline by a nested batch are already covered by the profile of the task that runs them
+        if sys.getprofile () is not None:
+            return function ( *args, **kwargs )
+
+        task_profile = cProfile.Profile ()
+        task_profile.enable ()
+        try:
+            return function ( *args, **kwargs )
+        finally:
+            task_profile.disable ()
+            task_profile.create_stats ()
+            with session['Lock']:
+                merge_pstats ( session['Tasks'], task_profile.stats )
+
+    return profiled_task
+
+
+def merge_pstats(stats, other_stats):
+    if not other_stats:
+        return None
+    if not stats:
+        stats.update ( other_stats )
+        return None
+
+    merged = pstats.Stats ( types.SimpleNamespace ( create_stats=lambda: None, stats=dict ( stats ) ) )
+    merged.add ( types.SimpleNamespace ( create_stats=lambda: None, stats=other_stats ) )
+    stats.clear ()
+    stats.update ( merged.stats )
+
+
+def merge_profile_data(data):
+    session = _profile['Active']
+    if session is None or data is None:
+        return None
+
+    with session['Lock']:
+        session['Workers'].append ( data )
+
+
+def save_profile(session, data, filename):
+    mode = session['Mode']
+    workers = session['Workers']
+
+    if mode == 'cprofile':
+        for worker_stats in workers:
+            merge_pstats ( data, worker_stats )
+        # Same marshalled format as pstats.Stats.dump_stats, readable with pstats or snakeviz
+        with open ( filename, 'wb' ) as file:
+            marshal.dump ( data, file )
+    elif mode == 'tracemalloc':
+        # Snapshots cannot be merged, each render process keeps its own next to the parent snapshot
+        data.dump ( filename )
+        for i, worker_snapshot in enumerate ( workers ):
+            worker_snapshot.dump ( filename.replace ( '.tracemalloc', f'.process{i}.tracemalloc' ) )
+    elif mode == 'sample':
+        for worker_samples in workers:
+            data.update ( worker_samples )
+        with open ( filename, 'w' ) as file:
+            for stack, count in data.most_common ():
+                file.write ( f"{stack} {count}\n" )
+
+
+def profile_phase_start():
+    mode = _profile['Mode']
+    # Nested phases are covered by the outer phase's profile
+    if mode is None or _profile['Dir'] is None or _profile['Active'] is not None:
+        return None
+
+    session = start_profile ( mode )
+    _profile['Active'] = session
+    return session
+
+
+def profile_phase_stop(session, name, category=None, source=None):
+    if session is None:
+        return None
+
+    data = stop_profile ( session )
+    _profile['Active'] = None
+
+    with _profile_lock:
+        _profile['Count'] += 1
+        index = _profile['Count']
+    parts = [f'{index:02d}'] + [part for part in (source, name, category) if part]
+    filename = os.path.join ( _profile['Dir'], '_'.join ( parts ).replace ( ' ', '_' ) + PROFILE_EXTENSIONS[session['Mode']] )
+    save_profile ( session, data, filename )
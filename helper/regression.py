@@ -0,0 +1,139 @@
+import json
+import math
+import time
+
+from absl import logging
+
+from helper.extraction import STATISTICS_SECTIONS
+from helper.instrumentation import log_table
+from helper.service import load_section, section_names
+
+# Metric whose statistic is compared for each category (NVTX ranges are the communication category)
+REGRESSION_METRICS = {'Kernel': 'Execution Duration', 'Transfer': 'Transfer Durations',
+                      'Communication': 'Execution Duration'}
+REGRESSION_STATISTICS = ['Mean', 'Median', 'Minimum', 'Maximum']
+REGRESSION_EXIT_CODE = 3
+REPORT_COLUMNS = ['Category', 'Name', 'Status', 'Baseline', 'Candidate', 'Change (%)', 'p-value', 'Time Share (%)']
+
+
+def index_items(nav_file, category):
+    """Summary of every item of category by name, an empty dictionary if the NAV file has no such section."""
+    section, individual = STATISTICS_SECTIONS[category]
+    if section not in section_names ( nav_file ):
+        return {}
+
+    items = load_section ( nav_file, section ).get ( individual ) or {}
+    return {str ( item.get ( 'Name', key ) ): item for key, item in items.items ()}
+
+
+def covered_items(items, coverage):
+    """Names of the items that make up the first coverage percent of the total time, longest first."""
+    ranked = sorted ( items, key=lambda name: -(items[name].get ( 'Time Total' ) or 0) )
+    total = sum ( items[name].get ( 'Time Total' ) or 0 for name in ranked )
+    selected = []
+    covered = 0
+
+    for name in ranked:
+        if selected and covered >= total * coverage / 100:
+            break
+        selected.append ( name )
+        covered += items[name].get ( 'Time Total' ) or 0
+
+    return selected, total
+
+
+def welch_p_value(baseline, candidate, metric):
+    # Welch's t-test from the stored mean, standard deviation and instance count, no raw data is needed
+    from scipy.stats import ttest_ind_from_stats
+
+    samples = []
+    for item in (baseline, candidate):
+        statistics = item.get ( metric ) or {}
+        samples.append ( (statistics.get ( 'Mean' ), statistics.get ( 'Standard Deviation' ), item.get ( 'Instance' )) )
+    if any ( value is None for sample in samples for value in sample ) or min ( sample[2] for sample in samples ) < 2:
+        return None
+
+    (mean_1, std_1, count_1), (mean_2, std_2, count_2) = samples
+    p_value = ttest_ind_from_stats ( mean_1, std_1, count_1, mean_2, std_2, count_2, equal_var=False,
+                                     alternative='less' ).pvalue
+    return None if math.isnan ( p_value ) else float ( p_value )
+
+
+def compare_category(baseline_file, candidate_file, category, threshold, coverage, statistic, test, alpha):
+    metric = REGRESSION_METRICS[category]
+    baseline = index_items ( baseline_file, category )
+    candidate = index_items ( candidate_file, category )
+    selected, total = covered_items ( baseline, coverage )
+    rows = []
+
+    for name in selected:
+        share = round ( 100 * (baseline[name].get ( 'Time Total' ) or 0) / total, 2 ) if total else None
+        row = {'Category': category, 'Name': name, 'Metric': metric, 'Statistic': statistic, 'Time Share (%)': share}
+        if name not in candidate:
+            rows.append ( {**row, 'Status': 'Missing'} )
+            continue
+
+        before = (baseline[name].get ( metric ) or {}).get ( statistic )
+        after = (candidate[name].get ( metric ) or {}).get ( statistic )
+        if not before or after is None:
+            rows.append ( {**row, 'Status': 'No Data', 'Baseline': before, 'Candidate': after} )
+            continue
+
+        change = 100 * (after - before) / before
+        p_value = welch_p_value ( baseline[name], candidate[name], metric ) if test else None
+        regressed = change > threshold and (not test or (p_value is not None and p_value < alpha))
+        rows.append ( {**row, 'Status': 'Regressed' if regressed else 'Improved' if change < -threshold else 'Unchanged',
+                       'Baseline': before, 'Candidate': after, 'Change (%)': round ( change, 3 ), 'p-value': p_value} )
+
+    # Items that only the candidate has are reported, but not judged
+    rows.extend ( {'Category': category, 'Name': name, 'Metric': metric, 'Statistic': statistic, 'Status': 'New',
+                   'Candidate': (candidate[name].get ( metric ) or {}).get ( statistic )}
+                  for name in candidate if name not in baseline )
+    return rows
+
+
+def check_regressions(baseline_file, candidate_file, threshold=5.0, coverage=95.0, statistic='Median', test=False,
+                      alpha=0.05, categories=tuple ( REGRESSION_METRICS )):
+    """Compares the candidate NAV file with the baseline using only their summary sections.
+
+    The kernels, transfers and NVTX ranges that make up coverage percent of the baseline time regress when statistic
+    of their duration grows by more than threshold percent (and, with test, Welch's t-test on the stored means finds
+    the candidate slower at significance alpha). Returns the report as a dictionary."""
+    if statistic not in REGRESSION_STATISTICS:
+        raise ValueError ( f"Unknown statistic {statistic}, expected one of {REGRESSION_STATISTICS}" )
+
+    start_time = time.perf_counter ()
+    items = []
+    for category in categories:
+        items.extend ( compare_category ( baseline_file, candidate_file, category, threshold, coverage, statistic, test,
+                                          alpha ) )
+
+    durations = [load_section ( nav_file, 'Total Duration' ) if 'Total Duration' in section_names ( nav_file ) else None
+                 for nav_file in (baseline_file, candidate_file)]
+    regressions = [item for item in items if item['Status'] == 'Regressed']
+
+    return {'Baseline': baseline_file, 'Candidate': candidate_file, 'Threshold (%)': threshold,
+            'Coverage (%)': coverage, 'Statistic': statistic, 'Test': 'Welch t-test' if test else None,
+            'Alpha': alpha if test else None, 'Total Duration': {'Baseline': durations[0], 'Candidate': durations[1]},
+            'Passed': not regressions, 'Regressions': len ( regressions ), 'Items': items,
+            'Elapsed (s)': round ( time.perf_counter () - start_time, 3 )}
+
+
+def report_regressions(report, report_file=None):
+    def cell(value):
+        return '-' if value is None else f'{value:.4g}' if isinstance ( value, float ) else str ( value )
+
+    shown = [item for item in report['Items'] if item['Status'] in ('Regressed', 'Missing')]
+    if shown:
+        log_table ( "Regressions", REPORT_COLUMNS, [[cell ( item.get ( column ) ) for column in REPORT_COLUMNS]
+                                                    for item in shown] )
+
+    judged = sum ( item['Status'] not in ('New', 'Missing', 'No Data') for item in report['Items'] )
+    logging.info ( f"{'PASSED' if report['Passed'] else 'FAILED'}: {report['Regressions']} of {judged} compared items "
+                   f"regressed by more than {report['Threshold (%)']}% ({report['Statistic']}) "
+                   f"in {report['Elapsed (s)']:.2f}s" )
+
+    if report_file:
+        with open ( report_file, 'w' ) as file:
+            json.dump ( report, file, indent=4 )
+        logging.info ( f"Saved regression report to {report_file}" )
@@ -0,0 +1,118 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from absl import logging
+
+from helper.execution import get_execution_context
+from helper.manifest import check_artifact, record_artifact
+from helper.output import open_sink, get_sink_type, collect_outputs, write_output, count_bytes_written, \
+    take_bytes_written, track_outputs
+from helper.profiling import configure_profiling, get_profile_mode, start_profile, stop_profile, merge_profile_data
+
+BATCHES_PER_WORKER = 4
+
+_render_pool = None
+
+
+def init_render_worker(sink_type, profile_mode=None):
+    configure_profiling ( profile_mode )
+
+    # Archive outputs are buffered and sent back so that only the parent's writer thread touches the archive
+    if sink_type != 'filesystem':
+        open_sink ( '.', sink_type if sink_type == 'null' else 'collect' )
+
+    import matplotlib
+    matplotlib.use ( 'Agg' )
+
+    from matplotlib import pyplot as plt
+    from helper.figures import FIGURE_RC_PARAMS
+    plt.rcParams.update ( FIGURE_RC_PARAMS )
+
+
+def render_batch(job_groups):
+    # Paths written by each job, in job order, so the parent records them in the manifest
+    job_outputs = []
+    profile_mode = get_profile_mode ()
+    profile_session = start_profile ( profile_mode ) if profile_mode else None
+
+    for jobs in job_groups:
+        for plot_function, args, kwargs, _ in jobs:
+            with track_outputs () as outputs:
+                plot_function ( *args, **kwargs )
+            job_outputs.append ( outputs )
+
+    profile_data = stop_profile ( profile_session ) if profile_session else None
+
+    return job_outputs, collect_outputs (), take_bytes_written (), profile_data
+
+
+def dispatch_figure(figure_jobs, plot_function, *args, **kwargs):
+    artifact, stale = check_artifact ( plot_function, args, kwargs )
+    if not stale:
+        return None
+
+    if figure_jobs is None:
+        with track_outputs () as outputs:
+            plot_function ( *args, **kwargs )
+        record_artifact ( artifact, outputs )
+    else:
+        figure_jobs.append ( (plot_function, args, kwargs, artifact) )
+
+
+def get_render_workers(execution=None):
+    # Rendering is CPU bound, so it gets one process per CPU worker of the execution context
+    return get_execution_context ( execution )['CPU Workers']
+
+
+def get_render_pool(execution=None):
+    global _render_pool
+
+    if _render_pool is None:
+        context = multiprocessing.get_context ( 'spawn' )
+        _render_pool = ProcessPoolExecutor ( max_workers=get_render_workers ( execution ), mp_context=context,
+                                             initializer=init_render_worker,
+                                             initargs=(get_sink_type (), get_profile_mode ()) )
+
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+
+    if _render_pool is not None:
+        _render_pool.shutdown ( wait=True )
+        _render_pool = None
+
+
+def create_batches(job_groups, num_workers):
+    # Groups are never split so figures sharing a directory keep their original render order
+    batch_size = max ( 1, -(-len ( job_groups ) // (num_workers * BATCHES_PER_WORKER)) )
+
+    return [job_groups[i:i + batch_size] for i in range ( 0, len ( job_groups ), batch_size )]
+
+
+def render_figures(job_groups, execution=None):
+    job_groups = [jobs for jobs in job_groups if jobs]
+    if not job_groups:
+        return None
+
+    total_jobs = sum ( len ( jobs ) for jobs in job_groups )
+    completed_jobs = 0
+    executor = get_render_pool ( execution )
+    futures = {executor.submit ( render_batch, batch ): batch for batch in
+               create_batches ( job_groups, get_render_workers ( execution ) )}
+
+    logging.info ( f"Rendering {total_jobs} figures in {len ( futures )} batches" )
+    for future in as_completed ( futures ):
+        job_outputs, outputs, num_bytes, profile_data = future.result ()
+        merge_profile_data ( profile_data )
+        for path, data in outputs:
+            write_output ( path, data )
+        count_bytes_written ( num_bytes )
+        completed_jobs += len ( job_outputs )
+        artifacts = [artifact for jobs in futures[future] for *_, artifact in jobs]
+        for artifact, written in zip ( artifacts, job_outputs ):
+            record_artifact ( artifact, written )
+        logging.info ( f"Progress: {(completed_jobs / total_jobs) * 100:.1f}%" )
+
+    return None
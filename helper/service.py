@@ -0,0 +1,497 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from absl import logging
+
+from helper.extraction import BREAKDOWN_KEY, STATISTICS_SECTIONS
+from helper.general import nav_json_default
+from helper.timeline import TIMELINE_SECTION
+
+NAV_SUFFIX = '.nav'
+DEFAULT_CACHE_SIZE_GB = 1
+
+# Top-level keys of a NAV file written with json.dump ( ..., indent=4 ), located without parsing the file
+SECTION_PREFIX = b'\n    "'
+SECTION_KEY = re.compile ( rb'("(?:[^"\\]|\\.)*"): ' )
+
+_cache_lock = threading.Lock()
+_cache = {'Entries': OrderedDict (), 'Bytes': 0, 'Limit': int ( DEFAULT_CACHE_SIZE_GB * 2 ** 30 ), 'Hits': 0,
+          'Misses': 0}
+
+
+def configure_cache(cache_size_gb):
+    with _cache_lock:
+        _cache.update ( {'Entries': OrderedDict (), 'Bytes': 0, 'Limit': int ( cache_size_gb * 2 ** 30 ), 'Hits': 0,
+                         'Misses': 0} )
+
+
+def cache_get(key):
+    with _cache_lock:
+        entry = _cache['Entries'].get ( key )
+        if entry is None:
+            _cache['Misses'] += 1
+            return None
+        _cache['Entries'].move_to_end ( key )
+        _cache['Hits'] += 1
+        return entry[0]
+
+
+def cache_put(key, value, cost):
+    """Stores value under key and evicts the least recently used entries beyond the configured size."""
+    with _cache_lock:
+        if cost > _cache['Limit']:
+            return value
+        if key in _cache['Entries']:
+            _cache['Bytes'] -= _cache['Entries'].pop ( key )[1]
+        _cache['Entries'][key] = (value, cost)
+        _cache['Bytes'] += cost
+        while _cache['Bytes'] > _cache['Limit']:
+            _, (_, evicted_cost) = _cache['Entries'].popitem ( last=False )
+            _cache['Bytes'] -= evicted_cost
+
+    return value
+
+
+def cache_info():
+    with _cache_lock:
+        return {'Entries': len ( _cache['Entries'] ), 'Bytes': _cache['Bytes'], 'Limit': _cache['Limit'],
+                'Hits': _cache['Hits'], 'Misses': _cache['Misses']}
+
+
+def file_stamp(nav_file):
+    stat = os.stat ( nav_file )
+    return stat.st_mtime_ns, stat.st_size
+
+
+def list_nav_files(root):
+    nav_files = []
+    for directory, _, names in os.walk ( root ):
+        for name in names:
+            if name.endswith ( NAV_SUFFIX ):
+                nav_files.append ( os.path.relpath ( os.path.join ( directory, name ), root ) )
+
+    return sorted ( nav_files )
+
+
+def resolve_nav_file(root, name):
+    if not name:
+        raise ValueError ( "Missing file parameter" )
+
+    nav_file = os.path.realpath ( os.path.join ( root, name ) )
+    if os.path.commonpath ( [nav_file, root] ) != root or not nav_file.endswith ( NAV_SUFFIX ):
+        raise LookupError ( f"{name} is not a NAV file of this service" )
+    if not os.path.isfile ( nav_file ):
+        raise LookupError ( f"{name} does not exist" )
+
+    return nav_file
+
+
+def locate_sections(nav_file):
+    """Byte ranges of the top-level sections of nav_file, or None if it was not written by NAV (indent=4)."""
+    with open ( nav_file, 'rb' ) as file:
+        if os.fstat ( file.fileno () ).st_size == 0:
+            return None
+        with mmap.mmap ( file.fileno (), 0, access=mmap.ACCESS_READ ) as data:
+            if data[:2] != b'{\n':
+                return None
+
+            # Only top-level keys start a line with exactly four spaces and a quote
+            keys = []
+            position = data.find ( SECTION_PREFIX, 1 )
+            while position >= 0:
+                match = SECTION_KEY.match ( data, position + len ( SECTION_PREFIX ) - 1 )
+                if match is None:
+                    return None
+                keys.append ( (json.loads ( match.group ( 1 ) ), position, match.end ()) )
+                position = data.find ( SECTION_PREFIX, match.end () )
+
+            closing = data.rfind ( b'\n}' )
+            if not keys or closing < 0:
+                return None
+
+    # Every section but the last ends with the comma before the next key
+    ends = [position - 1 for _, position, _ in keys[1:]] + [closing]
+    return {key: (start, end) for (key, _, start), end in zip ( keys, ends )}
+
+
+def array_raw_data(value):
+    # Raw values are kept as NumPy arrays, so a cached section takes less memory than its JSON text
+    if not isinstance ( value, dict ):
+        return value
+
+    arrays = {}
+    for key, item in value.items ():
+        if key == 'Raw Data' and isinstance ( item, list ):
+            arrays[key] = np.asarray ( item )
+        elif key == 'Raw Data' and isinstance ( item, dict ):
+            # Bandwidth raw data holds a Size and a Bandwidth column
+            arrays[key] = {column: np.asarray ( values ) for column, values in item.items ()}
+        else:
+            arrays[key] = array_raw_data ( item )
+
+    return arrays
+
+
+def skip_raw_data(text):
+    """Replaces the flat raw value arrays in NAV text with null, so summaries are parsed without them."""
+    key = b'"Raw Data": ['
+    pieces = []
+    position = 0
+
+    while True:
+        start = text.find ( key, position )
+        if start < 0:
+            break
+        end = text.find ( b']', start + len ( key ) )
+        if text.find ( b'[', start + len ( key ), end ) >= 0:
+            # Nested raw data (e.g. clustering results) is left to the parser
+            pieces.append ( text[position:start + len ( key )] )
+            position = start + len ( key )
+            continue
+        pieces.extend ( [text[position:start], b'"Raw Data": null'] )
+        position = end + 1
+
+    pieces.append ( text[position:] )
+    return b''.join ( pieces )
+
+
+def strip_raw_data(value):
+    if isinstance ( value, dict ):
+        return {key: strip_raw_data ( item ) for key, item in value.items () if key != 'Raw Data'}
+
+    return value
+
+
+def section_ranges(nav_file, stamp):
+    sections = cache_get ( (nav_file, stamp, 'Sections') )
+    if sections is None:
+        sections = cache_put ( (nav_file, stamp, 'Sections'), locate_sections ( nav_file ) or {}, 1024 )
+
+    return sections
+
+
+def section_names(nav_file):
+    sections = section_ranges ( nav_file, file_stamp ( nav_file ) )
+    if sections:
+        return list ( sections )
+
+    with open ( nav_file, 'r' ) as file:
+        return list ( json.load ( file ) )
+
+
+def load_section(nav_file, section, raw=False):
+    """Returns one top-level section of nav_file, with its raw data only when raw is set.
+
+    Only the bytes of the section are parsed for NAV files written by this tool. Sections with and without raw
+    data are cached separately, so summaries of a large NAV file stay cached while its raw data is evicted."""
+    stamp = file_stamp ( nav_file )
+    form = 'Full' if raw else 'Summary'
+    value = cache_get ( (nav_file, stamp, section, form) )
+    if value is not None:
+        return value
+
+    if not raw:
+        full = cache_get ( (nav_file, stamp, section, 'Full') )
+        if full is not None:
+            value = strip_raw_data ( full )
+            return cache_put ( (nav_file, stamp, section, form), value, len ( json.dumps ( value, default=nav_json_default ) ) )
+
+    sections = section_ranges ( nav_file, stamp )
+    start_time = time.perf_counter ()
+    if section in sections:
+        start, end = sections[section]
+        with open ( nav_file, 'rb' ) as file:
+            file.seek ( start )
+            text = file.read ( end - start )
+        # Raw values are most of a NAV file, summaries parse several times faster without them
+        full = json.loads ( text if raw else skip_raw_data ( text ), parse_float=float )
+        cost = len ( text )
+    elif sections:
+        raise LookupError ( f"{os.path.basename ( nav_file )} has no {section}" )
+    else:
+        # Not written by NAV (e.g. compact JSON): the whole file has to be parsed
+        with open ( nav_file, 'r' ) as file:
+            statistics = json.load ( file, parse_float=float )
+        if section not in statistics:
+            raise LookupError ( f"{os.path.basename ( nav_file )} has no {section}" )
+        full = statistics[section]
+        cost = stamp[1]
+    logging.debug ( f"Loaded {section} of {nav_file} in {time.perf_counter () - start_time:.3f}s" )
+
+    if raw:
+        return cache_put ( (nav_file, stamp, section, form), array_raw_data ( full ), cost )
+
+    value = strip_raw_data ( full )
+    return cache_put ( (nav_file, stamp, section, form), value, len ( json.dumps ( value, default=nav_json_default ) ) )
+
+
+def category_section(category):
+    if category not in STATISTICS_SECTIONS:
+        raise ValueError ( f"Unknown category {category}, expected one of {list ( STATISTICS_SECTIONS )}" )
+    return STATISTICS_SECTIONS[category]
+
+
+def load_items(nav_file, category, raw=False, group=None):
+    """Items of category, or those of one value of the section's breakdown (device, stream, ...) when group is given."""
+    section, individual = category_section ( category )
+    general = load_section ( nav_file, section, raw )
+    if group is None:
+        return general.get ( individual ) or {}
+
+    groups = (general.get ( BREAKDOWN_KEY ) or {}).get ( 'Groups' ) or {}
+    if group not in groups:
+        raise LookupError ( f"No {category} breakdown group {group}, expected one of {list ( groups )}" )
+    return groups[group]
+
+
+def find_item(items, item):
+    # Items are keyed by kernel id, transfer type or NVTX range name; kernels are usually looked up by name
+    if item in items:
+        return item, items[item]
+    for key, value in items.items ():
+        if value.get ( 'Name' ) == item:
+            return key, value
+
+    raise LookupError ( f"No item {item}" )
+
+
+def metric_value(item, metric, statistic):
+    value = item.get ( metric )
+    if isinstance ( value, dict ):
+        value = value.get ( statistic )
+
+    return value if isinstance ( value, (int, float) ) else None
+
+
+def get_param(params, name, default=None):
+    values = params.get ( name )
+    if not values:
+        if default is None:
+            raise ValueError ( f"Missing {name} parameter" )
+        return default
+
+    return values[0]
+
+
+def optional_param(params, name):
+    return (params.get ( name ) or [None])[0]
+
+
+def int_param(params, name, default):
+    try:
+        return int ( get_param ( params, name, str ( default ) ) )
+    except ValueError:
+        raise ValueError ( f"{name} must be an integer" )
+
+
+def answer_files(root, params):
+    return {'Files': [{'File': name, 'Size': os.path.getsize ( os.path.join ( root, name ) )}
+                      for name in list_nav_files ( root )]}
+
+
+def answer_status(root, params):
+    return {'Root': root, 'Cache': cache_info ()}
+
+
+def answer_summary(root, params):
+    nav_file = resolve_nav_file ( root, get_param ( params, 'file', '' ) )
+    sections = section_names ( nav_file )
+    summary = {'File': get_param ( params, 'file' ), 'Sections': list ( sections )}
+
+    if 'Total Duration' in sections:
+        summary['Total Duration'] = load_section ( nav_file, 'Total Duration' )
+    if TIMELINE_SECTION in sections:
+        summary[TIMELINE_SECTION] = load_section ( nav_file, TIMELINE_SECTION )
+    for category, (section, individual) in STATISTICS_SECTIONS.items ():
+        if section in sections:
+            general = load_section ( nav_file, section )
+            summary[category] = {'Items': len ( general.get ( individual ) or {} ),
+                                 **{key: value for key, value in general.items () if key not in (individual, BREAKDOWN_KEY)}}
+            # Only the dimension and its values, their items are served by /items and /item with group
+            if isinstance ( general.get ( BREAKDOWN_KEY ), dict ):
+                breakdown = general[BREAKDOWN_KEY]
+                summary[category][BREAKDOWN_KEY] = {'Dimension': breakdown['Dimension'],
+                                                    'Groups': list ( breakdown['Groups'] )}
+
+    return summary
+
+
+def answer_items(root, params):
+    nav_file = resolve_nav_file ( root, get_param ( params, 'file', '' ) )
+    group = optional_param ( params, 'group' )
+    items = load_items ( nav_file, get_param ( params, 'category' ), group=group )
+    sort = get_param ( params, 'sort', 'Time Total' )
+    statistic = get_param ( params, 'statistic', 'Mean' )
+    limit = int_param ( params, 'limit', len ( items ) )
+
+    # Scalar fields only, metric statistics are served per item
+    rows = [{'Key': key, **{field: value for field, value in item.items () if not isinstance ( value, dict )}}
+            for key, item in items.items ()]
+    values = {key: metric_value ( item, sort, statistic ) for key, item in items.items ()}
+    rows.sort ( key=lambda row: (values[row['Key']] is None, -(values[row['Key']] or 0)) )
+
+    return {'Category': get_param ( params, 'category' ), 'Group': group, 'Sort': sort,
+            'Items': rows[:limit]}
+
+
+def answer_item(root, params):
+    nav_file = resolve_nav_file ( root, get_param ( params, 'file', '' ) )
+    raw = get_param ( params, 'raw', '0' ) == '1'
+    key, item = find_item ( load_items ( nav_file, get_param ( params, 'category' ), raw,
+                                         optional_param ( params, 'group' ) ),
+                            get_param ( params, 'item' ) )
+
+    return {'Key': key, **item}
+
+
+def answer_distribution(root, params):
+    nav_file = resolve_nav_file ( root, get_param ( params, 'file', '' ) )
+    metric = get_param ( params, 'metric' )
+    bins = int_param ( params, 'bins', 0 )
+    group = optional_param ( params, 'group' )
+
+    if not bins:
+        # The distribution stored in the NAV file needs no raw data
+        key, item = find_item ( load_items ( nav_file, get_param ( params, 'category' ), group=group ),
+                                get_param ( params, 'item' ) )
+        if not isinstance ( item.get ( metric ), dict ) or 'Distribution' not in item[metric]:
+            raise LookupError ( f"{key} has no {metric} distribution" )
+        return {'Key': key, 'Metric': metric, **item[metric]['Distribution']}
+    if group is not None:
+        # Breakdown groups keep statistics and distributions but no raw data to bin
+        raise ValueError ( "bins cannot be combined with group, breakdown groups have no raw data" )
+
+    key, item = find_item ( load_items ( nav_file, get_param ( params, 'category' ), True ), get_param ( params, 'item' ) )
+    raw_data = item.get ( metric, {} ).get ( 'Raw Data' ) if isinstance ( item.get ( metric ), dict ) else None
+    if raw_data is None or isinstance ( raw_data, dict ):
+        raise LookupError ( f"{key} has no {metric} raw data" )
+
+    histogram, edges = np.histogram ( raw_data, bins=bins )
+    return {'Key': key, 'Metric': metric, 'Bin Edges': edges, 'Histogram': histogram}
+
+
+def answer_compare(root, params):
+    """One row per item name with a statistic of metric in every file and its ratio to the first file."""
+    names = get_param ( params, 'files' ).split ( ',' )
+    category = get_param ( params, 'category' )
+    metric = get_param ( params, 'metric', 'Time Total' )
+    statistic = get_param ( params, 'statistic', 'Mean' )
+
+    rows = {}
+    for name in names:
+        for item in load_items ( resolve_nav_file ( root, name ), category ).values ():
+            label = str ( item.get ( 'Name', item.get ( 'Type' ) ) )
+            rows.setdefault ( label, {} )[name] = metric_value ( item, metric, statistic )
+
+    baseline = names[0]
+    comparison = []
+    for label, values in rows.items ():
+        row = {'Name': label, **{name: values.get ( name ) for name in names}}
+        for name in names[1:]:
+            if values.get ( baseline ) and values.get ( name ) is not None:
+                row[f'{name} / {baseline}'] = round ( values[name] / values[baseline], 6 )
+        comparison.append ( row )
+
+    return {'Category': category, 'Metric': metric, 'Statistic': statistic, 'Files': names, 'Items': comparison}
+
+
+ROUTES = {
+    '/files': answer_files,
+    '/status': answer_status,
+    '/summary': answer_summary,
+    '/items': answer_items,
+    '/item': answer_item,
+    '/distribution': answer_distribution,
+    '/compare': answer_compare,
+}
+
+
+def request_etag(root, path, query, params):
+    # Answers only change with the NAV files they read, so the tag is known before anything is loaded
+    names = get_param ( params, 'files', '' ).split ( ',' ) if path == '/compare' else [get_param ( params, 'file', '' )]
+    stamps = [file_stamp ( resolve_nav_file ( root, name ) ) for name in names]
+
+    return '"' + hashlib.blake2b ( repr ( (path, query, stamps) ).encode (), digest_size=16 ).hexdigest () + '"'
+
+
+def answer_request(root, target):
+    """Returns the ETag and JSON body answering target (path and query string)."""
+    url = urlsplit ( target )
+    if url.path not in ROUTES:
+        raise LookupError ( f"Unknown endpoint {url.path}, expected one of {list ( ROUTES )}" )
+    params = parse_qs ( url.query )
+
+    if url.path in ('/files', '/status'):
+        body = json.dumps ( ROUTES[url.path] ( root, params ) ).encode ()
+        return '"' + hashlib.blake2b ( body, digest_size=16 ).hexdigest () + '"', body
+
+    etag = request_etag ( root, url.path, url.query, params )
+    body = cache_get ( ('Answer', etag) )
+    if body is None:
+        body = json.dumps ( ROUTES[url.path] ( root, params ), default=nav_json_default ).encode ()
+        cache_put ( ('Answer', etag), body, len ( body ) )
+
+    return etag, body
+
+
+def create_handler(root):
+    class NAVRequestHandler ( BaseHTTPRequestHandler ):
+        def do_GET(self):
+            start_time = time.perf_counter ()
+            try:
+                etag, body = answer_request ( root, self.path )
+            except ValueError as e:
+                return self.send_json ( HTTPStatus.BAD_REQUEST, json.dumps ( {'Error': str ( e )} ).encode () )
+            except LookupError as e:
+                return self.send_json ( HTTPStatus.NOT_FOUND, json.dumps ( {'Error': str ( e ).strip ( "'" )} ).encode () )
+            except Exception as e:
+                logging.exception ( f"Failed to answer {self.path}" )
+                return self.send_json ( HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps ( {'Error': str ( e )} ).encode () )
+
+            if etag in [tag.strip () for tag in self.headers.get ( 'If-None-Match', '' ).split ( ',' )]:
+                self.send_json ( HTTPStatus.NOT_MODIFIED, None, etag )
+            else:
+                self.send_json ( HTTPStatus.OK, body, etag )
+            logging.debug ( f"Answered {self.path} in {(time.perf_counter () - start_time) * 1000:.1f}ms" )
+
+        def send_json(self, status, body, etag=None):
+            self.send_response ( status )
+            if etag is not None:
+                self.send_header ( 'ETag', etag )
+                self.send_header ( 'Cache-Control', 'no-cache' )
+            if body is not None:
+                self.send_header ( 'Content-Type', 'application/json' )
+                self.send_header ( 'Content-Length', str ( len ( body ) ) )
+            self.end_headers ()
+            if body is not None:
+                self.wfile.write ( body )
+
+        def log_message(self, format, *args):
+            logging.debug ( f"{self.address_string ()} {format % args}" )
+
+    return NAVRequestHandler
+
+
+def serve_nav_files(root, host='127.0.0.1', port=8765, cache_size_gb=DEFAULT_CACHE_SIZE_GB):
+    """Serves the NAV files below root as JSON until interrupted."""
+    root = os.path.realpath ( root )
+    configure_cache ( cache_size_gb )
+    server = ThreadingHTTPServer ( (host, port), create_handler ( root ) )
+    server.daemon_threads = True
+    logging.info ( f"Serving {len ( list_nav_files ( root ) )} NAV file(s) from {root} on http://{host}:{server.server_port}/ "
+                   f"with a {cache_size_gb} GB cache" )
+
+    try:
+        server.serve_forever ()
+    finally:
+        server.server_close ()
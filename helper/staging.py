@@ -0,0 +1,193 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+from absl import logging
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, concurrent updates of the stage cache are then not serialised
+    fcntl = None
+
+STAGE_CHUNK_SIZE = 64 * 2 ** 20
+STAGE_CACHE_NAME = '.nav_stage_cache.json'
+
+_staging_lock = threading.Lock()
+_staging = {'Dir': None, 'Cache Size': 0, 'Files': []}
+
+
+def configure_staging(stage_dir, cache_size_gb=0):
+    if stage_dir is not None:
+        os.makedirs ( stage_dir, exist_ok=True )
+
+    with _staging_lock:
+        _staging.update ( {'Dir': stage_dir, 'Cache Size': int ( cache_size_gb * 2 ** 30 ), 'Files': []} )
+
+
+def get_stage_dir():
+    return _staging['Dir']
+
+
+def load_stage_cache(stage_dir):
+    cache_file = os.path.join ( stage_dir, STAGE_CACHE_NAME )
+    if not os.path.exists ( cache_file ):
+        return {}
+
+    try:
+        with open ( cache_file, 'r' ) as file:
+            return json.load ( file )
+    except (OSError, ValueError) as e:
+        logging.warning ( f"Ignoring unreadable stage cache {cache_file}: {e}" )
+        return {}
+
+
+def save_stage_cache(stage_dir, cache):
+    cache_file = os.path.join ( stage_dir, STAGE_CACHE_NAME )
+    # Concurrent extraction processes (watch mode) share the stage directory
+    temp_file = f'{cache_file}.{os.getpid ()}.tmp'
+    with open ( temp_file, 'w' ) as file:
+        json.dump ( cache, file, indent=1, sort_keys=True )
+    os.replace ( temp_file, cache_file )
+
+
+@contextlib.contextmanager
+def update_stage_cache(stage_dir):
+    """Loads the stage cache for modification and saves it on exit, holding an exclusive lock in between.
+
+    Watch and aggregation workers in other processes share the stage directory, without the lock their updates
+    overwrite each other."""
+    with open ( os.path.join ( stage_dir, STAGE_CACHE_NAME + '.lock' ), 'a' ) as lock_file:
+        if fcntl is not None:
+            fcntl.flock ( lock_file.fileno (), fcntl.LOCK_EX )
+        cache = load_stage_cache ( stage_dir )
+        yield cache
+        save_stage_cache ( stage_dir, cache )
+
+
+def sequential_copy(source_file, destination_file):
+    # Large sequential reads are far cheaper on parallel filesystems than SQLite's random page reads
+    hasher = hashlib.blake2b ( digest_size=20 )
+    buffer = bytearray ( STAGE_CHUNK_SIZE )
+    view = memoryview ( buffer )
+
+    with open ( source_file, 'rb', buffering=0 ) as source, open ( destination_file, 'wb' ) as destination:
+        if hasattr ( os, 'posix_fadvise' ):
+            os.posix_fadvise ( source.fileno (), 0, 0, os.POSIX_FADV_SEQUENTIAL )
+        while True:
+            num_bytes = source.readinto ( buffer )
+            if not num_bytes:
+                break
+            hasher.update ( view[:num_bytes] )
+            destination.write ( view[:num_bytes] )
+
+    return hasher.hexdigest ()
+
+
+def file_checksum(file_name):
+    hasher = hashlib.blake2b ( digest_size=20 )
+    with open ( file_name, 'rb', buffering=0 ) as file:
+        for chunk in iter ( lambda: file.read ( STAGE_CHUNK_SIZE ), b'' ):
+            hasher.update ( chunk )
+
+    return hasher.hexdigest ()
+
+
+def stage_database(database_file):
+    """Copies database_file to the stage directory (or reuses a verified cached copy).
+
+    Returns the path queries should read and the number of bytes copied."""
+    stage_dir = _staging['Dir']
+    if stage_dir is None:
+        return database_file, 0
+
+    source = os.path.abspath ( database_file )
+    stat = os.stat ( source )
+    cache = load_stage_cache ( stage_dir )
+    entry = cache.get ( source )
+
+    if entry and entry['Size'] == stat.st_size and entry['Mtime'] == stat.st_mtime and os.path.exists ( entry['File'] ):
+        if file_checksum ( entry['File'] ) == entry['Checksum']:
+            with update_stage_cache ( stage_dir ) as cache:
+                # Another process may have evicted the copy while it was verified
+                reused = cache.get ( source, {} ).get ( 'File' ) == entry['File'] and os.path.exists ( entry['File'] )
+                if reused:
+                    cache[source]['Last Used'] = time.time ()
+            if reused:
+                logging.info ( f"Reusing staged copy {entry['File']} of {database_file}" )
+                track_staged_file ( entry['File'] )
+                return entry['File'], 0
+        else:
+            logging.warning ( f"Staged copy {entry['File']} failed checksum verification, staging again" )
+
+    name = os.path.basename ( database_file ).split ( '.' )[0]
+    temp_file = os.path.join ( stage_dir, f'.{name}.{os.getpid ()}.tmp' )
+    logging.info ( f"Staging {database_file} ({stat.st_size / 2 ** 30:.2f} GB) to {stage_dir}" )
+    start_time = time.perf_counter ()
+    try:
+        checksum = sequential_copy ( source, temp_file )
+    except BaseException:
+        if os.path.exists ( temp_file ):
+            os.remove ( temp_file )
+        raise
+    elapsed = time.perf_counter () - start_time
+
+    staged_file = os.path.join ( stage_dir, f'{name}-{checksum[:16]}.sqlite' )
+    os.replace ( temp_file, staged_file )
+    logging.info ( f"Staged {database_file} in {elapsed:.1f}s ({stat.st_size / 2 ** 20 / max ( elapsed, 1e-9 ):.0f} MB/s)" )
+
+    with update_stage_cache ( stage_dir ) as cache:
+        cache[source] = {'Size': stat.st_size, 'Mtime': stat.st_mtime, 'Checksum': checksum, 'File': staged_file,
+                         'Last Used': time.time ()}
+    track_staged_file ( staged_file )
+
+    return staged_file, stat.st_size
+
+
+def track_staged_file(file_name):
+    with _staging_lock:
+        if file_name not in _staging['Files']:
+            _staging['Files'].append ( file_name )
+
+
+def remove_staged_file(file_name):
+    if os.path.exists ( file_name ):
+        os.remove ( file_name )
+        logging.info ( f"Removed staged file {file_name}" )
+
+
+def release_staged_files():
+    """Removes this run's staged files, or keeps them as a cache trimmed to the configured size (oldest first)."""
+    stage_dir = _staging['Dir']
+    if stage_dir is None:
+        return None
+
+    with _staging_lock:
+        files, _staging['Files'] = _staging['Files'], []
+
+    with update_stage_cache ( stage_dir ) as cache:
+        cached_files = {entry['File'] for entry in cache.values ()}
+
+        if _staging['Cache Size'] <= 0:
+            for file_name in files:
+                remove_staged_file ( file_name )
+            for source in [source for source, entry in cache.items () if entry['File'] in files]:
+                del cache[source]
+        else:
+            # Files that are not cache entries (e.g. indexed sidecars of staged copies) never outlive the run
+            for file_name in files:
+                if file_name not in cached_files:
+                    remove_staged_file ( file_name )
+
+            total_size = sum ( os.path.getsize ( entry['File'] ) for entry in cache.values ()
+                               if os.path.exists ( entry['File'] ) )
+            for source, entry in sorted ( cache.items (), key=lambda item: item[1]['Last Used'] ):
+                if total_size <= _staging['Cache Size']:
+                    break
+                if os.path.exists ( entry['File'] ):
+                    total_size -= os.path.getsize ( entry['File'] )
+                    remove_staged_file ( entry['File'] )
+                del cache[source]
+
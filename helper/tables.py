@@ -1,5 +1,10 @@
 import csv
 
+from helper.manifest import incremental_artifact
+from helper.output import open_output
+
+RENDERER_VERSION = 1
+
 
 def latex_safe_string(title):
     translation_table = str.maketrans ( {char: f'\{char}' for char in '\`*_{}[]()<>#+-.!$:;,/'} )
@@ -7,43 +12,45 @@ def latex_safe_string(title):
     return latex_safe_title
 
 
-def export_single_general_stat_to_latex(data_dict, parent_dir, title):
+def write_general_stat_latex_table(latexfile, data_dict, title):
     underscore_title = title.replace ( ' ', '_' )
-    latex_filename = parent_dir + f'/{underscore_title}_general_statistics.tex'
     safe_title = latex_safe_string ( title )
-    with open ( latex_filename, 'w' ) as latexfile:
-        latexfile.write ( "\\begin{table}[ht]\n" )
-        latexfile.write ( "\\centering\n" )
-        latexfile.write ( "\\caption{" + safe_title + " General Statistics}\n" )
-        latexfile.write ( "\\begin{tabular}{|c|c|c|c|c|c|}\n" )
-        latexfile.write ( "\\hline\n" )
-        latexfile.write (
-            "\\textbf{Metric} & \\textbf{Mean} & \\textbf{Median} & \\textbf{Minimum} & \\textbf{Maximum} & \\textbf{Standard Deviation} \\\\\n" )
-        latexfile.write ( "\\hline\n" )
-        for metric, stats in data_dict.items ():
-            if isinstance ( stats, dict ) and 'Individual' not in metric and 'Bandwidth Distribution' not in metric:
-                if 'Duration' in metric or 'Slack' in metric or 'Overhead' in metric:
-                    units = ' (us)'
-                else:
-                    units = ' (B)'
+    latexfile.write ( "\\begin{table}[ht]\n" )
+    latexfile.write ( "\\centering\n" )
+    latexfile.write ( "\\caption{" + safe_title + " General Statistics}\n" )
+    latexfile.write ( "\\begin{tabular}{|c|c|c|c|c|c|}\n" )
+    latexfile.write ( "\\hline\n" )
+    latexfile.write (
+        "\\textbf{Metric} & \\textbf{Mean} & \\textbf{Median} & \\textbf{Minimum} & \\textbf{Maximum} & \\textbf{Standard Deviation} \\\\\n" )
+    latexfile.write ( "\\hline\n" )
+    for metric, stats in data_dict.items ():
+        if isinstance ( stats, dict ) and 'Individual' not in metric and 'Bandwidth Distribution' not in metric:
+            metric = metric + general_stat_units ( metric )
+            mean = stats.get ( 'Mean', '' )
+            median = stats.get ( 'Median', '' )
+            minimum = stats.get ( 'Minimum', '' )
+            maximum = stats.get ( 'Maximum', '' )
+            std_dev = stats.get ( 'Standard Deviation', '' )
+            latexfile.write ( f"{metric} & {mean} & {median} & {minimum} & {maximum} & {std_dev} \\\\\n" )
+            latexfile.write ( "\\hline\n" )
+    latexfile.write ( "\\end{tabular}\n" )
+    latexfile.write ( "\\label{tab:" + underscore_title + "_general_stats}\n" )
+    latexfile.write ( "\\end{table}\n" )
 
-                metric = metric + units
-                mean = stats.get ( 'Mean', '' )
-                median = stats.get ( 'Median', '' )
-                minimum = stats.get ( 'Minimum', '' )
-                maximum = stats.get ( 'Maximum', '' )
-                std_dev = stats.get ( 'Standard Deviation', '' )
-                latexfile.write ( f"{metric} & {mean} & {median} & {minimum} & {maximum} & {std_dev} \\\\\n" )
-                latexfile.write ( "\\hline\n" )
-        latexfile.write ( "\\end{tabular}\n" )
-        latexfile.write ( "\\label{tab:" + underscore_title + "_general_stats}\n" )
-        latexfile.write ( "\\end{table}\n" )
+
+@incremental_artifact
+def export_single_general_stat_to_latex(data_dict, parent_dir, title):
+    underscore_title = title.replace ( ' ', '_' )
+    latex_filename = parent_dir + f'/{underscore_title}_general_statistics.tex'
+    with open_output ( latex_filename, 'w' ) as latexfile:
+        write_general_stat_latex_table ( latexfile, data_dict, title )
 
 
+@incremental_artifact
 def export_single_general_stat_to_CSV(data_dict, parent_dir, title):
     underscore_title = title.replace ( ' ', '_' )
     csv_filename = parent_dir + f'/{underscore_title}_general_statistics.csv'
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow ( [f"{title} General Statistics"] )
         writer.writerow ( ['Metric', 'Mean', 'Median', 'Minimum', 'Maximum', 'Standard Deviation'] )
@@ -59,6 +66,7 @@ def export_single_general_stat_to_CSV(data_dict, parent_dir, title):
                                                             'Standard Deviation']] )
 
 
+@incremental_artifact
 def export_summary_stat_to_latex(data_dict, parent_dir, title, stat_name):
     stat_name_replaced = stat_name.replace ( ' ', '_' )
     latex_filename = parent_dir + f'/{stat_name_replaced}_summary_statistics.tex'
@@ -69,7 +77,7 @@ def export_summary_stat_to_latex(data_dict, parent_dir, title, stat_name):
     else:
         header = "\\textbf{Name} & \\textbf{Total Time (\\%)} & \\textbf{Total Time (us)} & \\textbf{Instances} & \\textbf{Mean (B)} & \\textbf{Median (B)} & \\textbf{Minimum (B)} & \\textbf{Maximum (B)} & \\textbf{Standard Deviation} \\\\\n"
 
-    with open ( latex_filename, 'w' ) as latexfile:
+    with open_output ( latex_filename, 'w' ) as latexfile:
         latexfile.write ( "\\begin{table}[ht]\n" )
         latexfile.write ( "\\centering\n" )
         latexfile.write ( "\\caption{" + safe_title + " Summary " + stat_name + " Statistics}\n" )
@@ -97,10 +105,11 @@ def export_summary_stat_to_latex(data_dict, parent_dir, title, stat_name):
         latexfile.write ( "\\end{table}\n" )
 
 
+@incremental_artifact
 def export_summary_stat_to_CSV(data_dict, parent_dir, title, stat_name):
     stat_name_replaced = stat_name.replace ( ' ', '_' )
     csv_filename = parent_dir + f'/{stat_name_replaced}_summary_statistics.csv'
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow ( [f"{title} Summary {stat_name} Statistics"] )
         if 'Duration' in stat_name or 'Slack' in stat_name or 'Overhead' in stat_name:
@@ -120,11 +129,58 @@ def export_summary_stat_to_CSV(data_dict, parent_dir, title, stat_name):
                                    ['Mean', 'Median', 'Minimum', 'Maximum', 'Standard Deviation']] )
 
 
+@incremental_artifact
+def export_breakdown_stat_to_CSV(breakdown, parent_dir, title):
+    dimension = breakdown['Dimension']
+    csv_filename = parent_dir + f'/{dimension}_breakdown_statistics.csv'
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
+        writer = csv.writer ( csvfile )
+        writer.writerow ( [f"{title} {dimension} Breakdown"] )
+        writer.writerow ( [dimension, 'Name', 'Total Time (%)', 'Total Time (us)', 'Instances', 'Metric', 'Mean', 'Median',
+                           'Minimum', 'Maximum', 'Standard Deviation'] )
+
+        # One row per metric of every item of every group
+        for group, items in breakdown['Groups'].items ():
+            for key, stats in items.items ():
+                name = stats.get ( 'Name', key )
+                for metric, metric_stats in stats.items ():
+                    if isinstance ( metric_stats, dict ) and 'Mean' in metric_stats:
+                        writer.writerow ( [group, name, stats['Time Percent'], stats['Time Total'], stats['Instance'],
+                                           metric + general_stat_units ( metric )] +
+                                          [metric_stats.get ( stat, '' ) for stat in
+                                           ['Mean', 'Median', 'Minimum', 'Maximum', 'Standard Deviation']] )
+
+
+@incremental_artifact
+def export_timeline_stat_to_CSV(timeline, parent_dir):
+    fields = ['Active Span', 'Busy Time', 'Idle Time', 'Utilization (%)', 'Compute Time', 'Copy Time', 'Overlap Time',
+              'Copy Overlap (%)', 'Kernels', 'Copies', 'Idle Gaps', 'Longest Idle Gap']
+    with open_output ( parent_dir + '/timeline_statistics.csv', 'w', newline='' ) as csvfile:
+        writer = csv.writer ( csvfile )
+        writer.writerow ( ["Device Timeline Statistics (ns)"] )
+        writer.writerow ( ['Device'] + fields )
+        for device, stats in timeline['Devices'].items ():
+            writer.writerow ( [device] + [stats[field] for field in fields] )
+        writer.writerow ( ['All'] + [timeline.get ( field, '' ) for field in fields] )
+
+    with open_output ( parent_dir + '/timeline_concurrency.csv', 'w', newline='' ) as csvfile:
+        writer = csv.writer ( csvfile )
+        writer.writerow ( ["Device Timeline Concurrency (ns)"] )
+        writer.writerow ( ['Device', 'Kind', 'Concurrent', 'Time', 'Time (%)'] )
+        for device, stats in timeline['Devices'].items ():
+            for kind in ('Compute', 'Copy'):
+                histogram = stats[f'{kind} Concurrency']
+                for level, time in zip ( histogram['Levels'], histogram['Time'] ):
+                    share = round ( time * 100.0 / stats['Active Span'], 2 ) if stats['Active Span'] else 0.0
+                    writer.writerow ( [device, kind, level, time, share] )
+
+
+@incremental_artifact
 def export_overall_summary_stat_to_latex(data_dict, parent_dir):
     latex_filename = parent_dir + '/overall_application_summary_statistics.tex'
     total_time = data_dict['Time Total']
 
-    with open ( latex_filename, 'w' ) as latexfile:
+    with open_output ( latex_filename, 'w' ) as latexfile:
         latexfile.write ( "\\begin{table}[ht]\n" )
         latexfile.write ( "\\centering\n" )
         latexfile.write ( "\\caption{Overall Application Duration Summary}\n" )
@@ -144,11 +200,12 @@ def export_overall_summary_stat_to_latex(data_dict, parent_dir):
         latexfile.write ( "\\end{table}\n" )
 
 
+@incremental_artifact
 def export_summary_summary_stat_to_CSV(data_dict, parent_dir):
     csv_filename = parent_dir + f'/overall_application_summary_statistics.csv'
     total_time = data_dict['Time Total']
 
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow ( [f"Overall Application Duration Summary"] )
         writer.writerow ( ['Name', 'Total Relative Time (%)', 'Total Time (us)', 'Instances'] )
@@ -160,10 +217,11 @@ def export_summary_summary_stat_to_CSV(data_dict, parent_dir):
                 writer.writerow ( [name, time_percent, time_duration, instances] )
 
 
+@incremental_artifact
 def export_combined_overall_component_summary_stat_to_latex(data_dict, stat, parent_dir):
     latex_filename = parent_dir + '/overall_combined_' + stat.replace(' ', '_') + '_summary_statistics.tex'
 
-    with open ( latex_filename, 'w' ) as latexfile:
+    with open_output ( latex_filename, 'w' ) as latexfile:
         latexfile.write ( "\\begin{table}[ht]\n" )
         latexfile.write ( "\\centering\n" )
         latexfile.write ( "\\caption{Overall" + stat + " Duration Summary}\n" )
@@ -183,10 +241,11 @@ def export_combined_overall_component_summary_stat_to_latex(data_dict, stat, par
         latexfile.write ( "\\end{table}\n" )
 
 
+@incremental_artifact
 def export_combined_overall_component_summary_stat_to_CSV(data_dict, stat, parent_dir):
     csv_filename = parent_dir + '/overall_combined_' + stat.replace(' ', '_') + '_summary_statistics.csv'
 
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow([f"Overall {stat} Duration Summary"])
         writer.writerow ( ['Trace Name', 'Individual Trace Duration (%)', 'Total Time (us)', 'Instances'] )
@@ -198,10 +257,11 @@ def export_combined_overall_component_summary_stat_to_CSV(data_dict, stat, paren
             writer.writerow ( [name, time_percent, time_duration, instances] )
 
 
+@incremental_artifact
 def export_combined_overall_duration_summary_stat_to_latex(data_dict, parent_dir):
     latex_filename = parent_dir + '/overall_combined_duration_summary_statistics.tex'
 
-    with open ( latex_filename, 'w' ) as latexfile:
+    with open_output ( latex_filename, 'w' ) as latexfile:
         latexfile.write ( "\\begin{table}[ht]\n" )
         latexfile.write ( "\\centering\n" )
         latexfile.write ( "\\caption{Overall Trace Duration Summary}\n" )
@@ -218,10 +278,11 @@ def export_combined_overall_duration_summary_stat_to_latex(data_dict, parent_dir
         latexfile.write ( "\\end{table}\n" )
 
 
+@incremental_artifact
 def export_combined_overall_duration_summary_stat_to_CSV(data_dict, parent_dir):
     csv_filename = parent_dir + '/overall_combined_duration_summary_statistics.csv'
 
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow([f"Overall Trace Duration Summary"])
         writer.writerow ( ['Trace Name', 'Total Trace Time (us)'] )
@@ -230,9 +291,7 @@ def export_combined_overall_duration_summary_stat_to_CSV(data_dict, parent_dir):
             writer.writerow ( [name, time_duration] )
 
 
-def export_combined_summary_stat_to_latex(data_dict, parent_dir, title, stat_name):
-    stat_name_replaced = stat_name.replace ( ' ', '_' )
-    latex_filename = parent_dir + f'/{title}_{stat_name_replaced}_combined_summary_statistics.tex'
+def write_combined_summary_stat_latex_table(latexfile, data_dict, title, stat_name, label):
     safe_title = latex_safe_string ( title )
 
     if 'Duration' in stat_name or 'Slack' in stat_name or 'Overhead' in stat_name:
@@ -240,39 +299,48 @@ def export_combined_summary_stat_to_latex(data_dict, parent_dir, title, stat_nam
     else:
         header = "\\textbf{Name} & \\textbf{Total Time (\\%)} & \\textbf{Total Time (us)} & \\textbf{Instances} & \\textbf{Mean (B)} & \\textbf{Median (B)} & \\textbf{Minimum (B)} & \\textbf{Maximum (B)} & \\textbf{Standard Deviation} \\\\\n"
 
-    with open ( latex_filename, 'w' ) as latexfile:
-        latexfile.write ( "\\begin{table}[ht]\n" )
-        latexfile.write ( "\\centering\n" )
-        latexfile.write ( "\\caption{" + safe_title + " Combined  " + stat_name + " Summary Statistics}\n" )
-        latexfile.write ( "\\begin{tabular}{|c|c|c|c|c|c|c|c|c|}\n" )
-        latexfile.write ( "\\hline\n" )
-        latexfile.write (header)
-        latexfile.write ( "\\hline\n" )
-        for metric, stats in data_dict.items ():
-            name = metric
-            name = latex_safe_string ( name )
-            time_percent = stats['Time Percent']
-            time_duration = stats['Time Total']
-            instances = stats['Instance']
+    latexfile.write ( "\\begin{table}[ht]\n" )
+    latexfile.write ( "\\centering\n" )
+    latexfile.write ( "\\caption{" + safe_title + " Combined  " + stat_name + " Summary Statistics}\n" )
+    latexfile.write ( "\\begin{tabular}{|c|c|c|c|c|c|c|c|c|}\n" )
+    latexfile.write ( "\\hline\n" )
+    latexfile.write (header)
+    latexfile.write ( "\\hline\n" )
+    for metric, stats in data_dict.items ():
+        name = metric
+        name = latex_safe_string ( name )
+        time_percent = stats['Time Percent']
+        time_duration = stats['Time Total']
+        instances = stats['Instance']
+
+        if isinstance ( stats[stat_name], dict ):
+            mean = stats[stat_name].get ( 'Mean', '' )
+            median = stats[stat_name].get ( 'Median', '' )
+            minimum = stats[stat_name].get ( 'Minimum', '' )
+            maximum = stats[stat_name].get ( 'Maximum', '' )
+            std_dev = stats[stat_name].get ( 'Standard Deviation', '' )
+            latexfile.write ( f"{name} & {time_percent} & {time_duration} & {instances} & {mean} & {median} & {minimum} & {maximum} & {std_dev} \\\\\n" )
+            latexfile.write ( "\\hline\n" )
+    latexfile.write ( "\\end{tabular}\n" )
+    latexfile.write ( "\\label{tab:" + label + "_summary_stats}\n" )
+    latexfile.write ( "\\end{table}\n" )
 
-            if isinstance ( stats[stat_name], dict ):
-                mean = stats[stat_name].get ( 'Mean', '' )
-                median = stats[stat_name].get ( 'Median', '' )
-                minimum = stats[stat_name].get ( 'Minimum', '' )
-                maximum = stats[stat_name].get ( 'Maximum', '' )
-                std_dev = stats[stat_name].get ( 'Standard Deviation', '' )
-                latexfile.write ( f"{name} & {time_percent} & {time_duration} & {instances} & {mean} & {median} & {minimum} & {maximum} & {std_dev} \\\\\n" )
-                latexfile.write ( "\\hline\n" )
-        latexfile.write ( "\\end{tabular}\n" )
-        latexfile.write ( "\\label{tab:" + stat_name_replaced + "_summary_stats}\n" )
-        latexfile.write ( "\\end{table}\n" )
+
+@incremental_artifact
+def export_combined_summary_stat_to_latex(data_dict, parent_dir, title, stat_name):
+    stat_name_replaced = stat_name.replace ( ' ', '_' )
+    latex_filename = parent_dir + f'/{title}_{stat_name_replaced}_combined_summary_statistics.tex'
+
+    with open_output ( latex_filename, 'w' ) as latexfile:
+        write_combined_summary_stat_latex_table ( latexfile, data_dict, title, stat_name, stat_name_replaced )
 
 
+@incremental_artifact
 def export_combined_summary_stat_to_CSV(data_dict, parent_dir, title, stat_name):
     stat_name_replaced = stat_name.replace ( ' ', '_' )
     csv_filename = parent_dir + f'/{title}_{stat_name_replaced}_combined_summary_statistics.csv'
 
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow ( [f"{title} Combined {stat_name} Summary Statistics"] )
         if 'Duration' in stat_name or 'Slack' in stat_name or 'Overhead' in stat_name:
@@ -296,6 +364,7 @@ def export_combined_summary_stat_to_CSV(data_dict, parent_dir, title, stat_name)
                                    ['Mean', 'Median', 'Minimum', 'Maximum', 'Standard Deviation']] )
 
 
+@incremental_artifact
 def export_combined_overall_summary_stat_to_latex(data_dict, parent_dir, title, stat_name):
     stat_name_replaced = stat_name.replace ( ' ', '_' )
     title_replaced = title.replace ( ' ', '_' )
@@ -307,7 +376,7 @@ def export_combined_overall_summary_stat_to_latex(data_dict, parent_dir, title,
     else:
         header = "\\textbf{Name} &  \\textbf{Mean (B)} & \\textbf{Median (B)} & \\textbf{Minimum (B)} & \\textbf{Maximum (B)} & \\textbf{Standard Deviation} \\\\\n"
 
-    with open ( latex_filename, 'w' ) as latexfile:
+    with open_output ( latex_filename, 'w' ) as latexfile:
         latexfile.write ( "\\begin{table}[ht]\n" )
         latexfile.write ( "\\centering\n" )
         latexfile.write ( "\\caption{" + safe_title + " Combined  " + stat_name + " Summary Statistics}\n" )
@@ -331,12 +400,13 @@ def export_combined_overall_summary_stat_to_latex(data_dict, parent_dir, title,
         latexfile.write ( "\\end{table}\n" )
 
 
+@incremental_artifact
 def export_combined_overall_summary_stat_to_CSV(data_dict, parent_dir, title, stat_name):
     stat_name_replaced = stat_name.replace ( ' ', '_' )
     title_replaced = title.replace ( ' ', '_' )
     csv_filename = parent_dir + f'/{title_replaced}_{stat_name_replaced}_combined_summary_statistics.csv'
 
-    with open ( csv_filename, 'w', newline='' ) as csvfile:
+    with open_output ( csv_filename, 'w', newline='' ) as csvfile:
         writer = csv.writer ( csvfile )
         writer.writerow ( [f"{title} Combined {stat_name} Summary Statistics"] )
         if 'Duration' in stat_name or 'Slack' in stat_name or 'Overhead' in stat_name:
@@ -355,3 +425,73 @@ def export_combined_overall_summary_stat_to_CSV(data_dict, parent_dir, title, st
                 writer.writerow ( [name] +
                                   [stats.get ( stat, '' ) for stat in
                                    ['Mean', 'Median', 'Minimum', 'Maximum', 'Standard Deviation']] )
+
+
+def general_stat_units(metric):
+    if 'Duration' in metric or 'Slack' in metric or 'Overhead' in metric:
+        return ' (us)'
+    return ' (B)'
+
+
+def write_columnar_table(filename, header, rows):
+    with open_output ( filename + '.csv', 'w', newline='' ) as csvfile:
+        writer = csv.writer ( csvfile )
+        writer.writerow ( header )
+        writer.writerows ( rows )
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+
+    columns = {column: [row[i] for row in rows] for i, column in enumerate ( header )}
+    with open_output ( filename + '.parquet', 'wb' ) as parquetfile:
+        pq.write_table ( pa.table ( columns ), parquetfile )
+
+
+@incremental_artifact
+def export_consolidated_general_stats(items, parent_dir, title):
+    underscore_title = title.replace ( ' ', '_' )
+    filename = parent_dir + f'/{underscore_title}_general_statistics'
+    header = ['Name', 'Metric', 'Mean', 'Median', 'Minimum', 'Maximum', 'Standard Deviation']
+    rows = []
+
+    for item_title, data_dict in items:
+        for metric, stats in data_dict.items ():
+            if isinstance ( stats, dict ) and 'Individual' not in metric and 'Bandwidth Distribution' not in metric:
+                rows.append ( [item_title, metric + general_stat_units ( metric )] +
+                              [stats.get ( stat ) for stat in header[2:]] )
+
+    write_columnar_table ( filename, header, rows )
+
+    with open_output ( filename + '.tex', 'w' ) as latexfile:
+        for item_title, data_dict in items:
+            write_general_stat_latex_table ( latexfile, data_dict, item_title )
+            latexfile.write ( "\n" )
+
+
+@incremental_artifact
+def export_consolidated_combined_summary_stats(items, parent_dir, title):
+    underscore_title = title.replace ( ' ', '_' )
+    filename = parent_dir + f'/{underscore_title}_combined_summary_statistics'
+    header = ['Name', 'Metric', 'Configuration', 'Total Time (%)', 'Total Time (us)', 'Instances', 'Mean', 'Median',
+              'Minimum', 'Maximum', 'Standard Deviation']
+    rows = []
+
+    for item_name, item_dicts, stat_names in items:
+        for stat_name in stat_names:
+            for config, stats in item_dicts.items ():
+                if isinstance ( stats[stat_name], dict ):
+                    rows.append ( [item_name, stat_name + general_stat_units ( stat_name ), config, stats['Time Percent'],
+                                   stats['Time Total'], stats['Instance']] +
+                                  [stats[stat_name].get ( stat ) for stat in header[6:]] )
+
+    write_columnar_table ( filename, header, rows )
+
+    with open_output ( filename + '.tex', 'w' ) as latexfile:
+        for item_name, item_dicts, stat_names in items:
+            for stat_name in stat_names:
+                label = str ( item_name ).replace ( ' ', '_' ) + '_' + stat_name.replace ( ' ', '_' )
+                write_combined_summary_stat_latex_table ( latexfile, item_dicts, str ( item_name ), stat_name, label )
+                latexfile.write ( "\n" )
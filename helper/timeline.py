@@ -0,0 +1,122 @@
+import numpy as np
+from absl import logging
+
+from helper.execution import run_tasks
+from helper.general import execute_query_in_thread, execute_queries_parallel, mutiple_table_exists
+
+# Activity tables on the device timeline and whether they occupy the compute or the copy engines
+TIMELINE_SOURCES = {
+    'CUPTI_ACTIVITY_KIND_KERNEL': 'Compute',
+    'CUPTI_ACTIVITY_KIND_MEMCPY': 'Copy',
+    'CUPTI_ACTIVITY_KIND_MEMSET': 'Copy',
+}
+TIMELINE_KINDS = ['Compute', 'Copy']
+TIMELINE_SECTION = 'Timeline Statistics'
+
+QUERY_TIMELINE_DEVICES = """
+SELECT DISTINCT deviceId FROM {table}
+"""
+
+# Zero length intervals take no device time, their end would be swept before their start
+QUERY_TIMELINE_INTERVALS = """
+SELECT {kind} AS kind, start, "end" FROM {table} WHERE deviceId = ?1 AND "end" > start
+"""
+
+
+def timeline_tables(database_file):
+    return [table for table in TIMELINE_SOURCES if mutiple_table_exists ( database_file, [table] )]
+
+
+def create_interval_query(tables):
+    # One query per device reads every source table, the kind column tells compute and copy intervals apart
+    return '\nUNION ALL\n'.join ( QUERY_TIMELINE_INTERVALS.format ( kind=TIMELINE_KINDS.index ( TIMELINE_SOURCES[table] ),
+                                                                    table=table ).strip () for table in tables )
+
+
+def concurrency_histogram(levels, durations):
+    # Nanoseconds spent with 0, 1, 2, ... intervals of a kind in flight
+    time = np.bincount ( levels, weights=durations ).round ().astype ( np.int64 )
+    return {'Levels': list ( range ( time.size ) ), 'Time': time.tolist ()}
+
+
+def sweep_device(data):
+    """Busy, idle, overlap and concurrency of one device from its (kind, start, end) rows.
+
+    Interval starts and ends become +1/-1 events sorted by time, ends first on ties so back to back intervals do not
+    overlap. Running sums of the events give the number of compute and copy intervals in flight between consecutive
+    events, so everything is computed with one sort and a few passes over the arrays, O(n log n) in the intervals."""
+    device, intervals = data
+    kinds, starts, ends = intervals[:, 0], intervals[:, 1], intervals[:, 2]
+
+    # Time in the high bits and start/end in the lowest one sorts ends before starts at equal times
+    keys = np.concatenate ( [starts << 1 | 1, ends << 1] )
+    order = np.argsort ( keys, kind='stable' )
+    times = keys[order] >> 1
+    deltas = np.where ( order < starts.size, 1, -1 ).astype ( np.int32 )
+    event_kinds = np.concatenate ( [kinds, kinds] )[order]
+
+    # Segment i lies between event i and event i + 1
+    durations = np.diff ( times )
+    compute = np.cumsum ( deltas * (event_kinds == 0), dtype=np.int32 )[:-1]
+    copy = np.cumsum ( deltas * (event_kinds == 1), dtype=np.int32 )[:-1]
+
+    # Time idle, only computing, only copying and doing both
+    states = (compute > 0) + 2 * (copy > 0)
+    idle, compute_only, copy_only, overlap = np.bincount ( states, weights=durations, minlength=4 ).round ().astype (
+        np.int64 ).tolist ()
+    gaps = np.where ( states == 0, durations, 0 )
+
+    span = int ( times[-1] - times[0] )
+    busy_time = compute_only + copy_only + overlap
+    copy_time = copy_only + overlap
+
+    return str ( device ), {
+        'Start': int ( times[0] ), 'End': int ( times[-1] ), 'Active Span': span, 'Busy Time': busy_time,
+        'Idle Time': idle, 'Utilization (%)': round ( busy_time * 100.0 / span, 2 ) if span else 0.0,
+        'Compute Time': compute_only + overlap, 'Copy Time': copy_time, 'Overlap Time': overlap,
+        'Copy Overlap (%)': round ( overlap * 100.0 / copy_time, 2 ) if copy_time else 0.0,
+        'Kernels': int ( (kinds == 0).sum () ), 'Copies': int ( (kinds == 1).sum () ),
+        'Idle Gaps': int ( np.count_nonzero ( gaps ) ), 'Longest Idle Gap': int ( gaps.max () ) if gaps.size else 0,
+        'Compute Concurrency': concurrency_histogram ( compute, durations ),
+        'Copy Concurrency': concurrency_histogram ( copy, durations ),
+    }
+
+
+def create_timeline_statistics(database_file, execution=None, window=None):
+    """Device timeline analysis: when each GPU was busy or idle, how much copy time overlapped compute and how many
+    kernels and copies ran concurrently, with totals over all devices. Returns None without kernel, memcpy or memset
+    tables.
+
+    Intervals are read per device as int64 arrays and swept on the CPU workers, one device at a time per worker."""
+    tables = timeline_tables ( database_file )
+    if not tables:
+        return None
+
+    devices = set ()
+    for table in tables:
+        devices.update ( row[0] for row in
+                         execute_query_in_thread ( (QUERY_TIMELINE_DEVICES.format ( table=table ), None), database_file,
+                                                   window )[1] )
+    devices = sorted ( device for device in devices if device is not None )
+
+    query = create_interval_query ( tables )
+    results = execute_queries_parallel ( [(query, device) for device in devices], database_file, execution, window,
+                                         as_array=True )
+    for device in set ( devices ) - set ( device for device, _ in results ):
+        logging.warning ( f"Leaving device {device} out of the timeline statistics, its interval query did not complete" )
+
+    swept = run_tasks ( execution, 'CPU', sweep_device, [result for result in results if result[1].size] )
+    statistics = {'Devices': {device: values for device, values in sorted ( swept, key=lambda entry: int ( entry[0] ) )}}
+
+    # Totals over the devices, utilization relative to the sum of their active spans
+    for field in ('Active Span', 'Busy Time', 'Idle Time', 'Compute Time', 'Copy Time', 'Overlap Time', 'Kernels',
+                  'Copies', 'Idle Gaps'):
+        statistics[field] = sum ( values[field] for values in statistics['Devices'].values () )
+    statistics['Longest Idle Gap'] = max ( (values['Longest Idle Gap'] for values in statistics['Devices'].values ()),
+                                           default=0 )
+    span = statistics['Active Span']
+    statistics['Utilization (%)'] = round ( statistics['Busy Time'] * 100.0 / span, 2 ) if span else 0.0
+    statistics['Copy Overlap (%)'] = round ( statistics['Overlap Time'] * 100.0 / statistics['Copy Time'], 2 ) \
+        if statistics['Copy Time'] else 0.0
+
+    return statistics
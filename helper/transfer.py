@@ -1,8 +1,8 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 
-from absl import logging
-
-from helper.general import generate_statistics, MAX_WORKERS, create_histogram, remove_outliers
+from helper.clustering import k_means_statistics
+from helper.execution import run_tasks
+from helper.general import generate_statistics, create_histogram, remove_outliers, bin_values, group_query
 
 QUERY_TRANSFERS = """
 WITH
@@ -61,7 +61,7 @@ FROM
 ORDER BY 2 DESC
 """
 
-QUERY_TRANSFERS_STATS = """
+QUERY_TRANSFERS_STATS_TEMPLATE = """
 WITH
     transfers AS (
         SELECT
@@ -83,41 +83,40 @@ WITH
                 ELSE 'Unknown'
             END AS name,
             mcpy.end - mcpy.start AS duration,
-            mcpy.bytes AS size
+            mcpy.bytes AS size{dimension}
         FROM
             CUPTI_ACTIVITY_KIND_MEMCPY as mcpy
         UNION ALL
         SELECT
             'Memset' AS name,
             end - start AS duration,
-            bytes AS size
+            bytes AS size{dimension}
         FROM
             CUPTI_ACTIVITY_KIND_MEMSET
     )
 SELECT
     name AS "Name",
     duration AS "Duration",
-    size AS "Size"
+    size AS "Size"{dimension_column}
 FROM
     transfers
 WHERE
     name = ?
 """
 
+QUERY_TRANSFERS_STATS = group_query(QUERY_TRANSFERS_STATS_TEMPLATE)
+
 TRANSFER_REQUIRED_TABLES = ['CUPTI_ACTIVITY_KIND_MEMCPY', 'CUPTI_ACTIVITY_KIND_MEMSET']
 
 CONVERSION_TO_SECONDS = 1e-6 #Nsight claims ns for duration but found to be us
 
 def generate_transfer_stats(transfers):
-    transfer_sizes = []
-    transfer_durations = []
-    temp_bandwidth = []
+    transfer_sizes = [size for _, _, size in transfers[1]]
+    transfer_durations = [duration for _, duration, _ in transfers[1]]
     histgram_bins = []
 
-    for _, duration, size in transfers[1]:
-        transfer_sizes.append ( size )
-        transfer_durations.append ( duration )
-        temp_bandwidth.append ( (size, size / (duration * CONVERSION_TO_SECONDS))) # convert to B/s
+    raw_sizes = np.array ( transfer_sizes )
+    raw_bandwidths = raw_sizes / (np.array ( transfer_durations, dtype=float ) * CONVERSION_TO_SECONDS) # convert to B/s
 
     transfer_data = {}
 
@@ -139,42 +138,24 @@ def generate_transfer_stats(transfers):
         transfer_data['Transfer Durations'] = None
 
     if histgram_bins:
-        bandwidth_distro = [[] for _ in range ( len ( histgram_bins ) )]
-        for index, (start, end) in enumerate ( histgram_bins ):
-            for size, bandwidth in temp_bandwidth:
-                if start <= size < end:
-                    bandwidth_distro[index].append ( bandwidth )
+        bin_edges = [start for start, _ in histgram_bins] + [histgram_bins[-1][1]]
+        bandwidth_distro = bin_values ( raw_bandwidths, raw_sizes, bin_edges )
 
-        histogram_dict['Histogram'] = bandwidth_distro
+        histogram_dict['Histogram'] = [bandwidths.tolist () for bandwidths in bandwidth_distro]
         transfer_data['Bandwidth Distribution'] = histogram_dict
-        transfer_data['Bandwidth Distribution']['Raw Data'] = temp_bandwidth
+        transfer_data['Bandwidth Distribution']['Raw Data'] = {'Size': raw_sizes.tolist (),
+                                                               'Bandwidth': raw_bandwidths.tolist ()}
     else:
         transfer_data['Bandwidth Distribution'] = None
 
     return transfers[0], transfer_data
 
 
-def parallel_parse_transfer_data(queries_res):
-    total_tasks = len ( queries_res )
-    completed_tasks = 0
-
-    with ThreadPoolExecutor ( max_workers=MAX_WORKERS ) as executor:
-        futures = []
-        for data in queries_res:
-            future = executor.submit ( generate_transfer_stats, data )
-            futures.append ( future )
-
-        results = []
-        for future in as_completed ( futures ):
-            results.append ( future.result () )
-            completed_tasks += 1
-            if int ( (completed_tasks / total_tasks) * 100 ) % 10 == 0:
-                logging.info ( f"Progress: {(completed_tasks / total_tasks) * 100:.1f}%" )
-
-    return results
+def parallel_parse_transfer_data(queries_res, execution=None):
+    return run_tasks ( execution, 'CPU', generate_transfer_stats, queries_res, log_progress=True )
 
 
-def create_specific_transfer_stats(transfer_stats, handle_outliers=False):
+def create_specific_transfer_stats(transfer_stats, handle_outliers=False, execution=None):
     dict = {}
     duration_cluster_data = []
     size_cluster_data = []
@@ -185,7 +166,7 @@ def create_specific_transfer_stats(transfer_stats, handle_outliers=False):
         if transfer_info:
             if transfer_info['Transfer Size']:
                 if transfer_info['Transfer Size']["Raw Data"]:
-                    combined_raw_size_data.extend ( transfer_info['Transfer Size']["Raw Data"] )
+                    combined_raw_size_data.append ( np.asarray ( transfer_info['Transfer Size']["Raw Data"], dtype=float ) )
                 if transfer_info['Transfer Size']['Mean'] and transfer_info['Transfer Size'][
                     'Median'] and transfer_info[
                     "Instance"]:
@@ -194,7 +175,7 @@ def create_specific_transfer_stats(transfer_stats, handle_outliers=False):
                                                 transfer_info["Instance"]] )
             if transfer_info['Transfer Durations']:
                 if transfer_info['Transfer Durations']["Raw Data"]:
-                    combined_raw_duration_data.extend ( transfer_info['Transfer Durations']["Raw Data"] )
+                    combined_raw_duration_data.append ( np.asarray ( transfer_info['Transfer Durations']["Raw Data"], dtype=float ) )
                 if transfer_info['Transfer Durations']['Mean'] and transfer_info['Transfer Durations'][
                     'Median'] and transfer_info[
                     "Instance"]:
@@ -206,14 +187,18 @@ def create_specific_transfer_stats(transfer_stats, handle_outliers=False):
     if handle_outliers and size_cluster_data: size_cluster_data = remove_outliers ( size_cluster_data )
 
     if combined_raw_duration_data:
+        combined_raw_duration_data = np.concatenate ( combined_raw_duration_data )
         dict.update ( generate_statistics ( combined_raw_duration_data, 'Transfer Durations', disable_raw=True ) )
+        dict['Transfer Durations']['Raw Data'] = combined_raw_duration_data
         dict['Transfer Durations']['Distribution'] = create_histogram ( combined_raw_duration_data )
     if combined_raw_size_data:
+        combined_raw_size_data = np.concatenate ( combined_raw_size_data )
         dict.update ( generate_statistics ( combined_raw_size_data, 'Transfer Size', disable_raw=True ) )
+        dict['Transfer Size']['Raw Data'] = combined_raw_size_data
         dict['Transfer Size']['Distribution'] = create_histogram ( combined_raw_size_data )
     if duration_cluster_data:
-        dict['Transfer Durations']['k-mean'] = {'Raw Data': duration_cluster_data}
+        dict['Transfer Durations']['k-mean'] = k_means_statistics ( duration_cluster_data, execution )
     if size_cluster_data:
-        dict['Transfer Size']['k-mean'] = {'Raw Data': size_cluster_data}
+        dict['Transfer Size']['k-mean'] = k_means_statistics ( size_cluster_data, execution )
 
     return dict
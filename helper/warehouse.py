@@ -0,0 +1,286 @@
+import csv
+import os
+import sqlite3
+import time
+
+from absl import logging
+
+from helper.extraction import STATISTICS_SECTIONS
+from helper.instrumentation import log_table
+from helper.service import NAV_SUFFIX, file_stamp, load_section, section_names
+
+WAREHOUSE_VERSION = 1
+
+WAREHOUSE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    nav_file TEXT NOT NULL UNIQUE,
+    label TEXT NOT NULL,
+    run_time REAL NOT NULL,
+    ingested_at REAL NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_mtime_ns INTEGER NOT NULL,
+    total_duration INTEGER
+);
+CREATE TABLE IF NOT EXISTS items (
+    run_id INTEGER NOT NULL REFERENCES runs ( run_id ) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    time_total REAL,
+    time_percent REAL,
+    instances INTEGER,
+    memory_total REAL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs ( run_id ) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    mean REAL,
+    median REAL,
+    minimum REAL,
+    maximum REAL,
+    standard_deviation REAL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    run_id INTEGER NOT NULL REFERENCES runs ( run_id ) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    center REAL,
+    width REAL,
+    count INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_label_time ON runs ( label, run_time );
+CREATE INDEX IF NOT EXISTS runs_time ON runs ( run_time );
+CREATE INDEX IF NOT EXISTS items_name ON items ( category, name, run_id );
+CREATE INDEX IF NOT EXISTS items_run ON items ( run_id );
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics ( category, name, metric, run_id );
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics ( run_id );
+CREATE INDEX IF NOT EXISTS buckets_name ON buckets ( category, name, metric, run_id );
+CREATE INDEX IF NOT EXISTS buckets_run ON buckets ( run_id );
+"""
+
+# NAV fields stored as item columns, everything else with statistics goes to metrics
+ITEM_COLUMNS = {'Time Total': 'time_total', 'Time Percent': 'time_percent', 'Instance': 'instances',
+                'Memory Total': 'memory_total'}
+STATISTIC_COLUMNS = {'Mean': 'mean', 'Median': 'median', 'Minimum': 'minimum', 'Maximum': 'maximum',
+                     'Standard Deviation': 'standard_deviation'}
+QUERY_FIELDS = ['category', 'name', 'metric', 'statistic', 'label', 'since', 'until', 'limit']
+
+
+def open_warehouse(warehouse_file):
+    directory = os.path.dirname ( warehouse_file )
+    if directory:
+        os.makedirs ( directory, exist_ok=True )
+
+    conn = sqlite3.connect ( warehouse_file )
+    conn.execute ( "PRAGMA journal_mode=WAL" )
+    conn.execute ( "PRAGMA foreign_keys=ON" )
+    version = conn.execute ( "PRAGMA user_version" ).fetchone ()[0]
+    if version not in (0, WAREHOUSE_VERSION):
+        conn.close ()
+        raise ValueError ( f"{warehouse_file} has warehouse version {version}, expected {WAREHOUSE_VERSION}" )
+
+    conn.executescript ( WAREHOUSE_SCHEMA )
+    conn.execute ( f"PRAGMA user_version={WAREHOUSE_VERSION}" )
+    return conn
+
+
+def find_nav_files(paths):
+    nav_files = []
+    for path in paths:
+        if os.path.isdir ( path ):
+            for directory, _, names in os.walk ( path ):
+                nav_files.extend ( os.path.join ( directory, name ) for name in names if name.endswith ( NAV_SUFFIX ) )
+        else:
+            nav_files.append ( path )
+
+    return sorted ( os.path.abspath ( nav_file ) for nav_file in nav_files )
+
+
+def run_label(nav_file):
+    # <name>_parsed_stats.nav is labelled <name>
+    name = os.path.basename ( nav_file )[:-len ( NAV_SUFFIX )]
+    return name[:-len ( '_parsed_stats' )] if name.endswith ( '_parsed_stats' ) else name
+
+
+def number(value):
+    return value if isinstance ( value, (int, float) ) else None
+
+
+def nav_rows(nav_file):
+    """Item, metric and bucket rows of the summary sections (raw data is never loaded)."""
+    items = []
+    metrics = []
+    buckets = []
+    sections = section_names ( nav_file )
+
+    for category, (section, individual) in STATISTICS_SECTIONS.items ():
+        if section not in sections:
+            continue
+        for key, item in (load_section ( nav_file, section ).get ( individual ) or {}).items ():
+            name = str ( item.get ( 'Name', key ) )
+            items.append ( (category, str ( key ), name, *(number ( item.get ( field ) ) for field in ITEM_COLUMNS)) )
+            for metric, value in item.items ():
+                if not isinstance ( value, dict ) or not any ( statistic in value for statistic in STATISTIC_COLUMNS ):
+                    continue
+                metrics.append ( (category, name, metric, *(number ( value.get ( statistic ) ) for statistic in STATISTIC_COLUMNS)) )
+                distribution = value.get ( 'Distribution' ) or {}
+                for bucket, (center, width, count) in enumerate ( zip ( distribution.get ( 'Bin Centers', [] ),
+                                                                         distribution.get ( 'Bin Width', [] ),
+                                                                         distribution.get ( 'Histogram', [] ) ) ):
+                    buckets.append ( (category, name, metric, bucket, center, width, count) )
+
+    total_duration = load_section ( nav_file, 'Total Duration' ) if 'Total Duration' in sections else None
+    return number ( total_duration ), items, metrics, buckets
+
+
+def ingest_nav_files(warehouse_file, paths):
+    """Adds the NAV files (or NAV files below directories) in paths to the warehouse.
+
+    A file already ingested with the same size and modification time is skipped and a changed one replaces its
+    earlier rows, so ingesting the same paths again is a no-op."""
+    conn = open_warehouse ( warehouse_file )
+    ingested = 0
+    skipped = 0
+    start_time = time.perf_counter ()
+
+    try:
+        known = {nav_file: (run_id, size, mtime_ns) for run_id, nav_file, size, mtime_ns in
+                 conn.execute ( "SELECT run_id, nav_file, file_size, file_mtime_ns FROM runs" )}
+        for nav_file in find_nav_files ( paths ):
+            mtime_ns, size = file_stamp ( nav_file )
+            if nav_file in known and known[nav_file][1:] == (size, mtime_ns):
+                skipped += 1
+                continue
+
+            try:
+                total_duration, items, metrics, buckets = nav_rows ( nav_file )
+            except (OSError, ValueError, LookupError) as e:
+                logging.warning ( f"Skipping {nav_file}, it is not a readable NAV file: {e}" )
+                continue
+
+            # One transaction per run, an interrupted ingest leaves no partial runs behind
+            with conn:
+                if nav_file in known:
+                    conn.execute ( "DELETE FROM runs WHERE run_id = ?", (known[nav_file][0],) )
+                run_id = conn.execute ( "INSERT INTO runs (nav_file, label, run_time, ingested_at, file_size, "
+                                        "file_mtime_ns, total_duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        (nav_file, run_label ( nav_file ), mtime_ns / 1e9, time.time (), size,
+                                         mtime_ns, total_duration) ).lastrowid
+                conn.executemany ( "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(run_id, *row) for row in items] )
+                conn.executemany ( "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(run_id, *row) for row in metrics] )
+                conn.executemany ( "INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(run_id, *row) for row in buckets] )
+            ingested += 1
+            logging.debug ( f"Ingested {nav_file} as run {run_id}" )
+    finally:
+        conn.close ()
+
+    logging.info ( f"Ingested {ingested} NAV file(s) into {warehouse_file} in {time.perf_counter () - start_time:.2f}s "
+                   f"({skipped} unchanged file(s) skipped)" )
+    return ingested
+
+
+def parse_warehouse_query(terms):
+    """Turns ['name=kernel_%', 'metric=Execution Duration', ...] into a query dictionary."""
+    query = {'category': 'Kernel', 'metric': 'Time Total', 'statistic': 'Median', 'limit': '1000'}
+    for term in terms or []:
+        field, _, value = term.partition ( '=' )
+        field = field.strip ().lower ()
+        if field not in QUERY_FIELDS or not _:
+            raise ValueError ( f"Warehouse query terms must be FIELD=VALUE with FIELD one of {QUERY_FIELDS}, got {term}" )
+        query[field] = value.strip ()
+
+    return query
+
+
+def query_warehouse(warehouse_file, query):
+    """Returns the columns and rows of one metric of matching items across the newest limit runs, oldest first.
+
+    name and label accept SQL LIKE patterns (with %), since and until are dates (YYYY-MM-DD) or epoch seconds. metric is an
+    item field (Time Total, Time Percent, Instance, Memory Total) or a metric whose statistic is reported, with
+    statistic=Distribution reporting the histogram buckets instead."""
+    if query['category'] not in STATISTICS_SECTIONS:
+        raise ValueError ( f"Unknown category {query['category']}, expected one of {list ( STATISTICS_SECTIONS )}" )
+
+    conditions = ["v.category = ?"]
+    params = [query['category']]
+    run_conditions = []
+    run_params = []
+    if query['metric'] in ITEM_COLUMNS:
+        columns = ['Run', 'Label', 'Run Time', 'Name', query['metric']]
+        select = f"v.{ITEM_COLUMNS[query['metric']]}"
+        table = 'items'
+    elif query['statistic'] == 'Distribution':
+        columns = ['Run', 'Label', 'Run Time', 'Name', 'Bucket', 'Center', 'Width', 'Count']
+        select = "v.bucket, v.center, v.width, v.count"
+        table = 'buckets'
+        conditions.append ( "v.metric = ?" )
+        params.append ( query['metric'] )
+    elif query['statistic'] in STATISTIC_COLUMNS:
+        columns = ['Run', 'Label', 'Run Time', 'Name', f"{query['metric']} {query['statistic']}"]
+        select = f"v.{STATISTIC_COLUMNS[query['statistic']]}"
+        table = 'metrics'
+        conditions.append ( "v.metric = ?" )
+        params.append ( query['metric'] )
+    else:
+        raise ValueError ( f"Unknown statistic {query['statistic']}, expected one of "
+                           f"{list ( STATISTIC_COLUMNS ) + ['Distribution']}" )
+
+    for field, condition in [('name', "v.name {} ?"), ('label', "r.label {} ?"), ('since', "r.run_time >= ?"),
+                             ('until', "r.run_time < ?")]:
+        if query.get ( field ):
+            # Exact names can use the indexes, LIKE is only used for patterns
+            field_conditions, field_params = (conditions, params) if field == 'name' else (run_conditions, run_params)
+            field_conditions.append ( condition.format ( 'LIKE' if '%' in query[field] else '=' ) )
+            field_params.append ( query_time ( query[field] ) if field in ('since', 'until') else query[field] )
+
+    # The limit selects the newest runs with matching items, a run contributes one row per item (and bucket)
+    value_conditions = ' AND '.join ( conditions )
+    run_conditions.append ( f"EXISTS (SELECT 1 FROM {table} v WHERE v.run_id = r.run_id AND {value_conditions})" )
+    sql = (f"SELECT r.run_id, r.label, r.run_time, v.name, {select} FROM runs r, {table} v "
+           f"WHERE r.run_id = v.run_id AND {value_conditions} AND r.run_id IN (SELECT r.run_id FROM runs r "
+           f"WHERE {' AND '.join ( run_conditions )} ORDER BY r.run_time DESC, r.run_id DESC LIMIT ?) "
+           f"ORDER BY r.run_time, r.run_id, v.name")
+    conn = open_warehouse ( warehouse_file )
+    try:
+        rows = conn.execute ( sql, params + run_params + params + [int ( query['limit'] )] ).fetchall ()
+    finally:
+        conn.close ()
+
+    return columns, [(run_id, label, time.strftime ( '%Y-%m-%d %H:%M:%S', time.localtime ( run_time ) ), *values)
+                     for run_id, label, run_time, *values in rows]
+
+
+def query_time(value):
+    try:
+        return float ( value )
+    except ValueError:
+        return time.mktime ( time.strptime ( value, '%Y-%m-%d' ) )
+
+
+def report_warehouse_query(warehouse_file, terms, output_file=None):
+    start_time = time.perf_counter ()
+    columns, rows = query_warehouse ( warehouse_file, parse_warehouse_query ( terms ) )
+    elapsed = time.perf_counter () - start_time
+
+    if rows:
+        log_table ( f"{len ( rows )} row(s) in {elapsed * 1000:.0f}ms", columns,
+                    [[str ( value ) if value is not None else '-' for value in row] for row in rows] )
+    else:
+        logging.info ( f"No matching rows in {warehouse_file}" )
+
+    if output_file:
+        with open ( output_file, 'w', newline='' ) as file:
+            writer = csv.writer ( file )
+            writer.writerow ( columns )
+            writer.writerows ( rows )
+        logging.info ( f"Saved {len ( rows )} row(s) to {output_file}" )
+
+    return columns, rows
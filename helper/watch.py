@@ -0,0 +1,208 @@
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from absl import logging
+
+from helper.clustering import configure_clustering
+from helper.execution import available_cpus, create_execution_context, shutdown_execution_context
+from helper.extraction import extract_database, save_statistics
+from helper.general import configure_query_limits
+from helper.instrumentation import take_report_phases, write_report
+from helper.staging import configure_staging
+
+WATCH_INDEX_NAME = '.nav_watch_index.json'
+WATCH_SUFFIX = '.sqlite'
+SIDECAR_SUFFIX = '.indexed.sqlite'
+FINISHED_STATUSES = ('Done', 'Failed')
+
+_watch = {'Stop': threading.Event (), 'Wake': threading.Event ()}
+
+
+def stop_watching(signum, frame):
+    # The first signal lets running extractions finish, a second one aborts them (they are re-run after a restart)
+    if _watch['Stop'].is_set ():
+        raise KeyboardInterrupt
+    logging.warning ( f"Received {signal.Signals ( signum ).name}, finishing running extractions "
+                      f"(send it again to abort them)" )
+    _watch['Stop'].set ()
+    _watch['Wake'].set ()
+
+
+def timestamp():
+    return time.strftime ( '%Y-%m-%dT%H:%M:%S' )
+
+
+def load_watch_index(output_root):
+    index_file = os.path.join ( output_root, WATCH_INDEX_NAME )
+    if not os.path.exists ( index_file ):
+        return {}
+
+    try:
+        with open ( index_file, 'r' ) as file:
+            return json.load ( file )
+    except (OSError, ValueError) as e:
+        logging.warning ( f"Ignoring unreadable watch index {index_file}: {e}" )
+        return {}
+
+
+def save_watch_index(output_root, index):
+    index_file = os.path.join ( output_root, WATCH_INDEX_NAME )
+    with open ( index_file + '.tmp', 'w' ) as file:
+        json.dump ( index, file, indent=1, sort_keys=True )
+    os.replace ( index_file + '.tmp', index_file )
+
+
+def scan_directories(directories):
+    """Yields (priority, path, stat) for the sqlite exports in directories, earlier directories first."""
+    for priority, directory in enumerate ( directories ):
+        try:
+            entries = list ( os.scandir ( directory ) )
+        except OSError as e:
+            logging.warning ( f"Cannot scan {directory}: {e}" )
+            continue
+
+        for entry in entries:
+            if entry.is_file () and entry.name.endswith ( WATCH_SUFFIX ) and not entry.name.endswith ( SIDECAR_SUFFIX ):
+                yield priority, os.path.abspath ( entry.path ), entry.stat ()
+
+
+def job_output_dir(output_root, database_file, index):
+    # Exports with the same name in different directories get a suffix derived from their path
+    name = os.path.basename ( database_file ).split ( '.' )[0]
+    claimed = {entry.get ( 'Output Dir' ) for path, entry in index.items () if path != database_file}
+    output_dir = os.path.join ( output_root, name ) + '/'
+    if output_dir in claimed:
+        suffix = hashlib.blake2b ( database_file.encode (), digest_size=4 ).hexdigest ()
+        output_dir = os.path.join ( output_root, f'{name}-{suffix}' ) + '/'
+
+    return output_dir
+
+
+def init_watch_worker():
+    # Only the daemon decides when extractions stop, a terminal Ctrl-C must not fail the running ones
+    signal.signal ( signal.SIGINT, signal.SIG_IGN )
+    logging.set_verbosity ( logging.INFO )
+
+
+def run_extraction_job(database_file, output_dir, options):
+    """Extracts one sqlite export to a NAV file in output_dir (runs in a pool process)."""
+    start_time = time.perf_counter ()
+    os.makedirs ( output_dir, exist_ok=True )
+    # Watched files are only extracted, their first export fits the stored k-means points
+    configure_clustering ( True )
+    configure_staging ( options['Stage Dir'], options['Stage Cache Size'] )
+    configure_query_limits ( options['Query Timeout'] )
+    execution = create_execution_context ( options['CPU Workers'], options['IO Workers'] )
+
+    try:
+        statistics = extract_database ( database_file, output_dir, options, execution )
+        if not statistics:
+            raise ValueError ( f"No kernel, transfer or communication statistics found in {database_file}" )
+        nav_file = save_statistics ( statistics, database_file, output_dir )
+    finally:
+        shutdown_execution_context ( execution )
+
+    name = os.path.basename ( database_file ).split ( '.' )[0]
+    write_report ( output_dir + name + '_perf_report.json' )
+    phases = take_report_phases ()
+    return {'NAV': nav_file, 'Elapsed (s)': round ( time.perf_counter () - start_time, 3 ),
+            'Rows': sum ( record['Rows'] for record in phases if record['Phase'] == 'Raw Queries' )}
+
+
+def watch_directories(directories, output_root, options, jobs=1, interval=10, settle=30):
+    """Extracts every sqlite export that appears in directories until stopped by SIGINT/SIGTERM.
+
+    A file is queued once its size and modification time have not changed for settle seconds. Queued files are
+    extracted by up to jobs processes, files of earlier directories first and otherwise oldest first. The status of
+    every file is kept in output_root/.nav_watch_index.json, so finished files are skipped after a restart (until they
+    change) and interrupted ones are queued again."""
+    os.makedirs ( output_root, exist_ok=True )
+    if options['CPU Workers'] is None:
+        # Concurrent extractions share the allocated CPUs instead of each sizing itself to all of them
+        options = dict ( options, **{'CPU Workers': max ( 1, available_cpus () // jobs )} )
+
+    index = load_watch_index ( output_root )
+    for path, entry in index.items ():
+        if entry['Status'] not in FINISHED_STATUSES:
+            entry['Status'] = 'Pending'
+
+    observed = {}
+    queue = []
+    running = {}
+    completed = []
+    context = multiprocessing.get_context ( 'spawn' )
+    # A fresh process per extraction returns its memory to the node between files
+    pool = context.Pool ( processes=jobs, initializer=init_watch_worker, maxtasksperchild=1 )
+    logging.info ( f"Watching {', '.join ( directories )} with {jobs} extraction process(es), NAV files in {output_root}" )
+
+    def job_finished(path, result=None, error=None):
+        completed.append ( (path, result, error) )
+        _watch['Wake'].set ()
+
+    try:
+        while not (_watch['Stop'].is_set () and not running):
+            # Cleared before looking at finished jobs, so a job finishing meanwhile wakes the next wait right away
+            _watch['Wake'].clear ()
+            changed = False
+            now = time.time ()
+
+            while completed:
+                path, result, error = completed.pop ()
+                del running[path]
+                entry = index[path]
+                entry['Finished'] = timestamp ()
+                if error is None:
+                    entry.update ( {'Status': 'Done', **result} )
+                    entry.pop ( 'Error', None )
+                    logging.info ( f"Extracted {path} to {result['NAV']} in {result['Elapsed (s)']:.1f}s" )
+                else:
+                    entry.update ( {'Status': 'Failed', 'Error': f'{type ( error ).__name__}: {error}'} )
+                    logging.error ( f"Extraction of {path} failed: {entry['Error']}" )
+                changed = True
+
+            if not _watch['Stop'].is_set ():
+                for priority, path, stat in scan_directories ( directories ):
+                    entry = index.get ( path )
+                    if entry and entry['Size'] == stat.st_size and entry['Mtime'] == stat.st_mtime:
+                        if entry['Status'] in FINISHED_STATUSES or path in running or entry['Status'] == 'Queued':
+                            continue
+                    state = (stat.st_size, stat.st_mtime)
+                    if observed.get ( path, (None, None, None) )[:2] != state:
+                        observed[path] = (*state, now)
+                        continue
+                    if now - observed[path][2] < settle:
+                        continue
+
+                    del observed[path]
+                    index[path] = {'Size': stat.st_size, 'Mtime': stat.st_mtime, 'Status': 'Queued', 'Priority': priority,
+                                   'Queued': timestamp (), 'Output Dir': job_output_dir ( output_root, path, index )}
+                    heapq.heappush ( queue, (priority, stat.st_mtime, path) )
+                    logging.info ( f"Queued {path}" )
+                    changed = True
+
+                while queue and len ( running ) < jobs:
+                    _, _, path = heapq.heappop ( queue )
+                    entry = index[path]
+                    entry.update ( {'Status': 'Running', 'Started': timestamp ()} )
+                    running[path] = pool.apply_async ( run_extraction_job, (path, entry['Output Dir'], options),
+                                                       callback=lambda result, path=path: job_finished ( path, result ),
+                                                       error_callback=lambda error, path=path: job_finished ( path, error=error ) )
+                    logging.info ( f"Extracting {path}" )
+                    changed = True
+
+            if changed:
+                save_watch_index ( output_root, index )
+            _watch['Wake'].wait ( interval )
+    finally:
+        # Files still queued or running stay unfinished in the index and are picked up again after a restart
+        pool.terminate ()
+        pool.join ()
+        save_watch_index ( output_root, index )
+
+    logging.info ( f"Stopped watching, {sum ( entry['Status'] == 'Done' for entry in index.values () )} file(s) done" )
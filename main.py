@@ -1,16 +1,31 @@
+import glob
 import os
-import multiprocessing
+import signal
 import time
 from absl import flags
 
-from helper.extraction import create_statistics_from_file
+import nav
+from helper.aggregation import DEFAULT_SAMPLE_SIZE, aggregate_ranks
+from helper.clustering import configure_clustering, fit_deferred_k_means
+from helper.diagnostics import prepare_query_database
+from helper.extraction import save_statistics
+from helper.execution import create_execution_context, shutdown_execution_context
 from helper.general import *
-from helper.export_statistics import generation_tables_and_figures
+from helper.instrumentation import phase, set_report_source, write_report, log_report_summary
+from helper.output import take_bytes_written
+from helper.profiling import configure_profiling, PROFILE_MODES
+from helper.staging import configure_staging, get_stage_dir, stage_database, track_staged_file, release_staged_files
+from helper.regression import REGRESSION_EXIT_CODE, REGRESSION_STATISTICS, check_regressions, report_regressions
+from helper.service import serve_nav_files
+from helper.warehouse import ingest_nav_files, report_warehouse_query
+from helper.watch import stop_watching, watch_directories
 
 # General Flags
 flags.DEFINE_string('output_dir', "output", "Name of directory to save generated NAV files and export Tables and Figures (default: ./output)", short_name='o')
 flags.DEFINE_string('multi_data_label', None, "(REQUIRED for multi-files) Labels for each database/json file provided to distinguish in statistics ex:(1 GPU, 2 GPU, 3 GPU), commas used to split names and order must be same as provided files", short_name='mdl')
-flags.DEFINE_integer('max_workers', None, "Number of threads to split work (Default to CPU count)", short_name='mw')
+flags.DEFINE_enum('profile', None, PROFILE_MODES, "profile every extraction and generation phase (cprofile: merged pstats per phase, tracemalloc: allocation snapshots, sample: wall-clock stack samples in folded format), saved to a profiles directory next to the NAV file", short_name='prof')
+flags.DEFINE_integer('max_workers', None, "Number of CPU workers for parsing, statistics, clustering and figure rendering (Default to the CPUs available to the process, honouring affinity and cgroup limits)", short_name='mw')
+flags.DEFINE_integer('io_workers', None, "Maximum number of I/O workers for queries and table writing (Default to twice the CPU workers, at most 32)", short_name='iow')
 
 # Extraction Flags
 flags.DEFINE_string('data_file', None, "Data Base file for extraction (sqlite)", short_name='df')
@@ -18,19 +33,109 @@ flags.DEFINE_string('nav_file', None, "NAV file with extracted statistics", shor
 flags.DEFINE_boolean('no_kernel_metrics', False, "export kernel metrics", short_name='nkm')
 flags.DEFINE_boolean('no_transfer_metrics', False, "export transfer metrics", short_name='ntm')
 flags.DEFINE_boolean('no_communication_metrics', False, "export communication metrics", short_name='ncm')
+flags.DEFINE_boolean('diagnose', False, "report EXPLAIN QUERY PLAN diagnostics (full scans, temp B-trees, estimated cost) for the extraction queries and exit without extracting", short_name='diag')
+flags.DEFINE_boolean('index_sidecar', False, "extract from a copy of the sqlite file in the output directory with the recommended covering indexes added", short_name='isc')
+flags.DEFINE_string('stage_dir', None, "node-local directory (e.g. NVMe scratch or /dev/shm) the sqlite file is copied to with large sequential reads before extraction", short_name='sd')
+flags.DEFINE_float('stage_cache_size', 0, "keep staged copies in the stage directory as a cache of up to this many GB (0 removes them after the run)", short_name='scs')
+flags.DEFINE_string('time_window', None, "only extract kernels, transfers and NVTX ranges inside START,END in trace nanoseconds (either bound may be left empty)", short_name='tw')
+flags.DEFINE_float('query_timeout', None, "seconds a single raw data query may run before it is interrupted and its kernel/transfer/communication skipped", short_name='qt')
+flags.DEFINE_float('total_timeout', None, "seconds all extraction queries may run before the remaining ones are cancelled and extraction fails, counted from the end of staging and sidecar indexing", short_name='tt')
+flags.DEFINE_enum('group_by', None, list(GROUP_DIMENSIONS), "also break kernels and transfers down by device, stream, context or process (NVTX ranges always by process) from the same raw data queries, nested in the NAV file", short_name='gb')
+flags.DEFINE_boolean('timeline', False, "also analyse the kernel, memcpy and memset timeline of every device (busy and idle time, compute/copy overlap, concurrency)", short_name='tl')
 flags.DEFINE_boolean('no_save_data', False, "Save metrics to NAV file", short_name='nsd')
 
+# Watch Flags
+flags.DEFINE_list('watch', None, "run as a daemon that extracts every sqlite file appearing in these comma separated directories to <output_dir>/<file name>/ (earlier directories first)", short_name='w')
+flags.DEFINE_float('watch_interval', 10, "seconds between scans of the watched directories", short_name='wi')
+flags.DEFINE_float('watch_settle', 30, "seconds a sqlite file's size and modification time must stay unchanged before it is extracted", short_name='ws')
+flags.DEFINE_integer('watch_jobs', 1, "number of files extracted concurrently, each in its own process sharing the CPU workers", short_name='wj')
+
+# Aggregation Flags
+flags.DEFINE_list('aggregate', None, "comma separated per-rank sqlite files (or glob patterns) of one MPI job to extract in parallel and merge into a single job NAV with per-rank imbalance", short_name='agg')
+flags.DEFINE_string('aggregate_label', "job", "name of the job NAV and of its directory in the output directory", short_name='agl')
+flags.DEFINE_integer('aggregate_jobs', 1, "number of rank files extracted concurrently, each in its own process sharing the CPU workers", short_name='agj')
+flags.DEFINE_integer('aggregate_sample_size', DEFAULT_SAMPLE_SIZE, "values per metric kept from each rank and in the job for medians and distributions (mean, minimum, maximum and standard deviation are exact)", short_name='ags')
+
+# Service Flags
+flags.DEFINE_string('serve', None, "serve the NAV files in this directory (and its subdirectories) as JSON over HTTP instead of extracting", short_name='srv')
+flags.DEFINE_string('serve_host', "127.0.0.1", "address the NAV service listens on", short_name='srvh')
+flags.DEFINE_integer('serve_port', 8765, "port the NAV service listens on", short_name='srvp')
+flags.DEFINE_float('serve_cache_size', 1, "GB of parsed NAV sections and answers the NAV service keeps in memory (least recently used are evicted first)", short_name='srvc')
+
+# Warehouse Flags
+flags.DEFINE_string('warehouse', None, "SQLite results store that NAV summaries are ingested into and queried across runs from", short_name='wh')
+flags.DEFINE_list('ingest', None, "comma separated NAV files or directories of NAV files to add to the warehouse (unchanged files are skipped)", short_name='ing')
+flags.DEFINE_list('warehouse_query', None, "comma separated FIELD=VALUE terms selecting a metric across the warehouse runs (category, name, metric, statistic, label, since, until, limit)", short_name='whq')
+flags.DEFINE_string('warehouse_query_output', None, "CSV file the warehouse query rows are saved to", short_name='whqo')
+
+# Regression Gate Flags
+flags.DEFINE_list('compare', None, "BASELINE,CANDIDATE NAV files to check for regressions without generating tables and figures (exits with 3 on regression)", short_name='cmp')
+flags.DEFINE_float('regression_threshold', 5.0, "percent a kernel/transfer/NVTX range duration statistic may grow before it counts as a regression", short_name='rth')
+flags.DEFINE_float('regression_coverage', 95.0, "only judge the items making up this percent of the baseline time, longest first", short_name='rcov')
+flags.DEFINE_enum('regression_statistic', 'Median', REGRESSION_STATISTICS, "duration statistic compared between baseline and candidate", short_name='rst')
+flags.DEFINE_boolean('regression_test', False, "also require Welch's t-test on the stored means and standard deviations to find the candidate slower", short_name='rtest')
+flags.DEFINE_float('regression_alpha', 0.05, "significance level of the regression test", short_name='ralpha')
+flags.DEFINE_string('regression_report', None, "JSON file the regression report is saved to", short_name='rrep')
+
 # Graphics and Table Flags
 flags.DEFINE_boolean('no_metrics_output', None, "disable metrics export after extraction", short_name='nmo')
 flags.DEFINE_boolean('no_compare_metrics_output', False, "disable comparison metrics export (multi-file only)", short_name='ncmo')
 flags.DEFINE_boolean('no_general_metrics_output', False, "disable general metrics export (Kernel, Transfer, Communication)", short_name='ngmo')
 flags.DEFINE_boolean('no_specific_metrics_output', False, "disable specific metrics export (Duration, Size, Slack, Overhead, etc)", short_name='nsmo')
 flags.DEFINE_boolean('no_individual_metrics_output', False, "disable individual metrics export (individual kernel, transfer, communication statistics)", short_name='nimo')
+flags.DEFINE_boolean('consolidated_tables', False, "write one table per category (CSV, Parquet if pyarrow is installed, and LaTeX) instead of one per individual kernel/transfer/communication directory", short_name='ct')
+flags.DEFINE_enum('output_sink', 'filesystem', ['filesystem', 'zip', 'tar', 'null'], "where tables and figures are written: output directory tree, a single zip/tar archive next to it, or discarded (benchmarking)", short_name='os')
+flags.DEFINE_integer('violin_sample_cap', VIOLIN_SAMPLE_CAP, "maximum number of values a violin plot's density is estimated from, larger sets are sampled (mean, median and extremes always use every value)", short_name='vsc')
+flags.DEFINE_boolean('force_regenerate', False, "regenerate all tables and figures even if their input data has not changed", short_name='fr')
 
 FLAGS = flags.FLAGS
 
-def run(args):
+def prepare_databases(args, database_files, database_dirs):
+    query_files = []
+
+    for file, dir in zip(database_files, database_dirs):
+        staged_file = file
+        if get_stage_dir():
+            with phase('Staging') as record:
+                staged_file, record['Bytes Written'] = stage_database(file)
+        query_file = prepare_query_database(file, dir, args.diagnose, args.index_sidecar, staged_file, get_stage_dir())
+        # Sidecars built from staged copies live in the stage directory and are cleaned up with them
+        if get_stage_dir() and query_file != staged_file:
+            track_staged_file(query_file)
+        query_files.append(query_file)
+
+    return query_files
+
+
+def handle_termination(signum, frame):
+    logging.warning(f"Received {signal.Signals(signum).name}, cancelling outstanding queries")
+    cancel_queries()
+    raise KeyboardInterrupt
+
+
+def parse_time_window(time_window):
+    if time_window is None:
+        return None
+
+    bounds = time_window.split(',')
+    if len(bounds) != 2:
+        raise app.UsageError("Time window must be given as START,END")
+    try:
+        return tuple(int(float(bound)) if bound.strip() else None for bound in bounds)
+    except ValueError:
+        raise app.UsageError(f"Time window bounds must be numbers, got {time_window}")
+
+
+def extraction_categories(args):
+    return [category for category, disabled in [('Kernel', args.no_kernel_metrics),
+                                                ('Transfer', args.no_transfer_metrics),
+                                                ('Communication', args.no_communication_metrics)] if not disabled]
+
+
+def run(args, execution):
     files, num_files, file_labels, output_data, extract_data = file_args_checking(args)
+    if output_data and args.violin_sample_cap < 1:
+        raise app.UsageError("Violin sample cap must be at least 1")
     output_dir = None
     output_dir_name = FLAGS.output_dir
 
@@ -46,44 +151,199 @@ def run(args):
         output_dir = f"./{output_dir_name}/" + files.split(".")[0] + "/"
         os.makedirs(output_dir, exist_ok=True)
 
+    if num_files > 1:
+        report_dir = f"./{output_dir_name}/"
+    else:
+        report_dir = output_dir
+    configure_profiling(args.profile, report_dir + "profiles" if args.profile else None)
+
     extracted_data = {}
+    window = parse_time_window(args.time_window)
 
     if extract_data:
-        if num_files > 1:
-            for i, file in enumerate(files):
-                extracted_data[file_labels[i]] = create_statistics_from_file(file, output_dir[i], FLAGS)
-        else:
-            extracted_data.update(create_statistics_from_file(files, output_dir, FLAGS))
+        configure_clustering(not output_data)
+        configure_staging(args.stage_dir, args.stage_cache_size)
+        configure_query_limits(args.query_timeout)
+        try:
+            database_files = files if num_files > 1 else [files]
+            database_dirs = output_dir[:-1] if num_files > 1 else [output_dir]
+            query_files = prepare_databases(args, database_files, database_dirs)
+            if args.diagnose:
+                return None
+            start_total_deadline(args.total_timeout)
+
+            categories = extraction_categories(args)
+            if num_files > 1:
+                for i, file in enumerate(files):
+                    set_report_source(file_labels[i])
+                    extracted_data[file_labels[i]] = nav.extract(file, categories, window, None if args.no_save_data else output_dir[i], query_files[i], execution, args.group_by, args.timeline)
+            else:
+                extracted_data = nav.extract(files, categories, window, None if args.no_save_data else output_dir, query_files[0], execution, args.group_by, args.timeline)
+        finally:
+            release_staged_files()
     else:
         if num_files > 1:
             for i, file in enumerate(files):
-                extracted_data[file_labels[i]] = import_from_NAV(file)
+                set_report_source(file_labels[i])
+                extracted_data[file_labels[i]] = load_nav_file(file, output_data, execution)
         else:
-            extracted_data.update(import_from_NAV(files))
+            extracted_data = load_nav_file(files, output_data, execution)
+    set_report_source(None)
 
-    if output_data and extracted_data:
+    has_statistics = any(result.statistics for result in extracted_data.values()) if num_files > 1 else extracted_data.statistics
+    if output_data and has_statistics:
         no_compare = True if num_files < 2 and not args.no_compare_metrics_output else False
-        generation_tables_and_figures(extracted_data, no_compare, args.no_general_metrics_output, args.no_specific_metrics_output, args.no_individual_metrics_output, num_files, output_dir)
+        take_bytes_written()
+        with phase('Tables and Figures') as record:
+            nav.export(extracted_data, output_dir_name, not no_compare, not args.no_general_metrics_output, not args.no_specific_metrics_output, not args.no_individual_metrics_output, args.consolidated_tables, args.output_sink, args.force_regenerate, execution, args.violin_sample_cap)
+            record['Bytes Written'] = take_bytes_written()
+
+    # Performance report sits next to the NAV file (or at the top of the output directory for multiple files)
+    if num_files > 1:
+        report_file = report_dir + "combined_perf_report.json"
+    else:
+        report_file = report_dir + os.path.basename(files).split(".")[0] + "_perf_report.json"
+    write_report(report_file)
+    log_report_summary()
+
+
+def load_nav_file(nav_file, output_data, execution):
+    with phase('NAV Load'):
+        extracted_data = nav.load(nav_file)
+
+    # NAV files extracted without tables and figures (-nmo, -w) only have the k-means points, the fits are stored
+    # the first time they are exported so that later exports do not cluster again
+    if output_data and fit_deferred_k_means(extracted_data.statistics, execution):
+        logging.info(f"Saving the k-means fits to {nav_file}")
+        try:
+            export_to_NAV(nav_file, extracted_data.statistics)
+        except OSError as e:
+            logging.warning(f"Could not save the k-means fits to {nav_file}, later exports fit them again: {e}")
+
+    return extracted_data
+
+
+def extraction_options(args):
+    # Extraction settings handed to worker processes, which do not see the parsed flags
+    return {'Categories': extraction_categories(args), 'Window': parse_time_window(args.time_window), 'Group By': args.group_by,
+            'Timeline': args.timeline, 'Index Sidecar': args.index_sidecar, 'Stage Dir': args.stage_dir, 'Stage Cache Size': args.stage_cache_size,
+            'Query Timeout': args.query_timeout, 'Total Timeout': args.total_timeout,
+            'CPU Workers': args.max_workers, 'IO Workers': args.io_workers}
+
+
+def watch(args):
+    options = extraction_options(args)
+    if args.watch_jobs < 1:
+        raise app.UsageError("Number of watch jobs must be at least 1")
+
+    signal.signal(signal.SIGINT, stop_watching)
+    signal.signal(signal.SIGTERM, stop_watching)
+    try:
+        watch_directories(args.watch, args.output_dir, options, args.watch_jobs, args.watch_interval, args.watch_settle)
+    except KeyboardInterrupt:
+        logging.error("Interrupted, running extractions were aborted and will be repeated on the next start")
+        exit(130)
+
+
+def aggregate(args):
+    database_files = []
+    for pattern in args.aggregate:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise app.UsageError(f"{pattern} does not match any file")
+        database_files.extend(match for match in matches if match not in database_files)
+    if args.aggregate_jobs < 1:
+        raise app.UsageError("Number of aggregation jobs must be at least 1")
+    if args.aggregate_sample_size < 1:
+        raise app.UsageError("Aggregation sample size must be at least 1")
+    if args.violin_sample_cap < 1:
+        raise app.UsageError("Violin sample cap must be at least 1")
+
+    output_dir = f"./{args.output_dir}/{args.aggregate_label}/"
+    os.makedirs(output_dir, exist_ok=True)
+    options = dict(extraction_options(args), **{'Sample Size': args.aggregate_sample_size})
+
+    # Job clusters are fitted from the merged items, only when they are plotted
+    configure_clustering(args.no_metrics_output)
+    execution = create_execution_context(args.max_workers, args.io_workers)
+    signal.signal(signal.SIGINT, handle_termination)
+    signal.signal(signal.SIGTERM, handle_termination)
+    try:
+        statistics = aggregate_ranks(database_files, output_dir, args.aggregate_label, options, args.aggregate_jobs, execution)
+        if not args.no_save_data:
+            save_statistics(statistics, args.aggregate_label, output_dir)
+        if not args.no_metrics_output and statistics:
+            with phase('Tables and Figures'):
+                nav.export(nav.create_extraction(args.aggregate_label, statistics, options['Window']), args.output_dir, False, not args.no_general_metrics_output, not args.no_specific_metrics_output, not args.no_individual_metrics_output, args.consolidated_tables, args.output_sink, args.force_regenerate, execution, args.violin_sample_cap)
+    except KeyboardInterrupt:
+        logging.error("Interrupted, rank extractions were aborted")
+        exit(130)
+    finally:
+        shutdown_execution_context(execution)
+
+
+def warehouse(args):
+    if not args.warehouse:
+        raise app.UsageError("Must provide the warehouse file (-wh) to ingest into or query")
+
+    try:
+        if args.ingest:
+            ingest_nav_files(args.warehouse, args.ingest)
+        if args.warehouse_query:
+            report_warehouse_query(args.warehouse, args.warehouse_query, args.warehouse_query_output)
+    except ValueError as e:
+        raise app.UsageError(str(e))
+
+
+def compare(args):
+    if len(args.compare) != 2:
+        raise app.UsageError("Must provide the baseline and candidate NAV files as BASELINE,CANDIDATE")
+
+    for nav_file in args.compare:
+        if not os.path.isfile(nav_file):
+            raise app.UsageError(f"{nav_file} does not exist")
+
+    categories = extraction_categories(args)
+    report = check_regressions(args.compare[0], args.compare[1], args.regression_threshold, args.regression_coverage, args.regression_statistic, args.regression_test, args.regression_alpha, categories)
+    report_regressions(report, args.regression_report)
+    if not report['Passed']:
+        exit(REGRESSION_EXIT_CODE)
 
 
 def main(argv):
     args = FLAGS
     logging.set_verbosity(logging.INFO)
+    if args.watch:
+        return watch(args)
+    if args.aggregate:
+        return aggregate(args)
+    if args.compare:
+        return compare(args)
+    if args.ingest or args.warehouse_query:
+        return warehouse(args)
+    if args.serve:
+        try:
+            serve_nav_files(args.serve, args.serve_host, args.serve_port, args.serve_cache_size)
+        except KeyboardInterrupt:
+            logging.info("Stopped serving NAV files")
+        return None
     if not args.data_file and not args.nav_file:
         raise app.UsageError("Must provide path to data base file or already parsed json file")
 
-    if not args.max_workers:
-        max_workers = multiprocessing.cpu_count()
-        MAX_WORKERS = max_workers
-    else:
-        MAX_WORKERS = args.max_workers
-    logging.info(f"Using {MAX_WORKERS} threads")
+    execution = create_execution_context(args.max_workers, args.io_workers)
     start_time = time.time()
+    signal.signal(signal.SIGINT, handle_termination)
+    signal.signal(signal.SIGTERM, handle_termination)
     try:
-        run(args)
+        run(args, execution)
+    except KeyboardInterrupt:
+        logging.error("Interrupted, outstanding queries were cancelled")
+        exit(130)
     except Exception as e:
         logging.exception(f"An error occurred: {e}")
         exit(1)
+    finally:
+        shutdown_execution_context(execution)
     end_time = time.time()
     execution_time = end_time - start_time
 
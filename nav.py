@@ -0,0 +1,162 @@
+"""Library interface of NAV: extract nsys statistics from Python without the command line.
+
+    import nav
+
+    result = nav.extract ( 'trace.sqlite', categories=['Kernel'], window=(0, 5 * 10 ** 9) )
+    for group in result.groups['Kernel'].values ():
+        print ( group.name, group.metrics['Execution Duration']['Mean'], group.arrays['Execution Duration'].size )
+
+Nothing is written unless requested: pass output_dir to extract (or call save) for a NAV file and call export for
+tables and figures. main.py is a thin command line wrapper over these functions.
+"""
+import os
+from typing import NamedTuple
+
+import numpy as np
+from absl import logging
+
+from helper.extraction import STATISTICS_CATEGORIES, STATISTICS_SECTIONS, extract_statistics, save_statistics
+from helper.general import GROUP_DIMENSIONS, VIOLIN_SAMPLE_CAP, import_from_NAV, reset_query_cancellation
+
+CATEGORIES = tuple ( STATISTICS_CATEGORIES )
+GROUP_BY = tuple ( GROUP_DIMENSIONS )
+CATEGORY_SECTIONS = STATISTICS_SECTIONS
+
+# One kernel, transfer type or communication range: scalar fields (time total, instances, ...), per-metric statistics
+# (mean, median, distribution, ...) and the raw values of each metric as float64 arrays
+Group = NamedTuple ( 'Group', [('category', str), ('key', object), ('name', str), ('summary', dict),
+                               ('metrics', dict), ('arrays', dict)] )
+
+# statistics is the NAV dictionary that save and export write out, groups maps each category to its groups by key
+Extraction = NamedTuple ( 'Extraction', [('source', str), ('categories', tuple), ('window', object),
+                                         ('total_duration', object), ('groups', dict), ('statistics', dict)] )
+
+
+def as_array(values):
+    return values if isinstance ( values, np.ndarray ) else np.asarray ( values, dtype=float )
+
+
+def create_group(category, key, item):
+    summary = {}
+    metrics = {}
+    arrays = {}
+
+    for field, value in item.items ():
+        if isinstance ( value, dict ):
+            raw_data = value.get ( 'Raw Data' )
+            # Bandwidth raw data holds a Size and a Bandwidth column
+            if isinstance ( raw_data, dict ):
+                arrays.update ( {column: as_array ( values ) for column, values in raw_data.items ()} )
+            elif raw_data is not None:
+                arrays[field] = as_array ( raw_data )
+            metrics[field] = {name: stat for name, stat in value.items () if name != 'Raw Data'}
+        elif value is None:
+            metrics[field] = None
+        else:
+            summary[field] = value
+
+    return Group ( category, key, str ( item.get ( 'Name', key ) ), summary, metrics, arrays )
+
+
+def create_extraction(source, statistics, window=None):
+    groups = {}
+    for category, (section, individual) in CATEGORY_SECTIONS.items ():
+        if isinstance ( statistics.get ( section ), dict ):
+            items = statistics[section].get ( individual ) or {}
+            groups[category] = {key: create_group ( category, key, item ) for key, item in items.items ()}
+
+    return Extraction ( source, tuple ( groups ), window, statistics.get ( 'Total Duration' ), groups, statistics )
+
+
+def extract(path, categories=CATEGORIES, window=None, output_dir=None, query_file=None, execution=None, group_by=None,
+            timeline=False):
+    """Extracts kernel, transfer and communication statistics from the nsys sqlite export at path.
+
+    categories selects any of CATEGORIES. window is a (start, end) pair of trace nanoseconds (either may be None)
+    that limits kernels, transfers and NVTX ranges to those inside it. The NAV file is only written when output_dir is
+    given. query_file is an indexed or staged copy of path to run the queries against, execution an execution context
+    from helper.execution. group_by (one of GROUP_BY) adds a per device, stream, context or process breakdown to every
+    section of statistics, computed from the same raw data queries. timeline adds the busy/idle time, compute/copy
+    overlap and concurrency of every device to statistics['Timeline Statistics']."""
+    unknown = [category for category in categories if category not in CATEGORIES]
+    if unknown:
+        raise ValueError ( f"Unknown categories {unknown}, expected some of {list ( CATEGORIES )}" )
+    if window is not None and len ( window ) != 2:
+        raise ValueError ( f"window must be a (start, end) pair, got {window}" )
+    if group_by is not None and group_by not in GROUP_BY:
+        raise ValueError ( f"Unknown grouping {group_by}, expected one of {list ( GROUP_BY )}" )
+
+    logging.info ( f"Starting extraction and creation of statistics from {path}" )
+    # The query limits are process wide, an earlier extract that failed must not cancel this one
+    reset_query_cancellation ()
+    statistics = extract_statistics ( query_file or path, categories, execution, window, group_by, timeline )
+    if output_dir is not None and statistics:
+        save_statistics ( statistics, path, output_dir )
+
+    return create_extraction ( path, statistics, window )
+
+
+def load(nav_file):
+    """Loads a NAV file written by extract or the command line."""
+    return create_extraction ( nav_file, import_from_NAV ( nav_file ) )
+
+
+def save(result, output_dir):
+    """Writes result to <output_dir><source name>_parsed_stats.nav and returns the file name."""
+    return save_statistics ( result.statistics, result.source, output_dir )
+
+
+def to_table(result, category, metric):
+    """Raw values of metric (or of a raw column such as Bandwidth) for every group of category, as a long table with
+    a Name and a Value column.
+
+    Returns a pyarrow Table if pyarrow is installed, a pandas DataFrame if pandas is, and otherwise a dictionary of
+    NumPy arrays."""
+    selected = [(group.name, group.arrays[metric]) for group in result.groups.get ( category, {} ).values ()
+                if metric in group.arrays]
+    names = [name for name, _ in selected]
+    codes = np.repeat ( np.arange ( len ( selected ), dtype=np.int32 ), [len ( values ) for _, values in selected] )
+    values = np.concatenate ( [values for _, values in selected] ) if selected else np.empty ( 0 )
+
+    try:
+        import pyarrow as pa
+        # Dictionary encoding stores each name once, the value column wraps the NumPy buffer
+        return pa.table ( {'Name': pa.DictionaryArray.from_arrays ( pa.array ( codes ), pa.array ( names, pa.string () ) ),
+                           'Value': pa.array ( values )} )
+    except ImportError:
+        pass
+
+    name_column = np.asarray ( names, dtype=object )[codes]
+    try:
+        import pandas as pd
+        return pd.DataFrame ( {'Name': pd.Categorical ( name_column ), 'Value': values} )
+    except ImportError:
+        return {'Name': name_column, 'Value': values}
+
+
+def export(results, output_dir='output', compare=True, general=True, specific=True, individual=True,
+           consolidated_tables=False, output_sink='filesystem', force_regenerate=False, execution=None,
+           violin_sample_cap=VIOLIN_SAMPLE_CAP):
+    """Writes tables and figures for one Extraction to <output_dir>/<source name>/, or for a {label: Extraction}
+    dictionary to <output_dir>/<label>/ with comparisons in <output_dir>/Combined Statistics/."""
+    # Plotting stack (matplotlib, scikit-learn) is only loaded when tables and figures are generated
+    from helper.export_statistics import generation_tables_and_figures
+
+    if isinstance ( results, dict ):
+        num_files = len ( results )
+        data = {label: result.statistics for label, result in results.items ()}
+        output_dirs = [f"./{output_dir}/{label}/" for label in results] + [output_dir]
+        directories = output_dirs[:-1]
+    else:
+        num_files = 1
+        data = results.statistics
+        output_dirs = f"./{output_dir}/" + results.source.split ( "." )[0] + "/"
+        directories = [output_dirs]
+
+    if output_sink == 'filesystem':
+        for directory in directories:
+            os.makedirs ( directory, exist_ok=True )
+
+    generation_tables_and_figures ( data, not compare, not general, not specific, not individual, num_files,
+                                    output_dirs, force_regenerate, consolidated_tables, output_sink, execution,
+                                    violin_sample_cap )